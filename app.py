@@ -1,5 +1,8 @@
 # app.py
 import streamlit as st
+import pandas as pd
+from resilient_fetch import get_fetch_metrics
+from data_api import start_data_api, stop_data_api, data_api_address, DATASETS # 本地只读数据接口 (Arrow / Parquet)
 
 st.set_page_config(
     page_title="资金流向分析平台",
@@ -25,4 +28,37 @@ st.markdown(
     """
 )
 
-# 你可以在这里添加一些全局的说明或者平台介绍
\ No newline at end of file
+# 你可以在这里添加一些全局的说明或者平台介绍
+
+# --- 上游接口健康状态 (重试/合并/熔断统计，进程内所有会话共享) ---
+with st.expander("🩺 数据接口健康状态", expanded=False):
+    fetch_metrics = get_fetch_metrics()
+    if fetch_metrics:
+        df_metrics = pd.DataFrame.from_dict(fetch_metrics, orient="index")
+        df_metrics = df_metrics.rename(columns={
+            "requests": "请求数", "upstream_calls": "上游调用", "coalesced": "合并请求",
+            "retries": "重试次数", "successes": "成功", "failures": "失败",
+            "stale_served": "返回旧数据", "short_circuited": "熔断拦截", "breaker_trips": "熔断次数",
+            "breaker_state": "熔断器状态", "consecutive_failures": "连续失败",
+        })
+        st.dataframe(df_metrics, use_container_width=True)
+        st.caption("熔断器状态: closed=正常, open=熔断中(直接返回旧数据), half_open=试探恢复中。")
+    else:
+        st.info("本进程尚未发起任何数据请求。")
+
+# --- 本地数据接口 (供研究笔记本和其它服务读取本应用已缓存的数据，进程内所有会话共享) ---
+with st.expander("🔌 本地数据接口 (Arrow / Parquet)", expanded=False):
+    enable_data_api = st.toggle("启用本地数据接口", value=data_api_address() is not None, key="data_api_toggle",
+                                help="在本机端口上提供日K线、技术指标、极值点和板块资金流数据，与页面共用同一份缓存。")
+    if enable_data_api:
+        api_address, api_error = start_data_api()
+        if api_error:
+            st.error(api_error)
+        else:
+            st.success(f"数据接口运行中: {api_address}")
+            st.caption("数据集: " + "；".join(f"`{name}` {description}" for name, (_, _, description) in DATASETS.items()))
+            st.code(f'import pyarrow as pa, urllib.request\n'
+                    f'df = pa.ipc.open_stream(urllib.request.urlopen("{api_address}bars?codes=510300").read()).read_pandas()',
+                    language="python")
+    elif data_api_address() is not None:
+        stop_data_api()
@@ -0,0 +1,117 @@
+# atr_backtest.py
+# ATR 移动止损 (做多) 的向量化回测:
+# 每个交易日都视为一次以收盘价买入的样本，止损价 = 收盘价 - ATR倍数 * ATR，并随收盘价上移 (只升不降)。
+# 次日起最低价触及止损价即止损离场；持有满 horizon 个交易日仍未触发则按收盘价离场。
+# 同一 ATR 周期下所有ETF、所有买入日、整段持有期一次性用数组计算，参数网格只在 (周期, 倍数) 上循环。
+import numpy as np
+import pandas as pd
+from numpy.lib.stride_tricks import sliding_window_view
+
+from indicators import true_range, wilder_atr # 与页面、扫描共用的 TR / RMA 实现
+
+
+def build_price_panel(frames):
+    """
+    把 {ETF代码: 日K DataFrame (Open/High/Low/Close)} 对齐为 日期 x ETF 的二维数组。
+    返回 dict: dates, codes, open, high, low, close (缺失处为 NaN)。
+    """
+    frames = {code: df for code, df in frames.items() if df is not None and not df.empty}
+    if not frames:
+        return None
+    codes = list(frames.keys())
+    panel = {"codes": codes}
+    for col in ['Open', 'High', 'Low', 'Close']:
+        wide = pd.concat({code: frames[code][col] for code in codes}, axis=1).sort_index()
+        panel[col.lower()] = wide.to_numpy(dtype=float)
+        panel["dates"] = wide.index
+    return panel
+
+
+def _stats_for_multiplier(entry, close_w, low_w, open_w, atr_w, running_min_low, multiplier, horizon):
+    """
+    单个 ATR 倍数下所有 (买入日, ETF) 样本的止损结果。
+    输入窗口数组形状为 [horizon+1, 样本日, ETF] (持有天数在第一维，沿该维累计时是整行向量运算)，
+    返回的各数组形状为 [样本日, ETF]。
+    """
+    # 第 k 天 (k=1..horizon) 生效的止损价是前一天收盘后的移动止损价 (原地计算，减少大数组的分配)
+    trail = np.multiply(atr_w[:horizon], np.float32(-multiplier))
+    trail += close_w[:horizon]
+    np.maximum.accumulate(trail, axis=0, out=trail)
+    hit = low_w[1:] <= trail
+    first_hit = hit.argmax(axis=0)
+    any_hit = np.take_along_axis(hit, first_hit[None], axis=0)[0]
+    holding = np.where(any_hit, first_hit + 1, horizon)
+
+    # 持有期内的最大不利波动 (买入价到最低价的回撤)，持有期最低价直接从累计最低价中按离场日取出
+    min_low = np.take_along_axis(running_min_low, (holding - 1)[None], axis=0)[0]
+    drawdown = np.clip((entry - min_low) / entry, 0, None)
+
+    # 离场价: 触发止损时按止损价成交 (跳空低开则按开盘价)，否则按持有期末收盘价
+    hit_stop = np.take_along_axis(trail, first_hit[None], axis=0)[0]
+    hit_open = np.take_along_axis(open_w[1:], first_hit[None], axis=0)[0]
+    exit_price = np.where(any_hit, np.minimum(hit_stop, hit_open), close_w[horizon])
+    trade_return = exit_price / entry - 1
+    return any_hit, drawdown, holding, trade_return
+
+
+def _windows(values, horizon):
+    """[日期, ETF] -> [horizon+1, 样本日, ETF] 的连续 float32 数组，第 k 行为买入后第 k 天的数据。"""
+    return np.ascontiguousarray(np.moveaxis(sliding_window_view(values, horizon + 1, axis=0), -1, 0), dtype=np.float32)
+
+
+def backtest_atr_stop_grid(panel, periods, multipliers, horizon=60):
+    """
+    在 (ATR周期 x ATR倍数) 网格上回测所有ETF，返回每个 (周期, 倍数, ETF) 的统计 DataFrame:
+    样本数、止损触发率、平均回撤(%)、平均持有天数、平均收益(%)。
+    """
+    close, low, open_ = panel["close"], panel["low"], panel["open"]
+    n_dates, n_codes = close.shape
+    if n_dates <= horizon + 1:
+        return pd.DataFrame()
+
+    tr = true_range(panel["high"], low, close)
+    close_w = _windows(close, horizon)
+    low_w = _windows(low, horizon)
+    open_w = _windows(open_, horizon)
+    entry = close_w[0]
+    prices_ok = np.isfinite(close_w).all(0) & np.isfinite(low_w).all(0) & np.isfinite(open_w).all(0)
+    # 买入后第 1..k 天的累计最低价，与周期和倍数无关，只算一次
+    running_min_low = np.minimum.accumulate(low_w[1:], axis=0)
+
+    records = []
+    for period in periods:
+        atr_w = _windows(wilder_atr(tr, period), horizon)
+        valid = prices_ok & np.isfinite(atr_w).all(0) & (atr_w[0] > 0)
+        samples = valid.sum(axis=0)
+        for multiplier in multipliers:
+            any_hit, drawdown, holding, trade_return = _stats_for_multiplier(
+                entry, close_w, low_w, open_w, atr_w, running_min_low, multiplier, horizon)
+            with np.errstate(invalid='ignore', divide='ignore'):
+                hit_rate = np.where(valid, any_hit, 0).sum(0) / samples
+                avg_drawdown = np.where(valid, drawdown, 0).sum(0) / samples
+                avg_holding = np.where(valid, holding, 0).sum(0) / samples
+                avg_return = np.where(valid, trade_return, 0).sum(0) / samples
+            records.append(pd.DataFrame({
+                "ATR周期": period,
+                "ATR倍数": multiplier,
+                "ETF代码": panel["codes"],
+                "样本数": samples,
+                "止损触发率": hit_rate,
+                "平均回撤(%)": avg_drawdown * 100,
+                "平均持有天数": avg_holding,
+                "平均收益(%)": avg_return * 100,
+            }))
+    return pd.concat(records, ignore_index=True)
+
+
+def summarize_grid(df_results):
+    """按 (ATR周期, ATR倍数) 汇总所有ETF，以样本数加权平均。"""
+    if df_results.empty:
+        return df_results
+    metrics = ["止损触发率", "平均回撤(%)", "平均持有天数", "平均收益(%)"]
+    df = df_results[df_results["样本数"] > 0].copy()
+    weighted = df[metrics].mul(df["样本数"], axis=0)
+    weighted[["ATR周期", "ATR倍数", "样本数"]] = df[["ATR周期", "ATR倍数", "样本数"]]
+    summary = weighted.groupby(["ATR周期", "ATR倍数"]).sum()
+    summary[metrics] = summary[metrics].div(summary["样本数"], axis=0)
+    return summary.reset_index()
@@ -0,0 +1,296 @@
+# data_api.py
+# 本地只读数据接口: 把本应用已清洗、已缓存的数据以 Arrow / Parquet 提供给研究笔记本和其它服务，
+# 它们不需要再各自向 akshare 重复请求。
+# - 日K线和技术指标读自 etf_bars.bar_store (本地不复权K线 + 复权因子，已是最新时不请求上游)
+# - 极值点与页面3/4使用同一份日K缓存和同一套多级别极值点计算
+# - 板块资金流直接读取 sector_flow_panel 的面板文件 (由页面6或 sector_flow_panel.py 更新)
+#
+# GET 接口，通用参数: start/end 日期范围 (YYYYMMDD 或 YYYY-MM-DD)，columns 列投影 (逗号分隔)，
+# format=arrow (默认，Arrow IPC stream) 或 parquet。部分ETF无数据时跳过，原因放在响应头 X-Skipped (JSON)。
+#   /                                                   数据集列表和参数 (JSON)
+#   /bars?codes=510300,512480&adjust=qfq                日K线 (qfq/hfq/空字符串为不复权)
+#   /indicators?codes=510300&specs=MA20,RSI14,MACD      日K线 + 技术指标 (指标写法见 indicators.py)
+#   /extrema?codes=510300&years=2&peak_distance=10      多级别局部高低点
+#   /fund_flow?type=行业资金流&columns=半导体,银行       板块每日主力净流入面板 (亿元，列为板块)
+#
+# 在应用首页打开开关后随 streamlit 进程在后台线程中运行，与页面共用内存中的数据；也可以单独运行:
+#   python data_api.py --port 8766
+# 读取示例:
+#   import pyarrow as pa, urllib.request
+#   df = pa.ipc.open_stream(urllib.request.urlopen("http://127.0.0.1:8766/bars?codes=510300").read()).read_pandas()
+import argparse
+import json
+import threading
+from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from etf_analysis import fetch_etf_daily_history_cached, find_extremes_pyramid, pyramid_scales
+from etf_bars import ADJUST_MODES, PRICE_COLS, bar_store, history_start
+from indicators import add_indicators, parse_indicator
+from sector_flow_panel import SECTOR_TYPES, load_panel
+
+API_HOST = "127.0.0.1"
+API_PORT = 8766 # 8765 为 proximity_monitor 的本地 webhook 接收端
+MAX_CODES = 500 # 单次请求最多的ETF数
+KEY_COLUMNS = ("ETF代码", "日期") # 列投影时总是保留的键列
+RECURSIVE_WARMUP = 10 # EMA/RSI/ATR/MACD 等递推指标在起始日期前多取的K线数 (周期的倍数)，初值的影响衰减到万分之一以下
+CONTENT_TYPES = {"arrow": "application/vnd.apache.arrow.stream", "parquet": "application/vnd.apache.parquet"}
+
+
+# --- 参数解析 ---
+def _split(value):
+    return [item.strip() for item in (value or "").split(",") if item.strip()]
+
+
+def _parse_date(value, default):
+    """'YYYYMMDD' 或 'YYYY-MM-DD' -> Timestamp，为空时返回 default。"""
+    if not value:
+        return pd.Timestamp(default).normalize()
+    try:
+        return pd.Timestamp(value).normalize()
+    except ValueError:
+        raise ValueError(f"无法识别的日期: {value}")
+
+
+def _parse_codes(value):
+    codes = list(dict.fromkeys(_split(value)))
+    if not codes:
+        raise ValueError("缺少 codes 参数")
+    if len(codes) > MAX_CODES:
+        raise ValueError(f"单次最多请求 {MAX_CODES} 个ETF ({len(codes)})")
+    return codes
+
+
+def _long_table(frames):
+    """{代码: 以日期为索引的 DataFrame} -> 长表 (ETF代码, 日期, ...)。"""
+    df = pd.concat(frames, names=["ETF代码", "日期"]).reset_index()
+    df["ETF代码"] = df["ETF代码"].astype("category")
+    return df
+
+
+# --- 数据集 (可直接在进程内调用) ---
+def read_bars(codes, start=None, end=None, adjust="qfq"):
+    """多个ETF的日K线长表 (ETF代码, 日期, Open/High/Low/Close/Volume)。返回 (DataFrame, 跳过的ETF {代码: 原因})。"""
+    if adjust not in ADJUST_MODES:
+        raise ValueError(f"adjust 只能是 {list(ADJUST_MODES)}")
+    start = _parse_date(start, history_start(1))
+    end = _parse_date(end, datetime.now())
+    frames, skipped = {}, {}
+    for code in codes:
+        df, error = bar_store.get_bars(code, start.strftime('%Y%m%d'), end.strftime('%Y%m%d'), adjust)
+        if error or df.empty:
+            skipped[code] = error or "无行情数据"
+        else:
+            frames[code] = df[PRICE_COLS + ['Volume']]
+    return (_long_table(frames) if frames else pd.DataFrame()), skipped
+
+
+def read_indicators(codes, specs, start=None, end=None, adjust="qfq"):
+    """
+    日K线加技术指标的长表。指标在 start 之前多取一段历史计算: 均线/布林带取一个窗口，递推指标取 RECURSIVE_WARMUP 倍周期，
+    start 当天起的数值与在完整历史上计算的结果一致 (递推指标差异可以忽略)。返回 (DataFrame, 跳过的ETF)。
+    """
+    if not specs:
+        raise ValueError("缺少 specs 参数，如 MA20,RSI14,MACD")
+    warmup_bars = 0
+    for spec in specs:
+        kind, params = parse_indicator(spec) # 无法识别的指标抛出 ValueError
+        warmup_bars = max(warmup_bars, params[0] if kind in ("MA", "BOLL") else RECURSIVE_WARMUP * sum(params))
+    start = _parse_date(start, history_start(1))
+    # 每年约 240 个交易日，K线数 * 1.5 + 30 个自然日足以覆盖 (含长假)
+    warmup_start = start - timedelta(days=int(warmup_bars * 1.5) + 30)
+    df_bars, skipped = read_bars(codes, warmup_start, end, adjust)
+    if df_bars.empty:
+        return df_bars, skipped
+    frames = {}
+    for code, group in df_bars.groupby("ETF代码", observed=True, sort=False):
+        df = add_indicators(group.drop(columns="ETF代码").set_index("日期"), specs)
+        frames[code] = df.loc[start:]
+    return _long_table(frames), skipped
+
+
+def read_extrema(codes, years=2, peak_distance=10, prominence_factor=0.5, min_level=0, start=None, end=None):
+    """
+    多级别局部高低点长表 (ETF代码, 日期, 价格, 类型, 级别, 极值级别, 突起高度)，参数含义与页面4相同，
+    只返回级别不低于 min_level 且日期在 [start, end] 内的极值点。返回 (DataFrame, 跳过的ETF)。
+    """
+    frames, skipped = [], {}
+    for code in codes:
+        df, error = fetch_etf_daily_history_cached(code, years)
+        if error or df.empty:
+            skipped[code] = error or "无行情数据"
+            continue
+        close = df['Close']
+        price_std = close.std()
+        base_prominence = price_std * prominence_factor if price_std > 0.00001 else 0.01
+        extremes = find_extremes_pyramid(close, pyramid_scales(peak_distance, base_prominence))
+        extremes = extremes[extremes['级别'] >= min_level]
+        if start or end:
+            extremes = extremes[extremes['日期'].between(_parse_date(start, extremes['日期'].min()),
+                                                        _parse_date(end, extremes['日期'].max()))]
+        frames.append(extremes.assign(ETF代码=code))
+    if not frames:
+        return pd.DataFrame(), skipped
+    df = pd.concat(frames, ignore_index=True)
+    df = df[["ETF代码"] + [col for col in df.columns if col != "ETF代码"]]
+    df["ETF代码"] = df["ETF代码"].astype("category")
+    return df, skipped
+
+
+def read_fund_flow(sector_type="行业资金流", start=None, end=None):
+    """板块每日主力净流入面板 (日期 + 每个板块一列，亿元)。面板尚未构建时返回错误信息。"""
+    if sector_type not in SECTOR_TYPES:
+        raise ValueError(f"type 只能是 {list(SECTOR_TYPES)}")
+    panel = load_panel(sector_type)
+    if panel.empty:
+        return panel, {sector_type: "面板尚未构建，请先在页面6更新或运行 sector_flow_panel.py"}
+    panel = panel.loc[_parse_date(start, panel.index.min()):_parse_date(end, panel.index.max())]
+    return panel.rename_axis("日期").reset_index(), {}
+
+
+# 数据集: (读取函数, 由请求参数得到读取函数参数, 说明)
+DATASETS = {
+    "bars": (read_bars, lambda q: dict(codes=_parse_codes(q.get("codes")), start=q.get("start"), end=q.get("end"),
+                                       adjust=q.get("adjust", "qfq")),
+             "日K线，参数 codes, start, end, adjust (qfq/hfq/空字符串)"),
+    "indicators": (read_indicators, lambda q: dict(codes=_parse_codes(q.get("codes")), specs=_split(q.get("specs")),
+                                                   start=q.get("start"), end=q.get("end"),
+                                                   adjust=q.get("adjust", "qfq")),
+                   "日K线 + 技术指标，参数 codes, specs (如 MA20,EMA12,RSI14,ATR14,BOLL20,MACD), start, end, adjust"),
+    "extrema": (read_extrema, lambda q: dict(codes=_parse_codes(q.get("codes")), years=int(q.get("years", 2)),
+                                             peak_distance=int(q.get("peak_distance", 10)),
+                                             prominence_factor=float(q.get("prominence_factor", 0.5)),
+                                             min_level=int(q.get("min_level", 0)),
+                                             start=q.get("start"), end=q.get("end")),
+                "多级别局部高低点，参数 codes, years, peak_distance, prominence_factor, min_level, start, end"),
+    "fund_flow": (read_fund_flow, lambda q: dict(sector_type=q.get("type", "行业资金流"),
+                                                 start=q.get("start"), end=q.get("end")),
+                  f"板块每日主力净流入 (亿元)，参数 type ({'/'.join(SECTOR_TYPES)}), start, end；columns 选择板块"),
+}
+
+
+def project_columns(df, columns):
+    """只保留 columns 中的列 (键列总是保留)，不存在的列抛出 ValueError。"""
+    if not columns or df.empty:
+        return df
+    missing = [col for col in columns if col not in df.columns]
+    if missing:
+        raise ValueError(f"不存在的列: {missing}，可选: {[col for col in df.columns if col not in KEY_COLUMNS]}")
+    keys = [col for col in df.columns if col in KEY_COLUMNS]
+    return df[keys + [col for col in columns if col not in keys]]
+
+
+def encode_table(df, fmt="arrow"):
+    """DataFrame -> Arrow IPC stream 或 Parquet 字节。"""
+    if fmt not in CONTENT_TYPES:
+        raise ValueError(f"format 只能是 {list(CONTENT_TYPES)}")
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    sink = pa.BufferOutputStream()
+    if fmt == "parquet":
+        pq.write_table(table, sink)
+    else:
+        with pa.ipc.new_stream(sink, table.schema) as writer:
+            writer.write_table(table)
+    return sink.getvalue().to_pybytes()
+
+
+# --- HTTP 服务 ---
+class _Handler(BaseHTTPRequestHandler):
+    def _send(self, status, body, content_type, headers=None):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_json(self, status, payload):
+        self._send(status, json.dumps(payload, ensure_ascii=False).encode("utf-8"), "application/json; charset=utf-8")
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        query = {name: values[-1] for name, values in parse_qs(url.query, keep_blank_values=True).items()}
+        name = url.path.strip("/")
+        if not name:
+            self._send_json(200, {key: description for key, (_, _, description) in DATASETS.items()})
+            return
+        if name not in DATASETS:
+            self._send_json(404, {"error": f"未知数据集: {name}，可选: {list(DATASETS)}"})
+            return
+        reader, parse_args, _ = DATASETS[name]
+        try:
+            df, skipped = reader(**parse_args(query))
+            if df.empty:
+                self._send_json(404, {"error": "没有可返回的数据", "skipped": skipped})
+                return
+            df = project_columns(df, _split(query.get("columns")))
+            fmt = query.get("format", "arrow")
+            body = encode_table(df, fmt)
+        except ValueError as e:
+            self._send_json(400, {"error": str(e)})
+            return
+        except Exception as e:
+            self._send_json(500, {"error": f"{type(e).__name__}: {e}"})
+            return
+        # 响应头只能是 ASCII，跳过原因用 \uXXXX 转义的 JSON
+        self._send(200, body, CONTENT_TYPES[fmt], {"X-Rows": str(len(df)), "X-Skipped": json.dumps(skipped)})
+
+    def log_message(self, *args):
+        pass
+
+
+# --- 进程内后台服务 (供页面使用) ---
+_server = {"server": None, "thread": None}
+_server_lock = threading.Lock()
+
+
+def start_data_api(host=API_HOST, port=API_PORT):
+    """在当前进程的后台线程启动 (或复用) 数据接口。返回 (地址, 错误信息)。"""
+    with _server_lock:
+        if _server["server"] is None:
+            try:
+                server = ThreadingHTTPServer((host, port), _Handler)
+            except OSError as e:
+                return None, f"数据接口启动失败 ({host}:{port}): {e}"
+            thread = threading.Thread(target=server.serve_forever, name="data-api", daemon=True)
+            thread.start()
+            _server.update(server=server, thread=thread)
+        host, port = _server["server"].server_address[:2]
+        return f"http://{host}:{port}/", None
+
+
+def stop_data_api():
+    with _server_lock:
+        if _server["server"] is not None:
+            _server["server"].shutdown()
+            _server["server"].server_close()
+        _server.update(server=None, thread=None)
+
+
+def data_api_address():
+    """后台数据接口的地址，未启动时返回 None。"""
+    server = _server["server"]
+    return f"http://{server.server_address[0]}:{server.server_address[1]}/" if server else None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="本地只读数据接口 (Arrow / Parquet)")
+    parser.add_argument("--host", default=API_HOST)
+    parser.add_argument("--port", type=int, default=API_PORT)
+    args = parser.parse_args()
+    server = ThreadingHTTPServer((args.host, args.port), _Handler)
+    print(f"数据接口: http://{args.host}:{args.port}/ (数据集: {', '.join(DATASETS)})。按 Ctrl+C 退出。")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,223 @@
+# etf_analysis.py
+# ETF 行情获取、ATR 与局部极值点计算的公共函数。行情来自 etf_bars 的本地K线存储 (不复权K线 + 复权因子)。
+# 不依赖 streamlit，页面和后台监控进程 (proximity_monitor.py) 共用同一套计算逻辑。
+import threading
+from collections import OrderedDict
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+from scipy.signal import find_peaks, peak_prominences
+
+from etf_bars import bar_store, history_start
+from figure_cache import data_fingerprint
+from indicators import atr
+from swr_cache import swr_cache
+
+
+def fetch_etf_daily_history(etf_code, years_of_history, adjust="qfq"):
+    """获取ETF近 years_of_history 年的日K线 (默认前复权)，返回 (DataFrame, 错误信息)，列名为 Open/High/Low/Close/Volume。"""
+    start_str = history_start(years_of_history)
+    end_str = datetime.now().strftime('%Y%m%d')
+    try:
+        df, error = bar_store.get_bars(etf_code, start_str, end_str, adjust)
+        if error:
+            return pd.DataFrame(), error
+        if len(df) < 2:
+            return pd.DataFrame(), f"数据不足 for {etf_code}"
+        return df, None
+    except Exception as e:
+        return pd.DataFrame(), f"获取 {etf_code} 数据出错: {e}"
+
+
+# 页面共用的缓存版本 (1天后后台刷新，超过7天才同步重新获取)，多个页面分析同一批ETF时只请求一次上游
+fetch_etf_daily_history_cached = swr_cache(soft_ttl=86400, hard_ttl=7*86400)(fetch_etf_daily_history)
+
+
+def compute_atr(df, atr_period):
+    """计算ATR序列，数据点不足时返回全 NaN 序列。"""
+    if len(df) <= atr_period:
+        return pd.Series(np.nan, index=df.index)
+    return atr(df, atr_period)
+
+
+# --- 多级别极值点 ---
+# 级别名称与相对基准参数的倍数 (峰间距倍数, 突起高度倍数)。基准为页面上的峰间距和突起高度，
+# 默认基准 (10天, 0.5倍标准差) 对应 5/10/20/60 天四个级别，“波段”级别与原来的单一参数结果一致。
+EXTREMUM_LEVELS = ("短线", "波段", "中期", "长期")
+EXTREMUM_PYRAMID = ((0.5, 0.5), (1, 1.0), (2, 1.5), (6, 2.0))
+
+_pyramid_cache = OrderedDict()
+_pyramid_cache_lock = threading.Lock()
+
+
+def pyramid_scales(base_distance, base_prominence):
+    """由基准峰间距和突起高度 (价格单位) 生成各级别的 (峰间距, 突起高度)。"""
+    return tuple((max(1, int(round(base_distance * d))), float(base_prominence) * p) for d, p in EXTREMUM_PYRAMID)
+
+
+def _select_by_distance(peaks, heights, distance):
+    """与 find_peaks 的 distance 规则一致: 从最高的峰开始保留，删除与其间隔小于 distance 的较低的峰。"""
+    keep = np.ones(len(peaks), dtype=bool)
+    for i in np.argsort(heights)[::-1]:
+        if not keep[i]:
+            continue
+        lo = np.searchsorted(peaks, peaks[i] - distance + 1)
+        hi = np.searchsorted(peaks, peaks[i] + distance)
+        keep[lo:hi] = False
+        keep[i] = True
+    return keep
+
+
+def _pyramid_one_side(values, scales):
+    """对一侧 (波峰) 计算各级别是否保留，返回 (位置, 突起高度, 最大保留级别序号，-1 表示任何级别都不保留)。"""
+    candidates, _ = find_peaks(values)
+    if len(candidates) == 0:
+        return candidates, np.array([]), np.array([], dtype=int)
+    # 突起高度只取决于原序列，所有级别共用一次计算；各级别只需按峰间距筛选再比较突起高度
+    prominences = peak_prominences(values, candidates)[0]
+    level = np.full(len(candidates), -1)
+    for i, (distance, min_prominence) in enumerate(scales):
+        survives = _select_by_distance(candidates, values[candidates], distance) & (prominences >= min_prominence)
+        level[survives] = i
+    return candidates, prominences, level
+
+
+def find_extremes_pyramid(close_series, scales):
+    """
+    一次计算多个级别的局部高点和低点。scales 为 [(峰间距, 突起高度), ...]，从小到大排列 (见 pyramid_scales)。
+    返回 DataFrame: 日期/价格/类型(高点、低点)/级别(序号)/极值级别(名称)/突起高度，每个极值点标注其能保留的最大级别。
+    结果按 (数据指纹, 级别参数) 缓存，页面3的标记和页面4的靠近判断共用同一次计算。
+    """
+    columns = ['日期', '价格', '类型', '级别', '极值级别', '突起高度']
+    if close_series.empty:
+        return pd.DataFrame(columns=columns)
+    key = (data_fingerprint(close_series), tuple(scales))
+    with _pyramid_cache_lock:
+        cached = _pyramid_cache.get(key)
+        if cached is not None:
+            _pyramid_cache.move_to_end(key)
+            return cached.copy()
+
+    values = close_series.to_numpy(dtype=float)
+    frames = []
+    for kind, signal in (("高点", values), ("低点", -values)):
+        locs, prominences, level = _pyramid_one_side(signal, scales)
+        kept = level >= 0
+        frames.append(pd.DataFrame({
+            '日期': close_series.index[locs[kept]],
+            '价格': values[locs[kept]],
+            '类型': kind,
+            '级别': level[kept],
+            '极值级别': [EXTREMUM_LEVELS[i] if i < len(EXTREMUM_LEVELS) else f"L{i}" for i in level[kept]],
+            '突起高度': prominences[kept],
+        }))
+    result = pd.concat(frames, ignore_index=True).sort_values('日期', ignore_index=True)
+
+    with _pyramid_cache_lock:
+        _pyramid_cache[key] = result
+        while len(_pyramid_cache) > 256:
+            _pyramid_cache.popitem(last=False)
+    return result.copy()
+
+
+def find_scan_extremes(close_series, peak_distance, prominence_factor, min_level=1):
+    """
+    页面4扫描与实时监控共用的极值点: 以收盘价标准差的 prominence_factor 倍为基准突起高度计算多级别极值点，
+    只保留级别不低于 min_level 的部分。返回 find_extremes_pyramid 结构的 DataFrame。
+    """
+    price_std = close_series.std()
+    base_prominence = price_std * prominence_factor if price_std > 0.00001 else 0.01
+    extremes = find_extremes_pyramid(close_series, pyramid_scales(peak_distance, base_prominence))
+    return extremes[extremes['级别'] >= min_level]
+
+
+# --- 支撑/阻力区间 ---
+def build_extremum_zones(extremes, zone_width):
+    """
+    把极值点按价格聚类成区间 (sort-and-sweep，O(n log n)): 按价格排序后依次扫过，
+    与当前区间下沿相差不超过 zone_width (通常为若干倍ATR) 的极值点并入同一区间，否则开始新区间。
+    extremes 为 find_extremes_pyramid 的结果。返回 DataFrame:
+    下沿/上沿/中枢/触及次数/高点数/低点数/级别/极值级别/最近触及，按中枢价格排序。
+    """
+    columns = ['下沿', '上沿', '中枢', '触及次数', '高点数', '低点数', '级别', '极值级别', '最近触及']
+    if extremes.empty or not zone_width > 0:
+        return pd.DataFrame(columns=columns)
+    ordered = extremes.sort_values('价格', kind='mergesort')
+    prices = ordered['价格'].to_numpy()
+    zone_ids = np.empty(len(prices), dtype=int)
+    zone_id, zone_start = 0, prices[0]
+    for i, price in enumerate(prices):
+        if price - zone_start > zone_width:
+            zone_id, zone_start = zone_id + 1, price
+        zone_ids[i] = zone_id
+
+    grouped = ordered.assign(区间=zone_ids, 是高点=(ordered['类型'] == "高点")).groupby('区间')
+    zones = pd.DataFrame({
+        '下沿': grouped['价格'].min(),
+        '上沿': grouped['价格'].max(),
+        '中枢': grouped['价格'].mean(),
+        '触及次数': grouped.size(),
+        '高点数': grouped['是高点'].sum(),
+        '级别': grouped['级别'].max(),
+        '最近触及': grouped['日期'].max(),
+    })
+    zones['低点数'] = zones['触及次数'] - zones['高点数']
+    zones['极值级别'] = [EXTREMUM_LEVELS[i] if i < len(EXTREMUM_LEVELS) else f"L{i}" for i in zones['级别']]
+    return zones[columns].reset_index(drop=True)
+
+
+def evaluate_zone_proximity(current_price, current_atr, zones, atr_multiplier, analyze_maxima=True, analyze_minima=True):
+    """
+    判断当前价格是否在各区间 ± atr_multiplier * ATR 的范围内 (处于区间内部时距离为0)。
+    区间以高点为主视为阻力 (靠近高点)，以低点为主视为支撑 (靠近低点)。
+    返回与 evaluate_proximity 相同结构的结果列表，极值点日期为最近触及日期，极值点价格为区间中枢，另附区间上下沿与触及次数。
+    """
+    if zones.empty:
+        return []
+    gap = np.maximum(zones['下沿'] - current_price, 0) + np.maximum(current_price - zones['上沿'], 0)
+    is_resistance = zones['高点数'] >= zones['低点数']
+    selected = (gap <= atr_multiplier * current_atr) & ((is_resistance & analyze_maxima) | (~is_resistance & analyze_minima))
+    results = []
+    for (_, zone), resistance in zip(zones[selected].iterrows(), is_resistance[selected]):
+        results.append({
+            "分析类型": "靠近高点" if resistance else "靠近低点",
+            "极值级别": zone['极值级别'],
+            "当前价格": current_price,
+            "极值点日期": zone['最近触及'].strftime('%Y-%m-%d'),
+            "极值点价格": zone['中枢'],
+            "区间下沿": zone['下沿'],
+            "区间上沿": zone['上沿'],
+            "触及次数": int(zone['触及次数']),
+            "当前ATR": current_atr,
+            "距离ATR倍数": (current_price - zone['中枢']) / current_atr,
+            "距离百分比": (zone['中枢'] - current_price) / current_price * 100,
+        })
+    return results
+
+
+def evaluate_proximity(current_price, current_atr, maxima, minima, atr_multiplier):
+    """
+    判断当前价格是否处于各极值点 ± atr_multiplier * ATR 的区间内。
+    极值点为 (日期, 价格) 或带级别名称的 (日期, 价格, 极值级别)。
+    返回命中的极值点列表，元素为 dict: 分析类型/[极值级别]/当前价格/极值点日期/极值点价格/当前ATR/距离ATR倍数/距离百分比。
+    """
+    band = atr_multiplier * current_atr
+    results = []
+    for kind, points in (("靠近高点", maxima or []), ("靠近低点", minima or [])):
+        for point in points:
+            point_date, point_price = point[0], point[1]
+            if abs(current_price - point_price) <= band:
+                item = {"分析类型": kind}
+                if len(point) > 2:
+                    item["极值级别"] = point[2]
+                item.update({
+                    "当前价格": current_price,
+                    "极值点日期": point_date.strftime('%Y-%m-%d'),
+                    "极值点价格": point_price,
+                    "当前ATR": current_atr,
+                    "距离ATR倍数": (current_price - point_price) / current_atr,
+                    "距离百分比": (point_price - current_price) / current_price * 100,
+                })
+                results.append(item)
+    return results
@@ -0,0 +1,287 @@
+# etf_bars.py
+# ETF 日K线数据层: 本地保存不复权K线和复权因子，前复权/后复权/不复权视图按需相乘得到，切换复权方式不需要重新下载。
+# - 复权因子 = 后复权收盘价 / 不复权收盘价。后复权以上市首日为基准，分红除息不会改变已有日期的因子
+# - 前复权 = 不复权 * 因子 / 最新因子。分红除息时只有最新因子变化，已保存的K线仍然有效
+# - 增量更新只请求最近一段数据，与已保存数据重叠的几天用于校验因子:
+#   重叠部分因子不一致说明上游改写了历史，此时才对该ETF完整重新下载一次
+# - 最新因子变化 (新的除权除息) 时只清除该ETF的派生视图，不重新下载K线
+# - 按交易日历判断是否可能有新K线: 已保存收盘后获取的最新交易日K线时 (含周末、节假日) 不请求上游
+# K线保存在 data/bars/<代码>.parquet，进程内所有页面共享 bar_store 实例。
+# 内存中最多保留最近使用的 max_symbols 个ETF (LRU)，其余只在磁盘上，全市场扫描时内存占用与ETF总数无关。
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+
+import akshare as ak
+import numpy as np
+import pandas as pd
+
+from resilient_fetch import mark_stale, resilient_call
+from trade_calendar import bars_up_to_date
+
+BARS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "bars")
+
+ADJUST_MODES = {"qfq": "前复权", "hfq": "后复权", "": "不复权"}
+PRICE_COLS = ['Open', 'High', 'Low', 'Close']
+FACTOR_COL = '复权因子'
+# 上游价格只有3位小数，因子带有舍入误差，相对变化超过该值才认为因子发生了变化
+FACTOR_TOLERANCE = 1e-3
+
+
+def _fetch_bars(etf_code, start_str, end_str, adjust):
+    """请求一种复权方式的日K线，返回以日期为索引的 OHLCV DataFrame。"""
+    df = resilient_call(ak.fund_etf_hist_em, symbol=etf_code, period="daily",
+                        start_date=start_str, end_date=end_str, adjust=adjust)
+    if df.empty:
+        return pd.DataFrame()
+    df = df.rename(columns={'开盘': 'Open', '最高': 'High', '最低': 'Low', '收盘': 'Close', '成交量': 'Volume'})
+    df.index = pd.to_datetime(df['日期']).dt.normalize()
+    df.index.name = '日期'
+    df = df[PRICE_COLS + ['Volume']].apply(pd.to_numeric, errors='coerce')
+    return df.dropna(subset=PRICE_COLS)
+
+
+def fetch_raw_bars_with_factor(etf_code, start_str, end_str):
+    """请求不复权和后复权日K线，返回不复权 OHLCV 加复权因子列。"""
+    raw = _fetch_bars(etf_code, start_str, end_str, "")
+    if raw.empty:
+        return raw
+    hfq_close = _fetch_bars(etf_code, start_str, end_str, "hfq")['Close']
+    factor = (hfq_close.reindex(raw.index) / raw['Close']).replace([np.inf, -np.inf], np.nan)
+    # 个别日期缺少后复权数据时沿用相邻的因子 (因子只在除权除息日变化)
+    raw[FACTOR_COL] = factor.ffill().bfill().fillna(1.0)
+    return raw
+
+
+def apply_adjustment(df_bars, adjust="qfq"):
+    """由不复权K线和复权因子生成指定复权方式的 OHLCV (向量化相乘)。"""
+    out = df_bars[PRICE_COLS + ['Volume']].copy()
+    if adjust == "" or df_bars.empty:
+        return out
+    factor = df_bars[FACTOR_COL].to_numpy()
+    scale = factor if adjust == "hfq" else factor / factor[-1]
+    out[PRICE_COLS] = (df_bars[PRICE_COLS].to_numpy() * scale[:, None]).round(4)
+    return out
+
+
+def _data_version(df):
+    if df.empty:
+        return None
+    return f"{df.index[-1].strftime('%Y-%m-%d')}@{df[FACTOR_COL].iloc[-1]:.6f}"
+
+
+def _factor_differs(a, b):
+    return bool(np.any(np.abs(np.asarray(a) / np.asarray(b) - 1) > FACTOR_TOLERANCE))
+
+
+class DailyBarStore:
+    """
+    不复权日K线 + 复权因子的增量存储。
+    同一ETF在 min_refresh_seconds 内重复读取不会请求上游；上游请求失败时继续使用已保存的数据。
+    内存中只保留最近使用的 max_symbols 个ETF的K线和派生视图，被淘汰的ETF下次读取时从本地文件重新载入。
+    """
+
+    def __init__(self, data_dir=BARS_DIR, overlap_days=10, min_refresh_seconds=600, max_symbols=256):
+        self.data_dir = data_dir
+        self.overlap_days = overlap_days
+        self.min_refresh_seconds = min_refresh_seconds
+        self.max_symbols = max_symbols
+        self._bars = OrderedDict() # {代码: 不复权K线 + 复权因子}，按最近使用排序
+        self._covered_from = {} # {代码: 已完整下载过的最早起始日期 'YYYYMMDD'}
+        self._checked_at = {}   # {代码: 最近一次请求上游的时间}
+        self._saved_at = {}     # {代码: 最近一次保存的时间 (即数据的获取时间)，读盘时取文件修改时间}
+        self._versions = {}     # {代码: 数据版本}，ETF被淘汰出内存后仍可查询
+        self._views = {}        # {(代码, 复权方式): 派生视图}，只包含仍在内存中的ETF
+        self._index_loaded = False # index.json 是否已读入 _covered_from (首次访问时读取，clear() 后重新读取)
+        self._locks = {}
+        self._lock = threading.Lock()
+        self._index_lock = threading.Lock() # 串行化 index.json 的读-合并-写
+        self.stats = {"full_fetches": 0, "incremental_fetches": 0, "factor_changes": 0, "history_rewrites": 0}
+
+    # --- 本地文件 ---
+    def _path(self, etf_code):
+        return os.path.join(self.data_dir, f"{etf_code}.parquet")
+
+    def _index_path(self):
+        return os.path.join(self.data_dir, "index.json")
+
+    def _remember_locked(self, etf_code, df):
+        """把K线放入内存并标记为最近使用，超过 max_symbols 时淘汰最久未用的ETF及其派生视图 (文件已在磁盘上)。"""
+        self._bars[etf_code] = df
+        self._bars.move_to_end(etf_code)
+        self._versions[etf_code] = _data_version(df)
+        while len(self._bars) > self.max_symbols:
+            evicted, _ = self._bars.popitem(last=False)
+            self._saved_at.pop(evicted, None)
+            for adjust in ADJUST_MODES:
+                self._views.pop((evicted, adjust), None)
+
+    def _read_index(self):
+        if not os.path.exists(self._index_path()):
+            return {}
+        with open(self._index_path(), "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    def _ensure_index(self):
+        """在任何读取或保存之前把 index.json 读入 _covered_from (每个实例只读一次，clear() 后重新读取)。"""
+        with self._lock:
+            if self._index_loaded:
+                return
+        index = self._read_index()
+        with self._lock:
+            if not self._index_loaded:
+                for code, covered_from in index.items():
+                    self._covered_from.setdefault(code, covered_from)
+                self._index_loaded = True
+
+    def _load_local(self, etf_code):
+        self._ensure_index()
+        with self._lock:
+            if etf_code in self._bars:
+                self._bars.move_to_end(etf_code)
+                return self._bars[etf_code]
+        path = self._path(etf_code)
+        if not os.path.exists(path):
+            return None
+        df = pd.read_parquet(path)
+        with self._lock:
+            self._saved_at[etf_code] = os.path.getmtime(path)
+            self._remember_locked(etf_code, df)
+        return df
+
+    def _save(self, etf_code, df, covered_from):
+        os.makedirs(self.data_dir, exist_ok=True)
+        path = self._path(etf_code)
+        df.to_parquet(path + ".tmp")
+        os.replace(path + ".tmp", path)
+        with self._lock:
+            self._covered_from[etf_code] = covered_from
+            self._saved_at[etf_code] = time.time()
+            self._views = {key: view for key, view in self._views.items() if key[0] != etf_code}
+            self._remember_locked(etf_code, df)
+        # 合并进磁盘上的索引，而不是用内存中的 (可能不完整的) 索引覆盖
+        with self._index_lock:
+            index = self._read_index()
+            index[etf_code] = covered_from
+            with open(self._index_path() + ".tmp", "w", encoding="utf-8") as f:
+                json.dump(index, f)
+            os.replace(self._index_path() + ".tmp", self._index_path())
+
+    def _record_fetch(self, etf_code, stat):
+        with self._lock:
+            self.stats[stat] += 1
+            self._checked_at[etf_code] = time.time()
+
+    def _count(self, stat):
+        with self._lock:
+            self.stats[stat] += 1
+
+    def _code_lock(self, etf_code):
+        with self._lock:
+            return self._locks.setdefault(etf_code, threading.Lock())
+
+    # --- 更新 ---
+    def _refresh(self, etf_code, start_str):
+        """确保已保存数据覆盖 start_str 至今，必要时增量或完整下载。返回错误信息。"""
+        today_str = datetime.now().strftime('%Y%m%d')
+        stored = self._load_local(etf_code)
+        with self._lock:
+            covered_from = self._covered_from.get(etf_code)
+            checked_at = self._checked_at.get(etf_code, 0)
+            saved_at = self._saved_at.get(etf_code)
+
+        if stored is None or stored.empty or covered_from is None or covered_from > start_str:
+            # 首次下载，或需要比已保存数据更早的历史
+            full_start = min(start_str, covered_from) if covered_from else start_str
+            return self._full_fetch(etf_code, full_start, today_str)
+
+        if bars_up_to_date(stored.index[-1], saved_at):
+            return None
+        if time.time() - checked_at < self.min_refresh_seconds:
+            return None
+        inc_start = stored.index[-min(self.overlap_days, len(stored))].strftime('%Y%m%d')
+        new = fetch_raw_bars_with_factor(etf_code, inc_start, today_str)
+        self._record_fetch(etf_code, "incremental_fetches")
+        if new.empty:
+            return None
+
+        overlap = new.index.intersection(stored.index)
+        if len(overlap) and _factor_differs(new.loc[overlap, FACTOR_COL], stored.loc[overlap, FACTOR_COL]):
+            # 已有日期的后复权因子被上游改写，旧数据不能再用于拼接
+            self._count("history_rewrites")
+            return self._full_fetch(etf_code, covered_from, today_str)
+        if _factor_differs(new[FACTOR_COL].iloc[-1], stored[FACTOR_COL].iloc[-1]):
+            # 新的除权除息: K线不用重新下载，前复权视图会随最新因子重新计算
+            self._count("factor_changes")
+
+        merged = pd.concat([stored.drop(overlap), new]).sort_index()
+        self._save(etf_code, merged, covered_from)
+        return None
+
+    def _full_fetch(self, etf_code, start_str, end_str):
+        df = fetch_raw_bars_with_factor(etf_code, start_str, end_str)
+        self._record_fetch(etf_code, "full_fetches")
+        if df.empty:
+            return f"ETF {etf_code} 在 {start_str} 之后无行情数据"
+        self._save(etf_code, df, start_str)
+        return None
+
+    # --- 读取 ---
+    def get_bars(self, etf_code, start_str, end_str, adjust="qfq"):
+        """
+        返回 (指定复权方式的 OHLCV DataFrame, 错误信息)，日期参数为 'YYYYMMDD' 字符串。
+        前复权以已保存数据的最新因子为基准。
+        """
+        with self._code_lock(etf_code):
+            try:
+                error = self._refresh(etf_code, start_str)
+            except Exception as e:
+                error = f"获取 {etf_code} 数据出错: {e}"
+            # 刚载入的K线可能已被其它线程的读取挤出内存，此时从本地文件重新载入
+            stored = self._load_local(etf_code)
+            if stored is None or stored.empty:
+                return pd.DataFrame(), error or f"ETF {etf_code} 无行情数据"
+            if error:
+                # 上游失败，继续使用已保存的数据，并标记为旧数据 (上层缓存不会把它当作刚刷新的数据)
+                mark_stale(error, self._saved_at.get(etf_code))
+
+            key = (etf_code, adjust)
+            with self._lock:
+                view = self._views.get(key)
+            if view is None:
+                view = apply_adjustment(stored, adjust)
+                with self._lock:
+                    if etf_code in self._bars:
+                        self._views[key] = view
+        df = view.loc[pd.Timestamp(start_str):pd.Timestamp(end_str)].copy()
+        if df.empty:
+            return df, f"ETF {etf_code} 在 {start_str} 至 {end_str} 无行情数据"
+        return df, None
+
+    def data_version(self, etf_code):
+        """已保存数据的版本 '最新日期@最新复权因子'，数据或复权基准变化时版本随之变化。未加载过返回 None。"""
+        with self._lock:
+            return self._versions.get(etf_code)
+
+    def clear(self):
+        """清空内存中的数据和派生视图 (本地文件保留，下次读取时重新校验)。"""
+        with self._lock:
+            self._bars.clear()
+            self._covered_from.clear()
+            self._checked_at.clear()
+            self._saved_at.clear()
+            self._versions.clear()
+            self._views.clear()
+            self._index_loaded = False
+
+
+def history_start(years_of_history):
+    """近 years_of_history 年的起始日期 'YYYYMMDD'。"""
+    return (datetime.now() - timedelta(days=int(years_of_history * 365.25))).strftime('%Y%m%d')
+
+
+# 各页面、后台监控共享同一个存储实例
+bar_store = DailyBarStore()
@@ -0,0 +1,139 @@
+# etf_resample.py
+# 基于已缓存的日K / 1分钟K数据在本地合成更大周期的K线，
+# 切换周期时无需再次请求 AkShare。
+import numpy as np
+import pandas as pd
+
+# OHLCV 各列的聚合方式 (列名与页面中 rename 之后的英文列名一致)
+OHLCV_AGG = {
+    'Open': 'first',
+    'High': 'max',
+    'Low': 'min',
+    'Close': 'last',
+    'Volume': 'sum',
+}
+
+# 日线及以上周期: 显示名称 -> 周期代码
+# 'D' 为原始日线; 'W'/'M' 为自然周/自然月; 'ND' 为自定义 N 个交易日
+DAILY_TIMEFRAMES = {
+    "日线": "D",
+    "周线": "W",
+    "月线": "M",
+    "自定义N日": "ND",
+}
+
+# 分钟级周期金字塔: 每一级都由上一级合成 (1 -> 5 -> 15 -> 30 -> 60)
+MINUTE_PYRAMID = [1, 5, 15, 30, 60]
+
+# 分钟级周期: 显示名称 -> 分钟数
+MINUTE_TIMEFRAMES = {
+    "1分钟": 1,
+    "5分钟": 5,
+    "15分钟": 15,
+    "30分钟": 30,
+    "60分钟": 60,
+}
+
+# A股每日交易时段 (上午 9:30-11:30, 下午 13:00-15:00)，共 240 分钟
+_MORNING_OPEN = 9 * 60 + 30
+_MORNING_CLOSE = 11 * 60 + 30
+_AFTERNOON_OPEN = 13 * 60
+_SESSION_MINUTES = 240
+
+
+def _agg_spec(df):
+    """只保留 df 中实际存在的 OHLCV 列的聚合方式，其余数值列取最后一个值。"""
+    spec = {col: how for col, how in OHLCV_AGG.items() if col in df.columns}
+    for col in df.columns:
+        if col not in spec:
+            spec[col] = 'last'
+    return spec
+
+
+def _aggregate_by_group(df, group_keys):
+    """按 group_keys 分组聚合，并用每组最后一根K线的时间作为新K线的时间标签。"""
+    if df.empty:
+        return df.copy()
+    index_name = df.index.name or '日期'
+    labels = pd.Series(df.index, index=df.index)
+    grouped = df.groupby(group_keys, sort=True)
+    out = grouped.agg(_agg_spec(df))
+    out.index = pd.DatetimeIndex(labels.groupby(group_keys, sort=True).last().values, name=index_name)
+    return out[df.columns]
+
+
+def ensure_datetime_index(df):
+    """确保K线 DataFrame 使用升序的 DatetimeIndex (AkShare 返回的日期可能为字符串或 date 对象)。"""
+    if df.empty or isinstance(df.index, pd.DatetimeIndex):
+        return df.sort_index()
+    out = df.copy()
+    out.index = pd.DatetimeIndex(pd.to_datetime(out.index), name=df.index.name)
+    return out.sort_index()
+
+
+def resample_daily_bars(df_daily, timeframe="D", n_days=5):
+    """
+    将日K线合成为周线 / 月线 / 自定义N日线。
+    - timeframe: 'D' 原样返回, 'W' 自然周, 'M' 自然月, 'ND' 每 n_days 个交易日一根
+    - 新K线的日期取该周期内最后一个交易日，便于与原日线对齐。
+    """
+    df = ensure_datetime_index(df_daily)
+    if df.empty or timeframe == "D":
+        return df
+
+    index = df.index
+    if timeframe == "W":
+        # 以周五结束的自然周分组 (A股周末不交易)
+        group_keys = index.to_period('W-FRI').asi8
+    elif timeframe == "M":
+        group_keys = index.to_period('M').asi8
+    elif timeframe == "ND":
+        n_days = max(int(n_days), 1)
+        # 从最新一根往前数，保证最后一根自定义K线总是完整的 n_days
+        positions = np.arange(len(df))[::-1] // n_days
+        group_keys = positions.max() - positions
+    else:
+        raise ValueError(f"不支持的周期: {timeframe}")
+
+    return _aggregate_by_group(df, group_keys)
+
+
+def _session_minute_offset(index):
+    """计算每根分钟K线相对当日开盘的交易分钟序号 (0-239)，午休不计入。"""
+    minutes = index.hour * 60 + index.minute
+    morning = minutes <= _MORNING_CLOSE
+    offset = np.where(morning,
+                      minutes - _MORNING_OPEN,
+                      (_MORNING_CLOSE - _MORNING_OPEN) + (minutes - _AFTERNOON_OPEN))
+    # 分钟K线的时间戳为该分钟的结束时刻 (9:31 表示 9:30-9:31)，9:30 集合竞价并入第一根
+    offset = np.clip(offset - 1, 0, _SESSION_MINUTES - 1)
+    return offset
+
+
+def resample_minute_bars(df_minute, minutes):
+    """
+    将分钟K线按交易时段合成为 minutes 分钟K线 (不会跨越午休或跨日)。
+    例如 60 分钟线为 10:30 / 11:30 / 14:00 / 15:00 四根，与交易软件一致。
+    """
+    df = ensure_datetime_index(df_minute)
+    if df.empty or minutes <= 1:
+        return df
+    index = df.index
+    day_keys = index.normalize().asi8
+    bucket = _session_minute_offset(index) // int(minutes)
+    return _aggregate_by_group(df, [day_keys, bucket])
+
+
+def build_minute_pyramid(df_1min, levels=None):
+    """
+    由1分钟K线逐级合成分钟周期金字塔，返回 {分钟数: DataFrame}。
+    每一级都基于能整除它的最大已合成级别聚合 (如 15 分钟由 5 分钟合成)，避免重复扫描1分钟数据。
+    """
+    levels = sorted(set(levels or MINUTE_PYRAMID) | {1})
+    pyramid = {1: ensure_datetime_index(df_1min)}
+    for level in levels[1:]:
+        base_level = max(m for m in pyramid if level % m == 0)
+        # 已合成K线的时间标签是桶内最后一分钟，直接按交易分钟序号再次分桶即可
+        pyramid[level] = resample_minute_bars(pyramid[base_level], level)
+    return pyramid
+
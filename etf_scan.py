@@ -0,0 +1,155 @@
+# etf_scan.py
+# 批量极值点靠近扫描，既用于固定的ETF列表，也用于全市场ETF (从实时行情列表中发现)。
+# - 先按实时行情里的成交额做流动性过滤，历史K线长度不足的ETF在计算指标之前剔除
+# - 并发获取与计算，同时在途的ETF数量有上限，每个ETF只保留扫描结果而不保留K线，内存占用与ETF总数无关
+#   (底层的K线存储 etf_bars.bar_store 也只在内存中保留最近使用的一部分ETF，其余留在本地文件)
+#   (命中的ETF额外保留最近一段收盘价和极值点，供结果页绘制缩略图，不需要再次请求K线；
+#    每个扫描过的ETF保留其极值点表 (几十行)，随快照保存)
+# - 以生成器逐个返回每个ETF的结果 (完成一个返回一个)，页面可以边扫描边刷新；提前关闭生成器即停止扫描
+# 这里的函数不调用 st.*，可以在工作线程中运行。
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from contextlib import closing
+from itertools import islice
+
+import akshare as ak
+import numpy as np
+import pandas as pd
+
+from etf_analysis import (fetch_etf_daily_history, compute_atr, evaluate_proximity, evaluate_zone_proximity,
+                          find_scan_extremes, build_extremum_zones)
+from resilient_fetch import resilient_call
+
+SPARKLINE_DAYS = 120 # 缩略图显示的交易日数
+
+
+def fetch_etf_universe():
+    """获取全部上市ETF的实时行情，返回 (DataFrame[代码, 名称, 最新价, 成交额], 错误信息)。"""
+    try:
+        df = resilient_call(ak.fund_etf_spot_em)
+        if df.empty or not all(col in df.columns for col in ['代码', '名称', '最新价', '成交额']):
+            return pd.DataFrame(), "ETF实时行情为空或缺少必要列(代码/名称/最新价/成交额)"
+        df = df[['代码', '名称', '最新价', '成交额']].copy()
+        df['最新价'] = pd.to_numeric(df['最新价'], errors='coerce')
+        df['成交额'] = pd.to_numeric(df['成交额'], errors='coerce')
+        return df.dropna(subset=['最新价']).reset_index(drop=True), None
+    except Exception as e:
+        return pd.DataFrame(), f"获取ETF列表出错: {e}"
+
+
+def filter_liquid_etfs(df_universe, min_turnover):
+    """保留当日成交额 (元) 不低于 min_turnover 的ETF，按成交额从高到低返回 {代码: 名称}。"""
+    df = df_universe[df_universe['成交额'] >= min_turnover].sort_values('成交额', ascending=False)
+    return dict(zip(df['代码'], df['名称']))
+
+
+def _sparkline_payload(close, extremes, found, current_atr, atr_multiplier, days=SPARKLINE_DAYS):
+    """
+    命中ETF的缩略图数据: 最近 days 个交易日的收盘价 (float32)、其中的极值点位置，
+    以及每条命中记录的靠近范围 (极值点或区间 ± atr_multiplier * ATR)。
+    """
+    window = close.iloc[-days:]
+    in_window = extremes[extremes['日期'] >= window.index[0]]
+    band = atr_multiplier * current_atr
+    bands = [(float(item.get("区间下沿", item["极值点价格"]) - band),
+              float(item.get("区间上沿", item["极值点价格"]) + band), item["分析类型"]) for item in found]
+    return {
+        "dates": window.index.strftime('%Y-%m-%d').tolist(),
+        "close": window.to_numpy(dtype=np.float32),
+        "extreme_pos": window.index.get_indexer(in_window['日期']),
+        "extreme_price": in_window['价格'].to_numpy(dtype=np.float32),
+        "extreme_type": in_window['类型'].tolist(),
+        "bands": bands,
+    }
+
+
+def scan_etf(code, name, fetcher, history_years, atr_period, peak_distance, prominence_factor,
+             atr_multiplier, analyze_maxima=True, analyze_minima=True, min_history_days=0, min_level=1,
+             zone_width_multiplier=None):
+    """
+    扫描单个ETF，返回 (命中的极值点结果列表, 错误信息, 缩略图数据, 极值点表)，未命中时缩略图数据为 None，
+    极值点表为 DataFrame[日期, 价格, 类型, 级别] (级别过滤后的全部极值点)，出错时为 None。
+    极值点取自多级别极值点中级别不低于 min_level 的部分 (级别序号见 etf_analysis.EXTREMUM_LEVELS)。
+    zone_width_multiplier 不为空时先把极值点聚类成宽度为该倍数ATR的价格区间，按区间判断靠近 (每个区间一条结果)。
+    """
+    try:
+        df, error = fetcher(code, history_years)
+        if error or df.empty:
+            return [], error or "无有效数据", None, None
+        if len(df) < min_history_days:
+            return [], f"历史数据不足 {min_history_days} 个交易日 ({len(df)})", None, None
+
+        close = df['Close']
+        if len(close) < peak_distance * 2:
+            return [], f"极值点识别: 数据点不足 ({len(close)}) to find peaks with distance {peak_distance}", None, None
+        extremes = find_scan_extremes(close, peak_distance, prominence_factor, min_level)
+        extremes_table = extremes[['日期', '价格', '类型', '级别']].reset_index(drop=True)
+
+        current_price = close.iloc[-1]
+        current_atr = compute_atr(df, atr_period).iloc[-1]
+        if pd.isna(current_price) or pd.isna(current_atr) or current_atr <= 0:
+            return [], f"当前价格或ATR无效 (Price: {current_price}, ATR: {current_atr})", None, extremes_table
+
+        if zone_width_multiplier:
+            zones = build_extremum_zones(extremes, zone_width_multiplier * current_atr)
+            found = evaluate_zone_proximity(current_price, current_atr, zones, atr_multiplier,
+                                            analyze_maxima, analyze_minima)
+        else:
+            maxima = list(extremes.loc[extremes['类型'] == "高点", ['日期', '价格', '极值级别']].itertuples(index=False))
+            minima = list(extremes.loc[extremes['类型'] == "低点", ['日期', '价格', '极值级别']].itertuples(index=False))
+            found = evaluate_proximity(current_price, current_atr,
+                                       maxima if analyze_maxima else [], minima if analyze_minima else [],
+                                       atr_multiplier)
+        sparkline = _sparkline_payload(close, extremes, found, current_atr, atr_multiplier) if found else None
+        return [{"ETF代码": code, "名称": name, **item} for item in found], None, sparkline, extremes_table
+    except Exception as e:
+        return [], f"扫描出错: {e}", None, None
+
+
+def iter_scan(watchlist, max_workers=8, fetcher=fetch_etf_daily_history, **scan_params):
+    """
+    并发扫描 watchlist ({代码: 名称})，每个ETF完成后立即 yield (代码, 命中结果列表, 错误信息, 缩略图数据, 极值点表)，
+    按完成顺序。
+    同时在途的ETF不超过 max_workers * 2 个 (按 watchlist 顺序依次提交)。scan_params 为 scan_etf 的其余参数。
+    提前关闭生成器 (close() 或被垃圾回收) 时取消尚未开始的ETF，正在计算的几个在后台结束后丢弃。
+    """
+    items = iter(watchlist.items())
+    executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="etf-scan")
+    pending = {}
+
+    def submit(code, name):
+        pending[executor.submit(scan_etf, code, name, fetcher, **scan_params)] = code
+
+    try:
+        for code, name in islice(items, max_workers * 2):
+            submit(code, name)
+        while pending:
+            finished, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in finished:
+                code = pending.pop(future)
+                for next_code, next_name in islice(items, 1):
+                    submit(next_code, next_name)
+                yield (code, *future.result())
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+
+
+def iter_scan_batches(watchlist, batch_size=50, max_workers=8, fetcher=fetch_etf_daily_history, **scan_params):
+    """
+    按批次汇总 iter_scan 的结果，每完成 batch_size 个ETF
+    yield (已完成数量, 本批结果列表, 本批错误 {代码: 错误信息}, 本批命中ETF的缩略图数据 {代码: 数据},
+           本批ETF的极值点表 {代码: DataFrame})。
+    """
+    done, results, errors, sparklines, extremes = 0, [], {}, {}, {}
+    with closing(iter_scan(watchlist, max_workers=max_workers, fetcher=fetcher, **scan_params)) as scan:
+        for code, found, error, sparkline, extremes_table in scan:
+            done += 1
+            if error:
+                errors[code] = error
+            if sparkline is not None:
+                sparklines[code] = sparkline
+            if extremes_table is not None:
+                extremes[code] = extremes_table
+            results.extend(found)
+            if done % batch_size == 0 or done == len(watchlist):
+                yield done, results, errors, sparklines, extremes
+                results, errors, sparklines, extremes = [], {}, {}, {}
@@ -0,0 +1,77 @@
+# figure_cache.py
+# 服务端 Plotly 图表缓存: 以“数据指纹 + 仅影响该图的参数”为键缓存序列化后的图表 JSON。
+# 与图表无关的控件 (如 ATR 倍数) 触发重跑时直接复用缓存；
+# 只有局部参数变化时 (如极值点参数)，在缓存的基础图上替换对应的 trace，而不是整张图重建。
+import hashlib
+import threading
+from collections import OrderedDict
+
+import pandas as pd
+import plotly.io as pio
+
+
+def data_fingerprint(*objs):
+    """计算一个或多个 DataFrame / Series 的内容指纹 (含索引)，数据不变则指纹不变。"""
+    digest = hashlib.sha1()
+    for obj in objs:
+        if obj is None:
+            digest.update(b"none")
+            continue
+        digest.update(pd.util.hash_pandas_object(obj, index=True).values.tobytes())
+        if isinstance(obj, pd.DataFrame):
+            digest.update("|".join(map(str, obj.columns)).encode("utf-8"))
+    return digest.hexdigest()
+
+
+class FigureCache:
+    """进程级 LRU 图表缓存，值为 plotly 图表的 JSON 字符串，所有会话共享。"""
+
+    def __init__(self, max_entries=64):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """命中时返回新的 go.Figure (每次反序列化，调用方可以放心修改)，未命中返回 None。"""
+        with self._lock:
+            fig_json = self._entries.get(key)
+            if fig_json is None:
+                return None
+            self._entries.move_to_end(key)
+        return pio.from_json(fig_json)
+
+    def put(self, key, fig):
+        fig_json = pio.to_json(fig, validate=False)
+        with self._lock:
+            self._entries[key] = fig_json
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def get_or_build(self, key, builder):
+        """命中则返回缓存的图表，否则调用 builder() 构建并缓存。"""
+        fig = self.get(key)
+        if fig is None:
+            fig = builder()
+            self.put(key, fig)
+        return fig
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+def patch_traces(fig, traces, replace_names=()):
+    """
+    在已有图表上替换 trace: 删除名称在 replace_names 中的旧 trace，再追加 traces。
+    traces 需显式指定 xaxis/yaxis (反序列化后的图表不保留子图网格信息，不能用 row/col)。
+    """
+    names = set(replace_names) | {trace.name for trace in traces}
+    fig.data = tuple(trace for trace in fig.data if trace.name not in names)
+    for trace in traces:
+        fig.add_trace(trace)
+    return fig
+
+
+# 各页面共享同一个缓存实例 (模块只会被导入一次，跨重跑保留)
+figure_cache = FigureCache()
@@ -0,0 +1,168 @@
+# indicators.py
+# 声明式技术指标: 传入指标列表 (如 ["MA5", "MA20", "EMA12", "RSI14", "MACD", "BOLL20", "ATR14"])，一次计算全部指标。
+# - 同一次计算内共享中间结果: 真实波幅、涨跌幅、同一窗口的滚动均值、同一周期的 EMA 只算一次
+#   (如 MA20 与 BOLL20 共用20日均值，EMA12/EMA26 与 MACD 共用)
+# - 输入为 日期 x ETF 的二维 DataFrame 时所有ETF同时计算，单个ETF的 OHLCV DataFrame 视为只有一列的面板
+#   (atr_backtest 的价格面板直接复用 true_range / wilder_atr)
+# - ATR / RSI 使用 Wilder 平滑 (RMA)，与 pandas_ta 的默认算法一致；python indicators.py 按固定参考值校验
+import re
+
+import numpy as np
+import pandas as pd
+
+BOLL_STD = 2.0 # 布林带宽度 (标准差倍数)
+MACD_DEFAULT = (12, 26, 9)
+
+_SPEC_PATTERN = re.compile(r"^(MA|EMA|RSI|ATR|BOLL)(\d+)$|^MACD(?:\((\d+),(\d+),(\d+)\))?$")
+# 画在价格图上的指标 (其余为副图指标)
+OVERLAY_KINDS = ("MA", "EMA", "BOLL")
+
+
+def parse_indicator(spec):
+    """"MA5" -> ("MA", (5,))；"MACD" 或 "MACD(12,26,9)" -> ("MACD", (12, 26, 9))。无法识别时抛出 ValueError。"""
+    match = _SPEC_PATTERN.match(spec.replace(" ", "").upper())
+    if not match:
+        raise ValueError(f"无法识别的指标: {spec}")
+    if match.group(1):
+        return match.group(1), (int(match.group(2)),)
+    return "MACD", tuple(int(g) for g in match.groups()[2:]) if match.group(3) else MACD_DEFAULT
+
+
+def output_names(spec):
+    """指标输出的列名: MA5 -> [MA5]；BOLL20 -> [BOLL20_UP, BOLL20_MID, BOLL20_LOW]；MACD -> [MACD, MACD_SIGNAL, MACD_HIST]。"""
+    kind, params = parse_indicator(spec)
+    if kind == "BOLL":
+        return [f"BOLL{params[0]}_{part}" for part in ("UP", "MID", "LOW")]
+    if kind == "MACD":
+        prefix = "MACD" if params == MACD_DEFAULT else "MACD({},{},{})".format(*params)
+        return [prefix, prefix + "_SIGNAL", prefix + "_HIST"]
+    return [f"{kind}{params[0]}"]
+
+
+def true_range(high, low, close):
+    """真实波幅 TR (日期 x ETF 的 ndarray)，第一行为 NaN (与 pandas_ta 一致)。"""
+    prev_close = np.vstack([np.full((1, close.shape[1]), np.nan), close[:-1]])
+    tr = np.fmax(high - low, np.fmax(np.abs(high - prev_close), np.abs(prev_close - low)))
+    tr[0] = np.nan
+    return tr
+
+
+def wilder_atr(tr, period):
+    """Wilder 平滑 (RMA) 的 ATR，与 df.ta.atr 默认算法一致，对所有ETF列同时计算。"""
+    return _rma(pd.DataFrame(tr), period).to_numpy()
+
+
+def _rma(frame, period):
+    return frame.ewm(alpha=1.0 / period, min_periods=period).mean()
+
+
+class _SharedPass:
+    """一次计算中的共享中间结果，每种中间量只在第一次用到时计算。"""
+
+    def __init__(self, high, low, close):
+        self.high, self.low, self.close = high, low, close
+        self._cache = {}
+
+    def _get(self, key, build):
+        if key not in self._cache:
+            self._cache[key] = build()
+        return self._cache[key]
+
+    def mean(self, n):
+        return self._get(("mean", n), lambda: self.close.rolling(n).mean())
+
+    def std(self, n):
+        return self._get(("std", n), lambda: self.close.rolling(n).std(ddof=0))
+
+    def ema(self, n):
+        return self._get(("ema", n), lambda: self.close.ewm(span=n, adjust=False, min_periods=n).mean())
+
+    def change(self):
+        return self._get("change", lambda: self.close.diff())
+
+    def tr(self):
+        return self._get("tr", lambda: pd.DataFrame(
+            true_range(self.high.to_numpy(), self.low.to_numpy(), self.close.to_numpy()),
+            index=self.close.index, columns=self.close.columns))
+
+    def compute(self, spec):
+        """返回 {列名: 日期 x ETF DataFrame}。"""
+        kind, params = parse_indicator(spec)
+        names = output_names(spec)
+        if kind == "MA":
+            return {names[0]: self.mean(params[0])}
+        if kind == "EMA":
+            return {names[0]: self.ema(params[0])}
+        if kind == "ATR":
+            return {names[0]: self._get(("atr", params[0]), lambda: _rma(self.tr(), params[0]))}
+        if kind == "RSI":
+            n = params[0]
+            gain = _rma(self._get("gain", lambda: self.change().clip(lower=0)), n)
+            loss = _rma(self._get("loss", lambda: (-self.change()).clip(lower=0)), n)
+            return {names[0]: 100 * gain / (gain + loss)}
+        if kind == "BOLL":
+            mid, width = self.mean(params[0]), BOLL_STD * self.std(params[0])
+            return dict(zip(names, (mid + width, mid, mid - width)))
+        fast, slow, signal = params
+        macd = self.ema(fast) - self.ema(slow)
+        macd_signal = macd.ewm(span=signal, adjust=False, min_periods=signal).mean()
+        return dict(zip(names, (macd, macd_signal, macd - macd_signal)))
+
+
+def compute_indicators(high, low, close, specs):
+    """
+    high/low/close 为同样形状的 日期 x ETF DataFrame，返回 {列名: float64 ndarray [日期, ETF]}。
+    重复的指标只计算一次。
+    """
+    shared = _SharedPass(high.astype(float), low.astype(float), close.astype(float))
+    results = {}
+    for spec in dict.fromkeys(specs):
+        for name, frame in shared.compute(spec).items():
+            results[name] = frame.to_numpy(dtype=np.float64)
+    return results
+
+
+def _single(df):
+    """单个ETF的 High/Low/Close 转为只有一列的面板。"""
+    return [df[[col]].set_axis(["v"], axis=1) for col in ("High", "Low", "Close")]
+
+
+def add_indicators(df, specs):
+    """返回附加了指标列的单个ETF OHLCV DataFrame 副本 (数据点不足的指标为 NaN)。"""
+    out = df.copy()
+    for name, values in compute_indicators(*_single(df), specs).items():
+        out[name] = values[:, 0]
+    return out
+
+
+def atr(df, length):
+    """单个ETF的 ATR 序列。"""
+    values = compute_indicators(*_single(df), [f"ATR{length}"])[f"ATR{length}"]
+    return pd.Series(values[:, 0], index=df.index, name=f"ATR{length}")
+
+
+# --- 固定数值校验 ---
+# pandas_ta 已移除，参考值按 pandas_ta 的默认算法逐项手算 (首行 TR 为 NaN，RMA 为 alpha=1/n 的加权平均，前 n 个值为 NaN)
+_REFERENCE_BARS = pd.DataFrame({
+    "High": [10.20, 10.35, 10.30, 10.52, 10.61, 10.48, 10.40, 10.66, 10.80, 10.75, 10.62, 10.58, 10.71, 10.90, 10.95],
+    "Low": [9.95, 10.05, 10.10, 10.22, 10.38, 10.25, 10.12, 10.30, 10.55, 10.49, 10.33, 10.30, 10.42, 10.60, 10.70],
+    "Close": [10.10, 10.28, 10.15, 10.47, 10.50, 10.30, 10.36, 10.61, 10.70, 10.52, 10.40, 10.55, 10.68, 10.84, 10.78],
+})
+_REFERENCE_VALUES = {
+    "ATR5": [0.266564, 0.270206, 0.29293, 0.282613, 0.277389, 0.280215, 0.280168, 0.282279, 0.28603, 0.278492],
+    "RSI5": [53.160144, 58.614351, 74.238267, 77.979243, 57.209961, 46.818459, 58.575204, 66.579174, 74.237308, 67.036842],
+}
+
+
+def check_reference_values():
+    """用固定K线核对 ATR / RSI 与参考值一致 (前5行为 NaN)，不一致时抛出 AssertionError。"""
+    df = add_indicators(_REFERENCE_BARS, list(_REFERENCE_VALUES))
+    for name, expected in _REFERENCE_VALUES.items():
+        values = df[name].to_numpy()
+        assert np.isnan(values[:5]).all(), f"{name} 前5行应为 NaN: {values[:5]}"
+        assert np.allclose(values[5:], expected, atol=1e-6), f"{name} 与参考值不一致: {values[5:]}"
+
+
+if __name__ == "__main__":
+    check_reference_values()
+    print("ATR / RSI 与参考值一致。")
@@ -0,0 +1,515 @@
+# load_test.py
+# 多会话并发压测: 用 Streamlit AppTest 在同一进程内模拟多个同时在线的用户，按权重随机打开页面并操作控件，
+# 统计每类操作 (页面, 动作) 的重跑耗时分位数、进程 CPU 占用和内存。
+# - 上游 akshare 接口全部替换为本地假数据 (FakeMarketData)，可设置每次请求的延迟和失败率，不访问网络
+# - 本地数据目录 (日K、板块资金流面板、交易日历、扫描快照) 指向临时目录，不改动 data/
+# - 进程内的 swr 缓存、图表缓存、K线存储等在所有会话间共享，与一个 streamlit 服务进程的情况一致
+# 用法:
+#   python load_test.py --sessions 8 --duration 60 --latency 0.2
+#   python load_test.py --pages 3,4,7 --sessions 16 --duration 120 --report load_report.json
+# 用于容量规划，以及在上线缓存/并发相关改动前后对比同一组参数的结果。
+import argparse
+import json
+import os
+import random
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import zlib
+from collections import defaultdict
+from datetime import datetime, timedelta
+
+import numpy as np
+import pandas as pd
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+try:
+    import resource
+except ImportError: # Windows
+    resource = None
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+PAGES_DIR = os.path.join(ROOT, "pages")
+HISTORY_START = "2015-01-05"
+EXTRA_SECTORS = 60 # 映射表之外再生成的板块数 (资金流排名/热力图)
+EXTRA_ETFS = 300 # 映射表之外再生成的ETF数 (全市场扫描)
+
+
+# --- 假行情数据 ---
+class FakeMarketData:
+    """
+    替代 akshare 的本地行情: 每个代码/板块按名称生成固定的随机序列 (同一代码多次请求结果一致)，
+    每次请求先等待 latency * U(0.5, 1.5) 秒，并按 error_rate 随机抛出连接错误。
+    """
+
+    def __init__(self, latency=0.2, error_rate=0.0, seed=0):
+        from etf_industry_map import ETF_INDUSTRY_MAPPINGS, ETF_SELECT_MAPPINGS
+        self.latency = latency
+        self.error_rate = error_rate
+        self.seed = seed
+        self.days = pd.bdate_range(HISTORY_START, datetime.now().date())
+        self.etfs = {code: name for name, code in {**ETF_INDUSTRY_MAPPINGS, **ETF_SELECT_MAPPINGS}.items()}
+        for i in range(EXTRA_ETFS):
+            self.etfs.setdefault(f"{159000 + i}", f"测试ETF{i}")
+        self.sectors = list(ETF_INDUSTRY_MAPPINGS) + [f"测试板块{i}" for i in range(EXTRA_SECTORS)]
+        self.calls = defaultdict(int)
+        self._bars = {}
+        self._lock = threading.Lock()
+
+    def _rng(self, *keys):
+        return np.random.default_rng([self.seed] + [zlib.crc32(str(key).encode("utf-8")) for key in keys])
+
+    def _request(self, endpoint):
+        with self._lock:
+            self.calls[endpoint] += 1
+        time.sleep(self.latency * random.uniform(0.5, 1.5))
+        if self.error_rate and random.random() < self.error_rate:
+            raise ConnectionError(f"模拟上游故障: {endpoint}")
+
+    def _daily_bars(self, symbol):
+        """完整的不复权日K线和后复权因子 (每个代码只生成一次)。"""
+        with self._lock:
+            if symbol in self._bars:
+                return self._bars[symbol]
+        rng = self._rng("bars", symbol)
+        n = len(self.days)
+        close = 1.0 * np.exp(np.cumsum(rng.normal(0.0002, 0.015, n)))
+        open_ = close * np.exp(rng.normal(0, 0.005, n))
+        high = np.maximum(open_, close) * (1 + np.abs(rng.normal(0, 0.006, n)))
+        low = np.minimum(open_, close) * (1 - np.abs(rng.normal(0, 0.006, n)))
+        # 每年一次分红，后复权因子在除息日上调
+        factor = np.cumprod(np.where(rng.random(n) < 1 / 240, 1.01, 1.0))
+        bars = pd.DataFrame({"开盘": open_, "收盘": close, "最高": high, "最低": low,
+                             "成交量": rng.integers(10_000, 5_000_000, n)}, index=self.days).round(3)
+        bars["factor"] = factor
+        with self._lock:
+            return self._bars.setdefault(symbol, bars)
+
+    def fund_etf_hist_em(self, symbol, period="daily", start_date="19700101", end_date="20500101", adjust=""):
+        self._request("fund_etf_hist_em")
+        bars = self._daily_bars(symbol)
+        bars = bars.loc[pd.Timestamp(start_date):pd.Timestamp(end_date)]
+        df = bars.drop(columns="factor")
+        if adjust == "hfq":
+            df[["开盘", "收盘", "最高", "最低"]] = df[["开盘", "收盘", "最高", "最低"]].mul(bars["factor"], axis=0).round(3)
+        elif adjust == "qfq":
+            ratio = bars["factor"] / bars["factor"].iloc[-1] if len(bars) else 1.0
+            df[["开盘", "收盘", "最高", "最低"]] = df[["开盘", "收盘", "最高", "最低"]].mul(ratio, axis=0).round(3)
+        df.insert(0, "日期", df.index.date)
+        return df.reset_index(drop=True)
+
+    def fund_etf_hist_min_em(self, symbol, period="1", adjust="", start_date=None, end_date=None):
+        self._request("fund_etf_hist_min_em")
+        bars = self._daily_bars(symbol).iloc[-5:]
+        rng = self._rng("minute", symbol, bars.index[-1])
+        frames = []
+        for day, row in bars.iterrows():
+            minutes = (list(pd.date_range(day + timedelta(hours=9, minutes=31), periods=120, freq="min"))
+                       + list(pd.date_range(day + timedelta(hours=13, minutes=1), periods=120, freq="min")))
+            close = row["开盘"] * np.exp(np.cumsum(rng.normal(0, 0.001, len(minutes))))
+            open_ = np.concatenate([[row["开盘"]], close[:-1]])
+            frames.append(pd.DataFrame({
+                "时间": [m.strftime("%Y-%m-%d %H:%M:%S") for m in minutes], "开盘": open_, "收盘": close,
+                "最高": np.maximum(open_, close) * 1.0005, "最低": np.minimum(open_, close) * 0.9995,
+                "成交量": rng.integers(100, 50_000, len(minutes)),
+            }))
+        return pd.concat(frames, ignore_index=True).round(3)
+
+    def fund_etf_spot_em(self):
+        self._request("fund_etf_spot_em")
+        rng = self._rng("spot", self.days[-1])
+        codes = list(self.etfs)
+        return pd.DataFrame({"代码": codes, "名称": [self.etfs[c] for c in codes],
+                             "最新价": [self._daily_bars(c)["收盘"].iloc[-1] for c in codes],
+                             "成交额": rng.lognormal(17, 1.5, len(codes)).round(0)})
+
+    def stock_sector_fund_flow_rank(self, indicator="今日", sector_type="行业资金流"):
+        self._request("stock_sector_fund_flow_rank")
+        rng = self._rng("rank", indicator, sector_type, self.days[-1])
+        n = len(self.sectors)
+        flow = rng.normal(0, 5e8, n)
+        df = pd.DataFrame({"名称": self.sectors, f"{indicator}涨跌幅": rng.normal(0, 2, n).round(2),
+                           f"{indicator}主力净流入-净额": flow, f"{indicator}主力净流入-净占比": rng.normal(0, 3, n).round(2),
+                           f"{indicator}超大单净流入-净额": flow * 0.6})
+        df = df.sort_values(f"{indicator}主力净流入-净额", ascending=False).reset_index(drop=True)
+        df.insert(0, "序号", range(1, n + 1))
+        return df
+
+    def _sector_flow_hist(self, endpoint, symbol):
+        self._request(endpoint)
+        days = self.days[-120:]
+        rng = self._rng(endpoint, symbol)
+        flow = rng.normal(0, 3e8, len(days))
+        return pd.DataFrame({"日期": days.date, "主力净流入-净额": flow, "主力净流入-净占比": rng.normal(0, 3, len(days)),
+                             "超大单净流入-净额": flow * 0.6})
+
+    def stock_sector_fund_flow_hist(self, symbol):
+        return self._sector_flow_hist("stock_sector_fund_flow_hist", symbol)
+
+    def stock_concept_fund_flow_hist(self, symbol):
+        return self._sector_flow_hist("stock_concept_fund_flow_hist", symbol)
+
+    def tool_trade_date_hist_sina(self):
+        self._request("tool_trade_date_hist_sina")
+        return pd.DataFrame({"trade_date": pd.bdate_range(HISTORY_START, f"{datetime.now().year}-12-31").date})
+
+
+FAKE_ENDPOINTS = ("fund_etf_hist_em", "fund_etf_hist_min_em", "fund_etf_spot_em", "stock_sector_fund_flow_rank",
+                  "stock_sector_fund_flow_hist", "stock_concept_fund_flow_hist", "tool_trade_date_hist_sina")
+
+
+def install_fake_provider(provider, data_dir):
+    """
+    把 akshare 接口替换为 provider 的同名方法，并把各模块的本地数据目录指向 data_dir。
+    必须在导入页面用到的模块之前调用 (sector_flow_panel 在导入时保存了接口函数的引用)。
+    """
+    import akshare as ak
+    for name in FAKE_ENDPOINTS:
+        setattr(ak, name, getattr(provider, name))
+
+    import etf_bars
+    import scan_snapshots
+    import sector_flow_panel
+    import trade_calendar
+    etf_bars.bar_store.data_dir = os.path.join(data_dir, "bars")
+    sector_flow_panel.DATA_DIR = data_dir
+    trade_calendar.CALENDAR_PATH = os.path.join(data_dir, "trade_calendar.parquet")
+    scan_snapshots.SCANS_DIR = os.path.join(data_dir, "scans")
+
+
+def share_test_runtime():
+    """
+    AppTest 每次运行时设置全局的 Runtime._instance，运行结束后清空，多个会话在不同线程同时运行时会互相清掉。
+    改为所有会话共用同一个测试 Runtime (媒体文件和缓存存储在会话间共享，与真实服务进程一致)。
+    """
+    from unittest.mock import MagicMock
+    from streamlit.runtime import Runtime
+    from streamlit.runtime.caching.storage.dummy_cache_storage import MemoryCacheStorageManager
+    from streamlit.runtime.media_file_manager import MediaFileManager
+    from streamlit.runtime.memory_media_file_storage import MemoryMediaFileStorage
+    runtime = MagicMock(spec=Runtime)
+    runtime.media_file_mgr = MediaFileManager(MemoryMediaFileStorage("/mock/media"))
+    runtime.cache_storage_manager = MemoryCacheStorageManager()
+    Runtime.instance = classmethod(lambda cls: runtime)
+    Runtime.exists = classmethod(lambda cls: True)
+
+
+# --- 页面与操作 ---
+# 每个页面: (页面文件, 页面访问权重, 进入页面后的初始操作, [(动作权重, 动作名, 动作函数)])
+# 动作函数接收 (AppTest, random.Random)，返回待运行的控件 (调用方负责 .run() 并计时)；当前页面上没有该控件时返回 None。
+def _pick(rng, options):
+    return options[rng.randrange(len(options))]
+
+
+def _keyed(at, kind, key):
+    widgets = [w for w in getattr(at, kind) if w.key == key]
+    return widgets[0] if widgets else None
+
+
+def _select(at, key, rng, values=None):
+    """随机选择一项。带 format_func 的选择框需要传入实际选项值 values (AppTest 只能拿到格式化后的文字)。"""
+    widget = _keyed(at, "selectbox", key)
+    if widget is None:
+        return None
+    return widget.set_value(_pick(rng, values)) if values else widget.select_index(rng.randrange(len(widget.options)))
+
+
+def _radio(at, key, rng):
+    widget = _keyed(at, "radio", key)
+    return widget.set_value(_pick(rng, widget.options)) if widget else None
+
+
+def _slide(at, key, rng, low, high, step=1):
+    widget = _keyed(at, "slider", key)
+    return widget.set_value(rng.randrange(low, high + 1, step)) if widget else None
+
+
+def _click(at, key):
+    widget = _keyed(at, "button", key)
+    return widget.click() if widget and not widget.disabled else None
+
+
+def _page1_indicator(at, rng):
+    return at.sidebar.selectbox[0].select_index(rng.randrange(len(at.sidebar.selectbox[0].options)))
+
+
+def _page1_mapped(at, rng):
+    return at.sidebar.checkbox[0].set_value(not at.sidebar.checkbox[0].value)
+
+
+def _page2_industry(at, rng):
+    widget = at.sidebar.selectbox[0]
+    return widget.select_index(rng.randrange(1, len(widget.options)))
+
+
+def _page3_code(at, rng):
+    from etf_industry_map import ETF_INDUSTRY_MAPPINGS, ETF_SELECT_MAPPINGS
+    codes = list(ETF_INDUSTRY_MAPPINGS.values()) + list(ETF_SELECT_MAPPINGS.values())
+    return _keyed(at, "text_input", "etf_code_input_kline").set_value(_pick(rng, codes))
+
+
+def _page3_adjust(at, rng):
+    from etf_bars import ADJUST_MODES
+    return _select(at, "adjust_k", rng, values=list(ADJUST_MODES))
+
+
+def _page3_indicators(at, rng):
+    widget = _keyed(at, "multiselect", "indicators_k")
+    return widget.set_value(rng.sample(widget.options, rng.randint(0, 3))) if widget else None
+
+
+def _page4_source(at, rng):
+    widget = _keyed(at, "radio", "etf_source_choice")
+    # 全市场扫描成本高，访问频率低于自选列表
+    return widget.set_value(rng.choices(widget.options, weights=[5, 4, 1])[0])
+
+
+def _page7_date(at, rng):
+    widget = _keyed(at, "select_slider", "rs_date")
+    return widget.set_value(pd.Timestamp(_pick(rng, widget.options))) if widget else None
+
+
+SCENARIOS = {
+    "1": ("1_realtime_flow.py", 3, None, [
+        (3, "切换时间维度", _page1_indicator),
+        (1, "仅显示已映射板块", _page1_mapped),
+    ]),
+    "2": ("2_historical_analysis.py", 2, _page2_industry, [
+        (3, "切换行业", _page2_industry),
+    ]),
+    "3": ("3_ETF_Kline.py", 4, _page3_code, [
+        (3, "切换ETF", _page3_code),
+        (3, "切换K线周期", lambda at, rng: _select(at, "timeframe_k", rng)),
+        (1, "切换复权方式", _page3_adjust),
+        (2, "选择附加指标", _page3_indicators),
+        (2, "调整ATR周期", lambda at, rng: _slide(at, "atr_p_k", rng, 5, 50)),
+        (1, "调整ATR倍数", lambda at, rng: _select(at, "atr_m_k", rng)),
+    ]),
+    "4": ("4_ETF_Extremum_Proximity.py", 2, _page4_source, [
+        (3, "开始批量分析", lambda at, rng: _click(at, "analyze_extremes_btn")),
+        (1, "切换ETF列表", _page4_source),
+        (1, "调整ATR周期", lambda at, rng: _slide(at, "atr_period_prox_batch", rng, 5, 50)),
+        (2, "切换展示方式", lambda at, rng: _radio(at, "display_mode_choice", rng)),
+    ]),
+    "5": ("5_ATR_Stop_Backtest.py", 1, None, [
+        (2, "开始回测", lambda at, rng: _click(at, "bt_run")),
+        (2, "切换热力图指标", lambda at, rng: _select(at, "bt_metric", rng)),
+        (1, "切换明细参数", lambda at, rng: _select(at, "bt_detail_period", rng)),
+    ]),
+    "6": ("6_Sector_Flow_Heatmap.py", 2, None, [
+        (2, "切换累计窗口", lambda at, rng: _select(at, "heatmap_window", rng)),
+        (2, "调整显示天数", lambda at, rng: _slide(at, "heatmap_days", rng, 10, 250, step=5)),
+        (1, "切换排序", lambda at, rng: _radio(at, "heatmap_sort", rng)),
+        (1, "切换板块类型", lambda at, rng: _radio(at, "heatmap_sector_type", rng)),
+    ]),
+    "7": ("7_Relative_Strength.py", 2, None, [
+        (2, "切换ETF列表", lambda at, rng: _radio(at, "rs_etf_source", rng)),
+        (1, "切换对比天数", lambda at, rng: _select(at, "rs_compare_days", rng)),
+        (3, "切换排名日期", _page7_date),
+    ]),
+}
+
+
+# --- 统计 ---
+class Recorder:
+    """按 (页面, 动作) 记录每次重跑耗时和错误。"""
+
+    def __init__(self):
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(int)
+        self.error_samples = {}
+        self._lock = threading.Lock()
+
+    def record(self, page, action, seconds, error=None):
+        with self._lock:
+            self.latencies[(page, action)].append(seconds)
+            if error:
+                self.errors[(page, action)] += 1
+                self.error_samples.setdefault((page, action), error)
+
+    def summary(self):
+        rows = []
+        with self._lock:
+            for (page, action), values in sorted(self.latencies.items()):
+                values = np.asarray(values)
+                p50, p90, p99 = np.percentile(values, [50, 90, 99])
+                rows.append({"页面": page, "动作": action, "次数": len(values), "错误": self.errors[(page, action)],
+                             "p50": p50, "p90": p90, "p99": p99, "最大": values.max()})
+            everything = np.concatenate([np.asarray(v) for v in self.latencies.values()]) if self.latencies else None
+        total = None
+        if everything is not None:
+            p50, p90, p99 = np.percentile(everything, [50, 90, 99])
+            total = {"次数": len(everything), "错误": sum(self.errors.values()),
+                     "p50": p50, "p90": p90, "p99": p99, "最大": everything.max()}
+        return rows, total
+
+
+def _rss_mb():
+    """当前常驻内存 (MB)；没有 psutil 时返回进程至今的峰值。"""
+    if psutil is not None:
+        return psutil.Process().memory_info().rss / 2**20
+    if resource is not None:
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak / 2**20 if sys.platform == "darwin" else peak / 1024
+    return None
+
+
+class ResourceSampler(threading.Thread):
+    """定期采样进程 CPU 占用 (占单核的百分比，多线程时可超过100) 和内存。"""
+
+    def __init__(self, interval=1.0):
+        super().__init__(daemon=True)
+        self.interval = interval
+        self.cpu = []
+        self.rss = []
+        self._stop_event = threading.Event()
+
+    def run(self):
+        last_wall, last_cpu = time.perf_counter(), time.process_time()
+        while not self._stop_event.wait(self.interval):
+            wall, cpu = time.perf_counter(), time.process_time()
+            self.cpu.append((cpu - last_cpu) / (wall - last_wall) * 100)
+            last_wall, last_cpu = wall, cpu
+            rss = _rss_mb()
+            if rss is not None:
+                self.rss.append(rss)
+
+    def stop(self):
+        self._stop_event.set()
+        self.join()
+
+    def summary(self):
+        cpu = np.asarray(self.cpu) if self.cpu else np.zeros(1)
+        return {"CPU均值(%)": cpu.mean(), "CPU峰值(%)": cpu.max(),
+                "内存起始(MB)": self.rss[0] if self.rss else None, "内存峰值(MB)": max(self.rss) if self.rss else None,
+                "内存来源": "psutil" if psutil is not None else "ru_maxrss (峰值)"}
+
+
+# --- 会话 ---
+def _timed_run(recorder, page, action, target, timeout):
+    """运行一次并计时，返回运行后的 AppTest (失败时返回 None)。"""
+    start = time.perf_counter()
+    try:
+        at = target.run(timeout=timeout)
+    except Exception as e:
+        recorder.record(page, action, time.perf_counter() - start, f"{type(e).__name__}: {e}")
+        return None
+    error = "; ".join(str(exc.message) for exc in at.exception) if len(at.exception) else None
+    recorder.record(page, action, time.perf_counter() - start, error)
+    return at
+
+
+def run_session(session_id, pages, deadline, recorder, think_time, actions_per_visit, timeout, seed):
+    """一个模拟用户: 按权重选择页面，打开后做若干次操作 (每次操作之间停顿)，直到 deadline。"""
+    from streamlit.testing.v1 import AppTest
+    rng = random.Random(seed * 1000 + session_id)
+    weights = [SCENARIOS[p][1] for p in pages]
+    while time.time() < deadline:
+        page = rng.choices(pages, weights=weights)[0]
+        script, _, setup, actions = SCENARIOS[page]
+        at = _timed_run(recorder, page, "打开页面", AppTest.from_file(os.path.join(PAGES_DIR, script),
+                                                                    default_timeout=timeout), timeout)
+        if at is not None and setup is not None:
+            at = _timed_run(recorder, page, "初始操作", setup(at, rng), timeout)
+        for _ in range(rng.randint(*actions_per_visit)):
+            if at is None or time.time() >= deadline:
+                break
+            time.sleep(rng.expovariate(1 / think_time) if think_time > 0 else 0)
+            _, name, action = rng.choices(actions, weights=[a[0] for a in actions])[0]
+            try:
+                target = action(at, rng)
+            except Exception as e:
+                recorder.record(page, name, 0.0, f"无法操作控件: {type(e).__name__}: {e}")
+                continue
+            if target is not None:
+                at = _timed_run(recorder, page, name, target, timeout) or at
+
+
+# --- 报告 ---
+def _format_report(args, rows, total, resources, provider, elapsed):
+    lines = [f"并发会话 {args.sessions}，持续 {elapsed:.0f} 秒，上游延迟 {args.latency}s，失败率 {args.error_rate:.0%}，"
+             f"页面 {','.join(args.pages)}", ""]
+    header = f"{'页面':<4}{'动作':<14}{'次数':>6}{'错误':>6}{'p50(s)':>9}{'p90(s)':>9}{'p99(s)':>9}{'最大(s)':>9}"
+    lines.append(header)
+    for row in rows + ([dict(total, 页面="全部", 动作="")] if total else []):
+        lines.append(f"{row['页面']:<4}{row['动作']:<14}{row['次数']:>6}{row['错误']:>6}"
+                     f"{row['p50']:>9.3f}{row['p90']:>9.3f}{row['p99']:>9.3f}{row['最大']:>9.3f}")
+    if total:
+        lines.append(f"吞吐: {total['次数'] / elapsed:.2f} 次重跑/秒")
+    lines.append("")
+    lines.append("资源: " + "，".join(f"{k} {v:.1f}" if isinstance(v, float) else f"{k} {v}"
+                                      for k, v in resources.items()))
+    lines.append("上游请求: " + "，".join(f"{k} {v}" for k, v in sorted(provider.calls.items())))
+    return "\n".join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Streamlit 页面多会话并发压测 (本地假行情数据)")
+    parser.add_argument("--sessions", type=int, default=8, help="并发会话数")
+    parser.add_argument("--duration", type=float, default=60, help="压测时长 (秒)")
+    parser.add_argument("--ramp", type=float, default=5, help="会话在该时间内逐个启动 (秒)")
+    parser.add_argument("--latency", type=float, default=0.2, help="每次上游请求的平均延迟 (秒)")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="上游请求随机失败的比例")
+    parser.add_argument("--pages", default=",".join(SCENARIOS), help="参与压测的页面编号，逗号分隔")
+    parser.add_argument("--think-time", type=float, default=1.0, help="两次操作之间的平均停顿 (秒，指数分布)")
+    parser.add_argument("--actions", default="3,8", help="每次访问页面的操作次数范围，如 3,8")
+    parser.add_argument("--timeout", type=float, default=180, help="单次重跑的超时 (秒)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--report", help="把结果另存为 JSON 文件")
+    args = parser.parse_args()
+    args.pages = [p.strip() for p in args.pages.split(",") if p.strip()]
+    unknown = [p for p in args.pages if p not in SCENARIOS]
+    if unknown:
+        parser.error(f"未知页面: {unknown}，可选 {list(SCENARIOS)}")
+    actions_per_visit = tuple(int(n) for n in args.actions.split(","))
+
+    sys.path.insert(0, ROOT)
+    random.seed(args.seed)
+    data_dir = tempfile.mkdtemp(prefix="etf_load_test_")
+    provider = FakeMarketData(args.latency, args.error_rate, args.seed)
+    install_fake_provider(provider, data_dir)
+    share_test_runtime()
+
+    recorder = Recorder()
+    sampler = ResourceSampler()
+    sampler.start()
+    started = time.time()
+    deadline = started + args.ramp + args.duration
+    threads = []
+    for i in range(args.sessions):
+        thread = threading.Thread(target=run_session, daemon=True, name=f"session-{i}",
+                                  args=(i, args.pages, deadline, recorder, args.think_time, actions_per_visit,
+                                        args.timeout, args.seed))
+        thread.start()
+        threads.append(thread)
+        if args.sessions > 1:
+            time.sleep(args.ramp / (args.sessions - 1))
+    for thread in threads:
+        thread.join()
+    elapsed = time.time() - started
+    sampler.stop()
+    shutil.rmtree(data_dir, ignore_errors=True)
+
+    rows, total = recorder.summary()
+    resources = sampler.summary()
+    print(_format_report(args, rows, total, resources, provider, elapsed))
+    if recorder.error_samples:
+        print("\n错误示例:")
+        for (page, action), message in sorted(recorder.error_samples.items()):
+            print(f"  [{page} {action}] {message[:200]}")
+    if args.report:
+        with open(args.report, "w", encoding="utf-8") as f:
+            json.dump({"参数": vars(args), "耗时(秒)": elapsed, "操作": rows, "汇总": total, "资源": resources,
+                       "上游请求": dict(provider.calls),
+                       "错误示例": {f"{p} {a}": m for (p, a), m in recorder.error_samples.items()}},
+                      f, ensure_ascii=False, indent=2, default=float)
+
+
+if __name__ == "__main__":
+    main()
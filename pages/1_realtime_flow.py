@@ -1,6 +1,8 @@
 # pages/1_Realtime_Flow.py
 import streamlit as st
 import akshare as ak
+from resilient_fetch import resilient_call # 带重试/合并/熔断的上游请求封装
+from swr_cache import swr_cache, clear_swr_caches, describe_entry # 过期后先返回旧数据再后台刷新
 import pandas as pd
 
 # 尝试从项目根目录的 etf_industry_map.py 导入 (假设 streamlit run 从项目根目录运行)
@@ -39,11 +41,11 @@ show_mapped_only = st.sidebar.checkbox(
 )
 
 # --- 数据获取与显示 ---
-@st.cache_data(ttl=300) # 缓存数据5分钟
+@swr_cache(soft_ttl=300, hard_ttl=3600) # 5分钟后后台刷新，超过1小时才同步重新获取
 def fetch_realtime_flow_data(indicator):
-    """获取实时板块资金流数据"""
+    """获取实时板块资金流数据，返回 (DataFrame, 错误信息)。"""
     try:
-        df = ak.stock_sector_fund_flow_rank(indicator=indicator)
+        df = resilient_call(ak.stock_sector_fund_flow_rank, indicator=indicator)
         # 数据清洗和格式化 (例如，将金额从元转换为亿元)
         amount_cols = [col for col in df.columns if '净额' in col or '金额' in col]
         for col in amount_cols:
@@ -51,14 +53,15 @@ def fetch_realtime_flow_data(indicator):
                 df[col] = (df[col] / 1e8).round(3)
         # 你可以根据需要重命名列名，使其更易读
         # df.rename(columns={'old_name': '新名称'}, inplace=True)
-        return df
+        return df, None
     except Exception as e:
-        st.error(f"获取数据失败 ({indicator}): {e}")
-        return pd.DataFrame()
+        return pd.DataFrame(), f"获取数据失败 ({indicator}): {e}"
 
 st.markdown(f"### {selected_indicator_display}板块资金流向排名")
 
-df_flow_raw = fetch_realtime_flow_data(ak_indicator_param)
+df_flow_raw, flow_error = fetch_realtime_flow_data(ak_indicator_param)
+if flow_error:
+    st.error(flow_error)
 
 if not df_flow_raw.empty:
     df_to_display = df_flow_raw.copy() # 创建副本进行操作
@@ -89,7 +92,7 @@ if not df_flow_raw.empty:
     # 移除之前的高亮逻辑，直接显示DataFrame
     if not df_to_display.empty:
         st.dataframe(df_to_display.reset_index(drop=True), use_container_width=True, height=600, hide_index=True)
-        st.caption(f"数据说明：金额单位已转换为“亿元”。")
+        st.caption(f"数据说明：金额单位已转换为“亿元”。{describe_entry(fetch_realtime_flow_data.entry_info(ak_indicator_param))}")
         if show_mapped_only:
             st.caption(f"当前仅显示 {len(df_to_display)} 个已配置ETF的板块。共有 {len(mapped_industries)} 个已配置的映射。")
         else:
@@ -107,4 +110,5 @@ else:
 # 添加一个刷新按钮
 if st.sidebar.button("🔄 刷新数据"):
     st.cache_data.clear() # 清除缓存，以便下次获取最新数据
+    clear_swr_caches()
     st.rerun()
\ No newline at end of file
@@ -1,10 +1,15 @@
 # pages/2_Historical_Analysis.py
 import streamlit as st
 import akshare as ak
+from resilient_fetch import resilient_call # 带重试/合并/熔断的上游请求封装
+from etf_bars import bar_store # 本地不复权K线 + 复权因子
+from swr_cache import swr_cache, clear_swr_caches, describe_entry # 过期后先返回旧数据再后台刷新
+from figure_cache import figure_cache, data_fingerprint # 图表缓存，避免无关控件触发整图重建
+from trade_calendar import trading_days, trading_days_ago # A股交易日历
 import pandas as pd
 import plotly.graph_objects as go
 from plotly.subplots import make_subplots
-from datetime import datetime, timedelta
+from datetime import datetime
 
 # 尝试从同级目录导入映射 (如果 streamlit run 从项目根目录运行)
 try:
@@ -44,7 +49,7 @@ if selected_industry:
 
 # 日期范围选择
 default_end_date = datetime.now()
-default_start_date = default_end_date - timedelta(days=365) # 默认一年
+default_start_date = trading_days_ago(250).date() # 默认近250个交易日 (约一年)
 
 start_date_input = st.sidebar.date_input("开始日期", default_start_date)
 end_date_input = st.sidebar.date_input("结束日期", default_end_date)
@@ -55,24 +60,20 @@ end_date_str = end_date_input.strftime('%Y%m%d')
 
 
 # --- 数据获取 ---
-@st.cache_data(ttl=3600) # 缓存数据1小时
+@swr_cache(soft_ttl=3600, hard_ttl=86400) # 1小时后后台刷新，超过1天才同步重新获取
 def fetch_etf_history(etf_code_param, start, end):
-    """获取ETF历史行情"""
+    """获取ETF前复权历史行情 (由本地不复权K线和复权因子生成)，返回 (DataFrame, 错误信息)。"""
     try:
-        # fund_etf_hist_em 获取的是ETF历史行情
-        df = ak.fund_etf_hist_em(symbol=etf_code_param, period="daily", start_date=start, end_date=end, adjust="qfq")
-        if df.empty:
-            return pd.DataFrame()
-        # df['日期'] = pd.to_datetime(df['日期'])
-        df.set_index('日期', inplace=True)
-        # AkShare 返回的列名是中文，Plotly K线图需要 'Open', 'High', 'Low', 'Close'
-        df.rename(columns={'开盘': 'Open', '最高': 'High', '最低': 'Low', '收盘': 'Close', '成交量': 'Volume'}, inplace=True)
-        return df[['Open', 'High', 'Low', 'Close', 'Volume']]
+        df, error = bar_store.get_bars(etf_code_param, start, end, adjust="qfq")
+        if error:
+            return pd.DataFrame(), error
+        # 资金流数据的索引是 date 对象，K线索引保持一致，保证两个子图的分类X轴对齐
+        df.index = df.index.date
+        return df, None
     except Exception as e:
-        st.error(f"获取ETF {etf_code_param} 行情失败: {e}")
-        return pd.DataFrame()
+        return pd.DataFrame(), f"获取ETF {etf_code_param} 行情失败: {e}"
 
-@st.cache_data(ttl=3600)
+@swr_cache(soft_ttl=3600, hard_ttl=86400)
 def fetch_industry_flow_history(industry_name_param):
     """
     获取行业历史资金流。
@@ -81,13 +82,12 @@ def fetch_industry_flow_history(industry_name_param):
     `stock_board_fund_flow_hist_em` 可获取板块成分股资金流汇总历史。
     你需要根据 `industry_name_param` 找到对应的板块代码 (e.g., "BK0475" for 半导体).
     这个映射可能需要额外维护。
+    返回 (DataFrame, 错误信息)。
     """
-    st.info(f"正在尝试获取“{industry_name_param}”板块的历史资金流。这可能需要板块代码。")
-    
     try:
-        df = ak.stock_sector_fund_flow_hist(symbol=industry_name_param)
+        df = resilient_call(ak.stock_sector_fund_flow_hist, symbol=industry_name_param)
         if df.empty:
-            return pd.DataFrame()
+            return pd.DataFrame(), f"行业“{industry_name_param}”无历史资金流数据。"
         # df['日期'] = pd.to_datetime(df['日期'])
         df.set_index('日期', inplace=True)
         # 数据清洗和格式化 (例如，将金额从元转换为亿元)
@@ -96,10 +96,82 @@ def fetch_industry_flow_history(industry_name_param):
             if df[col].dtype in ['float64', 'int64']:
                 df[col] = (df[col] / 1e8).round(3)
         df.rename(columns={'主力净流入-净额': '主力净流入亿元'}, inplace=True)
-        return df
+        return df, None
     except Exception as e:
-        st.error(f"获取行业“{industry_name_param}”历史资金流失败: {e}")
-        return pd.DataFrame()
+        return pd.DataFrame(), f"获取行业“{industry_name_param}”历史资金流失败: {e}"
+
+
+# --- 绘图 ---
+def build_flow_comparison_figure(df_etf_hist, df_industry_flow, etf_code, industry_name):
+    """构建ETF K线与行业主力资金流对比图，结果按数据指纹缓存。"""
+    # 两个子图共用按交易日历生成的分类X轴: 缺数据的交易日留空，日期顺序不受某一组数据缺失的影响
+    axis_days = trading_days(min(df_etf_hist.index[0], df_industry_flow.index[0]),
+                             max(df_etf_hist.index[-1], df_industry_flow.index[-1])).date
+    df_etf_hist = df_etf_hist.reindex(axis_days)
+    df_industry_flow = df_industry_flow.reindex(axis_days)
+    fig = make_subplots(rows=2, cols=1, shared_xaxes=True,
+                        vertical_spacing=0.1, row_heights=[0.7, 0.3],
+                        specs=[[{"secondary_y": True}],  # MODIFIED: 为第一个子图指定次Y轴
+                               [{"secondary_y": False}]])
+
+    # 1. ETF K线图
+    fig.add_trace(go.Candlestick(x=df_etf_hist.index,
+                                 open=df_etf_hist['Open'],
+                                 high=df_etf_hist['High'],
+                                 low=df_etf_hist['Low'],
+                                 close=df_etf_hist['Close'],
+                                 name=f'{etf_code} K线',
+                                 increasing_line_color='red',  # MODIFIED: 上涨红色
+                                 decreasing_line_color='green' # MODIFIED: 下跌绿色
+                                ),
+                  row=1, col=1)
+
+    # 将成交量柱状图添加到第一个子图的次Y轴
+    fig.add_trace(go.Bar(x=df_etf_hist.index,
+                         y=df_etf_hist['Volume'],
+                         name='成交量',
+                         marker_color='rgba(100,100,100,0.4)'),
+                  secondary_y=True, row=1, col=1) # secondary_y=True
+
+    # 为第一个子图的主Y轴和次Y轴设置标题
+    # Plotly 会自动命名次Y轴为 yaxis2, yaxis3 等，取决于它在哪个子图和是第几个次轴
+    # 对于 subplot(row=1, col=1) 的第一个次Y轴，它通常是 'yaxis2'
+    # 如果不确定，可以先不设置 fig.update_layout 中的 yaxis2_title，
+    # 而是用 fig.update_yaxes(title_text="成交量", secondary_y=True, row=1, col=1)
+    fig.update_yaxes(title_text=f'{etf_code} 价格', secondary_y=False, row=1, col=1)
+    fig.update_yaxes(title_text="成交量", secondary_y=True, row=1, col=1, showgrid=False)
+
+
+    # 2. 行业资金流柱状图 (这个子图不需要次Y轴)
+    if not df_industry_flow.empty and '主力净流入亿元' in df_industry_flow.columns:
+        colors = ['red' if val >= 0 else 'green' for val in df_industry_flow['主力净流入亿元']]
+        fig.add_trace(go.Bar(x=df_industry_flow.index,
+                             y=df_industry_flow['主力净流入亿元'],
+                             name='主力资金净流入(亿元)',
+                             marker_color=colors),
+                      row=2, col=1) # 这个子图没有 secondary_y=True
+        fig.update_yaxes(title_text="资金净流入(亿元)", row=2, col=1) # 为第二个子图的Y轴设置标题
+
+    fig.update_layout(
+        height=700,
+        title_text=f"{industry_name} ({etf_code}) 与 主力资金流向",
+        xaxis_rangeslider_visible=False,
+        legend_orientation="h",
+        legend_yanchor="bottom",
+        legend_y=1.02,
+        legend_xanchor="right",
+        legend_x=1
+    )
+    # 确保K线图的x轴标签显示 (通常默认会显示，但显式设置无害)
+    fig.update_xaxes(type='category', # 分类轴只包含交易日，不会出现周末和节假日的空档
+                    nticks=12, # 或者建议显示12个左右的刻度，让Plotly自动找合适月份
+                    showticklabels=True, row=1, col=1)
+    # 最后一个子图（资金流图）显示x轴标题
+    fig.update_xaxes(title_text="日期",
+                     type='category', # 确保底部X轴标签与K线图对齐
+                     nticks=12,
+                     row=2, col=1)
+    return fig
 
 
 # --- 主区域显示 ---
@@ -109,91 +181,47 @@ if not etf_code:
 else:
     st.markdown(f"### 行业: {selected_industry} (ETF: {etf_code})")
 
-    df_industry_flow = fetch_industry_flow_history(selected_industry)
-    start_date_str = df_industry_flow.index[0].strftime('%Y%m%d')
-    end_date_str = df_industry_flow.index[-1].strftime('%Y%m%d')
-    df_etf_hist = fetch_etf_history(etf_code, start_date_str, end_date_str)
-    st.markdown(f"日期范围: {start_date_str} 到 {end_date_str}")
+    if fetch_industry_flow_history.entry_info(selected_industry) is None:
+        st.info(f"正在尝试获取“{selected_industry}”板块的历史资金流。这可能需要板块代码。")
+    df_industry_flow, flow_error = fetch_industry_flow_history(selected_industry)
+    if flow_error:
+        st.error(flow_error)
+        df_etf_hist = pd.DataFrame()
+    else:
+        start_date_str = df_industry_flow.index[0].strftime('%Y%m%d')
+        end_date_str = df_industry_flow.index[-1].strftime('%Y%m%d')
+        df_etf_hist, etf_error = fetch_etf_history(etf_code, start_date_str, end_date_str)
+        if etf_error:
+            st.error(etf_error)
+        st.markdown(f"日期范围: {start_date_str} 到 {end_date_str}")
+        st.caption(f"资金流{describe_entry(fetch_industry_flow_history.entry_info(selected_industry))} "
+                   f"ETF行情{describe_entry(fetch_etf_history.entry_info(etf_code, start_date_str, end_date_str))}")
     
 
     if df_etf_hist.empty or df_industry_flow.empty:
         st.warning("未能加载ETF历史行情数据或行业资金流数据。") # 修改了提示信息
     else:
         # --- 绘图 ---
-        fig = make_subplots(rows=2, cols=1, shared_xaxes=True,
-                            vertical_spacing=0.1, row_heights=[0.7, 0.3],
-                            specs=[[{"secondary_y": True}],  # MODIFIED: 为第一个子图指定次Y轴
-                                   [{"secondary_y": False}]])
-
-        # 1. ETF K线图
-        fig.add_trace(go.Candlestick(x=df_etf_hist.index,
-                                     open=df_etf_hist['Open'],
-                                     high=df_etf_hist['High'],
-                                     low=df_etf_hist['Low'],
-                                     close=df_etf_hist['Close'],
-                                     name=f'{etf_code} K线',
-                                     increasing_line_color='red',  # MODIFIED: 上涨红色
-                                     decreasing_line_color='green' # MODIFIED: 下跌绿色
-                                    ),
-                      row=1, col=1)
-
-        # 将成交量柱状图添加到第一个子图的次Y轴
-        fig.add_trace(go.Bar(x=df_etf_hist.index,
-                             y=df_etf_hist['Volume'],
-                             name='成交量',
-                             marker_color='rgba(100,100,100,0.4)'),
-                      secondary_y=True, row=1, col=1) # secondary_y=True
-
-        # 为第一个子图的主Y轴和次Y轴设置标题
-        # Plotly 会自动命名次Y轴为 yaxis2, yaxis3 等，取决于它在哪个子图和是第几个次轴
-        # 对于 subplot(row=1, col=1) 的第一个次Y轴，它通常是 'yaxis2'
-        # 如果不确定，可以先不设置 fig.update_layout 中的 yaxis2_title，
-        # 而是用 fig.update_yaxes(title_text="成交量", secondary_y=True, row=1, col=1)
-        fig.update_yaxes(title_text=f'{etf_code} 价格', secondary_y=False, row=1, col=1)
-        fig.update_yaxes(title_text="成交量", secondary_y=True, row=1, col=1, showgrid=False)
-
-
-        # 2. 行业资金流柱状图 (这个子图不需要次Y轴)
-        if not df_industry_flow.empty and '主力净流入亿元' in df_industry_flow.columns:
+        has_flow_column = '主力净流入亿元' in df_industry_flow.columns
+        if has_flow_column:
             # 确保 '主力净流入亿元' 列是数值类型，以防万一
             df_industry_flow['主力净流入亿元'] = pd.to_numeric(df_industry_flow['主力净流入亿元'], errors='coerce')
             df_industry_flow.dropna(subset=['主力净流入亿元'], inplace=True) # 移除无法转换的行
-
-            colors = ['red' if val >= 0 else 'green' for val in df_industry_flow['主力净流入亿元']]
-            fig.add_trace(go.Bar(x=df_industry_flow.index,
-                                 y=df_industry_flow['主力净流入亿元'],
-                                 name='主力资金净流入(亿元)',
-                                 marker_color=colors),
-                          row=2, col=1) # 这个子图没有 secondary_y=True
-            fig.update_yaxes(title_text="资金净流入(亿元)", row=2, col=1) # 为第二个子图的Y轴设置标题
-        else:
+        if df_industry_flow.empty or not has_flow_column:
             st.info("无行业历史资金流数据可供绘制或数据格式不符。")
 
-        fig.update_layout(
-            height=700,
-            title_text=f"{selected_industry} ({etf_code}) 与 主力资金流向",
-            xaxis_rangeslider_visible=False,
-            legend_orientation="h",
-            legend_yanchor="bottom",
-            legend_y=1.02,
-            legend_xanchor="right",
-            legend_x=1
-        )
-        # 确保K线图的x轴标签显示 (通常默认会显示，但显式设置无害)
-        fig.update_xaxes(type='category', # 使用category类型可以帮助更好地处理非连续日期
-                        rangebreaks=[dict(bounds=["sat", "sun"])], # 隐藏周末
-                        nticks=12, # 或者建议显示12个左右的刻度，让Plotly自动找合适月份
-                        showticklabels=True, row=1, col=1)
-        # 最后一个子图（资金流图）显示x轴标题
-        fig.update_xaxes(title_text="日期",
-                         type='category', # 确保底部X轴标签与K线图对齐且处理非交易日
-                         rangebreaks=[dict(bounds=["sat", "sun"])],
-                         nticks=12,
-                         row=2, col=1)
-
+        # 图表只依赖K线和主力净流入两组数据，其它控件引起的重跑直接复用缓存
+        figure_key = ("flow_compare",
+                      data_fingerprint(df_etf_hist, df_industry_flow['主力净流入亿元'] if has_flow_column else None),
+                      etf_code, selected_industry, start_date_str, end_date_str)
+        fig = figure_cache.get_or_build(
+            figure_key,
+            lambda: build_flow_comparison_figure(df_etf_hist, df_industry_flow, etf_code, selected_industry))
         st.plotly_chart(fig, use_container_width=True)
 
 # 刷新按钮
 if st.button("🔄 刷新图表数据"):
     st.cache_data.clear()
+    clear_swr_caches()
+    figure_cache.clear()
     st.rerun()
\ No newline at end of file
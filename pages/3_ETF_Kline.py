@@ -1,14 +1,20 @@
 # pages/3_ETF_Kline_Chart.py
 import streamlit as st
 import akshare as ak
-# import talib
-import pandas_ta as ta # 导入库，通常简写为 ta
+from resilient_fetch import resilient_call # 带重试/合并/熔断的上游请求封装
+from etf_bars import bar_store, ADJUST_MODES # 本地不复权K线 + 复权因子，切换复权方式不重新下载
+from trade_calendar import trading_days_ago # A股交易日历
+from swr_cache import swr_cache, clear_swr_caches, describe_entry # 过期后先返回旧数据再后台刷新
+from figure_cache import figure_cache, data_fingerprint, patch_traces # 图表缓存，避免无关控件触发整图重建
+from indicators import add_indicators, output_names, parse_indicator, OVERLAY_KINDS # 一次计算全部技术指标
 import numpy as np
 import pandas as pd
 import plotly.graph_objects as go # 使用 Plotly 绘制K线
 from datetime import datetime, timedelta
 from plotly.subplots import make_subplots
-from scipy.signal import find_peaks # 导入 find_peaks
+from etf_analysis import find_extremes_pyramid, pyramid_scales # 多级别极值点 (与页面4共用同一份缓存计算)
+from etf_resample import (DAILY_TIMEFRAMES, MINUTE_TIMEFRAMES, ensure_datetime_index,
+                          resample_daily_bars, build_minute_pyramid)
 
 
 # 尝试导入映射，主要用于行业选择时预填ETF代码
@@ -21,7 +27,7 @@ except ImportError:
 
 st.set_page_config(page_title="ETF历史K线图", layout="wide")
 st.title("📈 ETF 历史K线图查询与显示")
-st.markdown("查询并显示指定ETF在特定时间范围内的历史日K线图、均线和成交量。")
+st.markdown("查询并显示指定ETF在特定时间范围内的历史K线图(日/周/月/分钟)、均线和成交量。")
 
 # --- 侧边栏控件 ---
 st.sidebar.header("参数配置")
@@ -82,80 +88,132 @@ if use_default_time_range:
     st.sidebar.date_input("结束日期 (默认):", end_date, disabled=True)
 else:
     default_custom_end_date = datetime.now()
-    default_custom_start_date = default_custom_end_date - timedelta(days=30) # 默认自定义为近30天
+    default_custom_start_date = trading_days_ago(30).date() # 默认自定义为近30个交易日
     custom_start_date = st.sidebar.date_input("选择开始日期:", default_custom_start_date)
     custom_end_date = st.sidebar.date_input("选择结束日期:", default_custom_end_date)
     start_date = custom_start_date
     end_date = custom_end_date
 
+# 5. K线周期选择 (周/月/N日线由缓存的日K线本地合成，分钟线由1分钟K线逐级合成，切换周期不会重新请求数据)
+st.sidebar.markdown("---")
+st.sidebar.subheader("K线周期")
+timeframe_options = list(DAILY_TIMEFRAMES.keys()) + list(MINUTE_TIMEFRAMES.keys())
+selected_timeframe = st.sidebar.selectbox("选择K线周期:", timeframe_options, index=0, key="timeframe_k")
+custom_n_days = 5
+if selected_timeframe == "自定义N日":
+    custom_n_days = st.sidebar.number_input("每根K线包含的交易日数 (N):", min_value=2, max_value=60, value=5, step=1, key="custom_n_days_k")
+selected_adjust = "qfq"
+if selected_timeframe in MINUTE_TIMEFRAMES:
+    st.sidebar.caption("分钟K线仅提供最近几个交易日的数据，不受上方时间范围影响。")
+else:
+    selected_adjust = st.sidebar.selectbox("复权方式:", list(ADJUST_MODES.keys()), format_func=ADJUST_MODES.get, index=0, key="adjust_k",
+                                           help="三种复权方式都由同一份不复权K线和复权因子计算得到，切换不会重新请求数据。")
+
+st.sidebar.markdown("---")
+st.sidebar.subheader("技术指标")
+INDICATOR_OPTIONS = ["MA10", "MA60", "EMA12", "EMA26", "BOLL20", "RSI14", "MACD"]
+selected_indicators = st.sidebar.multiselect(
+    "附加指标:", INDICATOR_OPTIONS, default=[], key="indicators_k",
+    help="均线/EMA/布林带画在K线图上，RSI/MACD 各占一个副图。所有指标与 MA5/MA20/ATR 在同一次计算中完成。"
+)
+
 st.sidebar.markdown("---")
 st.sidebar.subheader("ATR 止损参考 (做多)")
 atr_period_input = st.sidebar.slider("ATR周期 (天):", min_value=5, max_value=50, value=14, step=1, key="atr_p_k")
-atr_multiplier_options = [1.0, 1.5, 2.0, 2.5, 3.0] # 增加选项
-atr_multiplier_input = st.sidebar.selectbox("ATR倍数:", atr_multiplier_options, index=2, key="atr_m_k") # 默认2.0倍
+atr_multiplier_options = [1.0, 1.5, 2.0, 2.5, 3.0] # 增加选项 (ATR倍数只影响止损显示，放在止损区域内，切换时只重跑该区域)
 
 refresh_button = st.sidebar.button("🔄 获取并显示K线数据", key="refresh_kline_data_btn")
 
 # --- 数据获取与绘图逻辑 ---
-@st.cache_data(ttl=3600) # 缓存1小时
-def fetch_etf_kline_data(etf_code, start_date_dt, end_date_dt, atr_p_val = 14):
-    """获取并处理ETF的K线数据，计算均线。"""
+def _clean_ohlcv(df, time_col):
+    """统一列名、转换数值类型并删除OHLC缺失的行。"""
+    df = df.rename(columns={time_col: '日期', '开盘': 'Open', '最高': 'High', '最低': 'Low', '收盘': 'Close', '成交量': 'Volume'})
+    df.set_index('日期', inplace=True)
+    # 数据类型转换，确保OHLCV是数值
+    for col in ['Open', 'High', 'Low', 'Close', 'Volume']:
+        df[col] = pd.to_numeric(df[col], errors='coerce')
+    df = df[['Open', 'High', 'Low', 'Close', 'Volume']].dropna(subset=['Open', 'High', 'Low', 'Close']) # 删除OHLC有空值的行
+    return ensure_datetime_index(df)
+
+@swr_cache(soft_ttl=3600, hard_ttl=86400) # 1小时后后台刷新，超过1天才同步重新获取
+def fetch_etf_daily_bars(etf_code, start_str, end_str, adjust="qfq"):
+    """获取ETF的日K线 (周/月/N日线均由此数据本地合成)。日期参数为 'YYYYMMDD' 字符串，保证缓存键每天稳定。"""
     if not etf_code:
         return pd.DataFrame(), "请输入有效的ETF代码。"
 
-    start_str = start_date_dt.strftime('%Y%m%d')
-    end_str = end_date_dt.strftime('%Y%m%d')
+    try:
+        df, error = bar_store.get_bars(etf_code, start_str, end_str, adjust)
+        if error:
+            return pd.DataFrame(), f"未能获取到ETF {etf_code} 在指定日期范围的数据。({error})"
+        return ensure_datetime_index(df), None # 返回DataFrame和None表示无错误
+    except Exception as e:
+        return pd.DataFrame(), f"获取或处理ETF {etf_code} 数据时出错: {e}"
 
+@swr_cache(soft_ttl=300, hard_ttl=4*3600) # 分钟数据变化较快，5分钟后后台刷新
+def fetch_etf_minute_pyramid(etf_code):
+    """获取ETF最近几个交易日的1分钟K线，并逐级合成 5/15/30/60 分钟K线。"""
+    if not etf_code:
+        return {}, "请输入有效的ETF代码。"
     try:
-        df = ak.fund_etf_hist_em(symbol=etf_code, period="daily", start_date=start_str, end_date=end_str, adjust="qfq")
+        df = resilient_call(ak.fund_etf_hist_min_em, symbol=etf_code, period="1", adjust="")
         if df.empty:
-            return pd.DataFrame(), f"未能获取到ETF {etf_code} 在指定日期范围的数据。"
-
-        # df['日期'] = pd.to_datetime(df['日期'])
-        df.set_index('日期', inplace=True)
-        df.rename(columns={'开盘': 'Open', '最高': 'High', '最低': 'Low', '收盘': 'Close', '成交量': 'Volume'}, inplace=True)
-        
-        # 数据类型转换，确保OHLCV是数值
-        for col in ['Open', 'High', 'Low', 'Close', 'Volume']:
-            df[col] = pd.to_numeric(df[col], errors='coerce')
-        df.dropna(subset=['Open', 'High', 'Low', 'Close'], inplace=True) # 删除OHLC有空值的行
-
-        if df.empty: # 再次检查，因为dropna可能导致为空
-             return pd.DataFrame(), f"数据清洗后，ETF {etf_code} 无有效数据。"
-
-        # 计算均线 (示例：MA5, MA20)
-        df['MA5'] = df['Close'].rolling(window=5).mean()
-        df['MA20'] = df['Close'].rolling(window=20).mean()
-
-        if len(df) > atr_p_val : # 确保数据长度足够
-            # df['ATR'] = talib.ATR(df['High'].astype(float),
-            #                       df['Low'].astype(float),
-            #                       df['Close'].astype(float),
-            #                       timeperiod=atr_p_val)
-            df['ATR'] = df.ta.atr(high='High', low='Low', close='Close', length=atr_p_val)
-        else:
-            df['ATR'] = np.nan # 数据不足则填充NaN
-
-        return df, None # 返回DataFrame和None表示无错误
+            return {}, f"未能获取到ETF {etf_code} 的分钟数据。"
+        df = _clean_ohlcv(df, '时间')
+        if df.empty:
+            return {}, f"数据清洗后，ETF {etf_code} 无有效分钟数据。"
+        return build_minute_pyramid(df, list(MINUTE_TIMEFRAMES.values())), None
     except Exception as e:
-        return pd.DataFrame(), f"获取或处理ETF {etf_code} 数据时出错: {e}"
+        return {}, f"获取或处理ETF {etf_code} 分钟数据时出错: {e}"
+
+@st.cache_data(ttl=3600)
+def build_kline_frame(df_bars, timeframe_label, n_days, atr_p_val=14, extra_indicators=()):
+    """按所选周期合成K线，一次计算均线、ATR和附加指标 (仅依赖已缓存的K线，不发起网络请求)。"""
+    if timeframe_label in DAILY_TIMEFRAMES:
+        df = resample_daily_bars(df_bars, DAILY_TIMEFRAMES[timeframe_label], n_days)
+    else:
+        df = df_bars # 分钟K线已在金字塔中合成
+
+    # 数据点不足的指标为 NaN
+    df = add_indicators(df, ["MA5", "MA20", f"ATR{atr_p_val}", *extra_indicators])
+    df['ATR'] = df.pop(f"ATR{atr_p_val}")
+    return df
+
+def fetch_etf_kline_data(etf_code, start_date_dt, end_date_dt, atr_p_val=14, timeframe_label="日线", n_days=5, adjust="qfq",
+                         extra_indicators=()):
+    """获取并处理ETF的K线数据，计算均线。周期切换只触发本地合成。返回 (DataFrame, 错误信息, 数据新鲜度说明)。"""
+    if timeframe_label in MINUTE_TIMEFRAMES:
+        pyramid, error = fetch_etf_minute_pyramid(etf_code)
+        df_bars = pyramid.get(MINUTE_TIMEFRAMES[timeframe_label], pd.DataFrame()) if not error else pd.DataFrame()
+        freshness = describe_entry(fetch_etf_minute_pyramid.entry_info(etf_code))
+    else:
+        start_str = start_date_dt.strftime('%Y%m%d')
+        end_str = end_date_dt.strftime('%Y%m%d')
+        df_bars, error = fetch_etf_daily_bars(etf_code, start_str, end_str, adjust)
+        freshness = describe_entry(fetch_etf_daily_bars.entry_info(etf_code, start_str, end_str, adjust))
+    if error:
+        return pd.DataFrame(), error, freshness
+    if df_bars.empty:
+        return pd.DataFrame(), f"ETF {etf_code} 无有效数据。", freshness
+    return build_kline_frame(df_bars, timeframe_label, n_days, atr_p_val, tuple(extra_indicators)), None, freshness
 
 
 # --- K线图绘制函数 ---
-def plot_kline_with_extremes(df_etf, etf_code_display, peak_dist, peak_prom):
-    """使用Plotly绘制K线图、均线和成交量。"""
-    if df_etf.empty:
-        st.warning("没有可供绘制的ETF数据。")
-        return
-
-    fig = make_subplots(rows=2, cols=1, shared_xaxes=True,
+def build_base_kline_figure(df_etf, etf_code_display, timeframe_label, indicators=()):
+    """构建K线、均线、附加指标和成交量部分的图表 (不含极值点)，结果会被缓存。RSI/MACD 各占一个副图。"""
+    # category 类型的X轴直接显示字符串标签，分钟线需要保留时分
+    date_format = '%Y-%m-%d %H:%M' if timeframe_label in MINUTE_TIMEFRAMES else '%Y-%m-%d'
+    x_labels = df_etf.index.strftime(date_format)
+    overlays = [spec for spec in indicators if parse_indicator(spec)[0] in OVERLAY_KINDS]
+    oscillators = [spec for spec in indicators if parse_indicator(spec)[0] not in OVERLAY_KINDS]
+    n_rows = 2 + len(oscillators)
+
+    fig = make_subplots(rows=n_rows, cols=1, shared_xaxes=True,
                         vertical_spacing=0.05, # 减少垂直间距
-                        row_heights=[0.75, 0.25],
-                        specs=[[{"secondary_y": False}], # 主K线图区域，成交量在副图
-                               [{"secondary_y": False}]]) # 成交量图区域
+                        row_heights=[0.75, 0.25] if not oscillators else [0.55, 0.15] + [0.3 / len(oscillators)] * len(oscillators),
+                        specs=[[{"secondary_y": False}]] * n_rows) # 主K线图区域，成交量和副图指标在下方
 
     # 1. K线图
-    fig.add_trace(go.Candlestick(x=df_etf.index,
+    fig.add_trace(go.Candlestick(x=x_labels,
                                  open=df_etf['Open'], high=df_etf['High'],
                                  low=df_etf['Low'], close=df_etf['Close'],
                                  name='K-Line',
@@ -165,76 +223,57 @@ def plot_kline_with_extremes(df_etf, etf_code_display, peak_dist, peak_prom):
 
     # 2. 均线
     if 'MA5' in df_etf.columns:
-        fig.add_trace(go.Scatter(x=df_etf.index, y=df_etf['MA5'], mode='lines', name='MA5', line=dict(color='orange', width=1)),
+        fig.add_trace(go.Scatter(x=x_labels, y=df_etf['MA5'], mode='lines', name='MA5', line=dict(color='orange', width=1)),
                       row=1, col=1)
     if 'MA20' in df_etf.columns:
-        fig.add_trace(go.Scatter(x=df_etf.index, y=df_etf['MA20'], mode='lines', name='MA20', line=dict(color='purple', width=1)),
+        fig.add_trace(go.Scatter(x=x_labels, y=df_etf['MA20'], mode='lines', name='MA20', line=dict(color='purple', width=1)),
                       row=1, col=1)
+    for spec in overlays:
+        for name in output_names(spec):
+            dash = 'dot' if name.startswith("BOLL") else None
+            fig.add_trace(go.Scatter(x=x_labels, y=df_etf[name], mode='lines', name=name, line=dict(width=1, dash=dash)),
+                          row=1, col=1)
 
     # 3. 成交量 (在第二个子图)
     # 根据涨跌决定成交量颜色：当天收盘价 > 开盘价 则红色，否则绿色
-    volume_colors = ['red' if row['Close'] >= row['Open'] else 'green' for index, row in df_etf.iterrows()]
-    fig.add_trace(go.Bar(x=df_etf.index, y=df_etf['Volume'], name='Volume', marker_color=volume_colors),
+    volume_colors = np.where(df_etf['Close'] >= df_etf['Open'], 'red', 'green')
+    fig.add_trace(go.Bar(x=x_labels, y=df_etf['Volume'], name='Volume', marker_color=volume_colors),
                   row=2, col=1)
 
-    # --- 寻找并标记极值点 ---
-    close_prices = df_etf['Close']
-    if len(close_prices) > peak_dist:  # 确保数据足够进行find_peaks
-        # 极大值 (波峰)
-        max_locs, _ = find_peaks(close_prices, distance=peak_dist, prominence=peak_prom)
-        if len(max_locs) > 0:
-            fig.add_trace(go.Scatter(
-                x=df_etf.index[max_locs], 
-                y=close_prices.iloc[max_locs],
-                mode='markers', 
-                name='局部高点',
-                marker=dict(
-                    color='rgba(255, 127, 80, 0.0)',  # 核心：设置填充色为完全透明
-                    size=12,                           # 稍微增大尺寸以突出边框
-                    symbol='circle',                   # 使用实心圆符号
-                    line=dict(
-                        width=2,                       # 边框宽度
-                        color='orangered'              # 边框颜色：亮眼的橙红色
-                    )
-                )
-            ), row=1, col=1)
-
-        # 极小值 (波谷)
-        min_locs, _ = find_peaks(-close_prices, distance=peak_dist, prominence=peak_prom)
-        if len(min_locs) > 0:
-            fig.add_trace(go.Scatter(
-                x=df_etf.index[min_locs], 
-                y=close_prices.iloc[min_locs],
-                mode='markers', 
-                name='局部低点',
-                marker=dict(
-                    color='rgba(0, 206, 209, 0.0)',   # 核心：设置填充色为完全透明
-                    size=12,                           # 稍微增大尺寸以突出边框
-                    symbol='circle',                   # 使用实心圆符号
-                    line=dict(
-                        width=2,                       # 边框宽度
-                        color='darkturquoise'          # 边框颜色：明亮的青色
-                    )
-                )
-            ), row=1, col=1)
+    # 4. 副图指标 (RSI / MACD)
+    for row, spec in enumerate(oscillators, start=3):
+        names = output_names(spec)
+        if parse_indicator(spec)[0] == "RSI":
+            fig.add_trace(go.Scatter(x=x_labels, y=df_etf[names[0]], mode='lines', name=names[0],
+                                     line=dict(color='royalblue', width=1)), row=row, col=1)
+            for level in (30, 70):
+                fig.add_hline(y=level, line=dict(color='gray', width=1, dash='dot'), row=row, col=1)
+        else:
+            macd, signal, hist = names
+            fig.add_trace(go.Bar(x=x_labels, y=df_etf[hist], name=hist,
+                                 marker_color=np.where(df_etf[hist] >= 0, 'red', 'green')), row=row, col=1)
+            fig.add_trace(go.Scatter(x=x_labels, y=df_etf[macd], mode='lines', name=macd,
+                                     line=dict(color='black', width=1)), row=row, col=1)
+            fig.add_trace(go.Scatter(x=x_labels, y=df_etf[signal], mode='lines', name=signal,
+                                     line=dict(color='orange', width=1)), row=row, col=1)
+        fig.update_yaxes(title_text=names[0], row=row, col=1)
+        fig.update_xaxes(type='category', tickformat=date_format, nticks=12, row=row, col=1)
 
     fig.update_layout(
-        title_text=f"{etf_code_display} 日K线图",
-        height=700,
+        title_text=f"{etf_code_display} {timeframe_label}K线图",
+        height=700 + 180 * len(oscillators),
         xaxis_rangeslider_visible=False, # 隐藏K线图下方的滑块
         legend_orientation="h", legend_yanchor="bottom", legend_y=1.02, legend_xanchor="right", legend_x=1
     )
 
     # --- MODIFIED: X轴日期显示格式和频率 ---
-    date_format = '%Y-%m-%d' # 日期格式：年-月-日
     # 尝试按月显示，如果数据范围过小，Plotly会自动调整
     # dtick="M1" 表示每个月一个主刻度。L1表示每月第一天。
     # 如果数据量很大，每月一个可能还是太多，可以考虑 "M3" (每季度) 或 nticks
 
     # X轴设置 (处理非交易日，让K线连续)
     fig.update_xaxes(
-        type='category', # 使用category类型可以帮助更好地处理非连续日期
-        rangebreaks=[dict(bounds=["sat", "sun"])], # 隐藏周末
+        type='category', # 分类轴只包含有K线的交易日 (或分钟)，不会出现周末和节假日的空档
         tickformat=date_format, # 应用日期格式
         # tickmode='auto', # 或者 'linear' 配合 dtick
         # dtick="M1", # 尝试每月一个刻度
@@ -242,20 +281,147 @@ def plot_kline_with_extremes(df_etf, etf_code_display, peak_dist, peak_prom):
         row=1, col=1
     )
     fig.update_xaxes(
-        type='category', # 确保底部X轴标签与K线图对齐且处理非交易日
-        rangebreaks=[dict(bounds=["sat", "sun"])],
+        type='category', # 确保底部X轴标签与K线图对齐
         tickformat=date_format, # 应用日期格式
         # dtick="M1",
         nticks=12,
         row=2, col=1,
-        title_text="日期"
     )
+    fig.update_xaxes(title_text="日期", row=n_rows, col=1)
 
     fig.update_yaxes(title_text="价格", row=1, col=1)
     fig.update_yaxes(title_text="成交量", row=2, col=1)
+    return fig
+
+def build_extremes_traces(df_etf, peak_dist, peak_prom, timeframe_label):
+    """
+    计算多级别局部极值点并生成标记 trace (显式指定主图坐标轴 x/y，用于在缓存的基础图上替换)。
+    以输入的峰间距和突起高度为“波段”级别，标记越大表示该极值点在越大的级别上仍然成立。
+    """
+    date_format = '%Y-%m-%d %H:%M' if timeframe_label in MINUTE_TIMEFRAMES else '%Y-%m-%d'
+    traces = []
+
+    # --- 寻找并标记极值点 ---
+    close_prices = df_etf['Close']
+    if len(close_prices) <= peak_dist:  # 确保数据足够进行find_peaks
+        return traces
+    extremes = find_extremes_pyramid(close_prices, pyramid_scales(peak_dist, peak_prom))
+    marker_sizes = np.array([8, 12, 16, 22]) # 短线/波段/中期/长期
+    styles = {
+        "高点": ('局部高点', 'rgba(255, 127, 80, 0.0)', 'orangered'),   # 边框颜色：亮眼的橙红色
+        "低点": ('局部低点', 'rgba(0, 206, 209, 0.0)', 'darkturquoise'), # 边框颜色：明亮的青色
+    }
+    for kind, (trace_name, fill_color, line_color) in styles.items():
+        points = extremes[extremes['类型'] == kind]
+        if points.empty:
+            continue
+        traces.append(go.Scatter(
+            x=pd.DatetimeIndex(points['日期']).strftime(date_format),
+            y=points['价格'],
+            mode='markers',
+            name=trace_name,
+            xaxis='x', yaxis='y',
+            text=points['极值级别'],
+            hovertemplate="%{x}<br>%{y:.3f}<br>级别: %{text}<extra>" + trace_name + "</extra>",
+            marker=dict(
+                color=fill_color,                                # 核心：设置填充色为完全透明
+                size=marker_sizes[points['级别'].clip(upper=len(marker_sizes) - 1)],
+                symbol='circle',                                 # 使用实心圆符号
+                line=dict(width=2, color=line_color)
+            )
+        ))
+    return traces
+
+def plot_kline_with_extremes(df_etf, etf_code_display, peak_dist, peak_prom, timeframe_label="日线", indicators=()):
+    """使用Plotly绘制K线图、均线和成交量。图表按数据指纹缓存，极值点参数变化时只替换极值点 trace。"""
+    if df_etf.empty:
+        st.warning("没有可供绘制的ETF数据。")
+        return
+
+    # 图表只依赖K线、均线和附加指标，ATR 的变化不应使缓存失效
+    chart_cols = [col for col in df_etf.columns if col != 'ATR']
+    base_key = ("kline_base", data_fingerprint(df_etf[chart_cols]), etf_code_display, timeframe_label, tuple(indicators))
+    full_key = base_key + ("extremes", peak_dist, round(float(peak_prom), 6))
+
+    fig = figure_cache.get(full_key)
+    if fig is None:
+        fig = figure_cache.get_or_build(base_key, lambda: build_base_kline_figure(df_etf, etf_code_display, timeframe_label, indicators))
+        patch_traces(fig, build_extremes_traces(df_etf, peak_dist, peak_prom, timeframe_label),
+                     replace_names=('局部高点', '局部低点'))
+        figure_cache.put(full_key, fig)
 
     st.plotly_chart(fig, use_container_width=True)
 
+# --- 页面片段 ---
+# 极值点参数和 ATR 倍数只影响各自的区域: 修改时只重跑对应片段，不重新获取数据、计算指标或重建其它图表。
+# 片段重跑时沿用上一次整页运行传入的参数。
+@st.fragment
+def render_kline_section(df_etf, etf_code_display, timeframe_label, indicators=()):
+    # --- 极值点参数输入 ---
+    st.subheader("局部极值点参数设置")
+    cols_peaks = st.columns(2)
+    # 动态计算默认prominence
+    price_std_default = df_etf['Close'].std() if not df_etf.empty else 0.1
+    default_prominence = round(price_std_default * 0.5, 4) if price_std_default > 0 else 0.05
+
+
+    max_peak_distance = len(df_etf)//2 if len(df_etf)>2 else 1 # 周线/月线数据点较少，需同步收紧上限
+    with cols_peaks[0]:
+        peak_distance_input = st.number_input(
+            "最小峰间距 (天/数据点数):",
+            min_value=1, max_value=max_peak_distance, # 避免过大
+            value=min(10, max_peak_distance), step=1, key="peak_dist_k",
+            help="寻找的波峰/波谷之间至少相隔多少个数据点。"
+        )
+    with cols_peaks[1]:
+        peak_prominence_input = st.number_input(
+            "最小突起高度 (价格单位):",
+            min_value=0.0001, value=float(default_prominence), step=0.01, format="%.4f", key="peak_prom_k",
+            help="波峰需要比周围高出多少，或波谷需要比周围低多少才被识别。基于0.5*收盘价标准差计算默认值。"
+        )
+
+    st.caption("极值点分为短线/波段/中期/长期四级 (0.5/1/2/6 倍峰间距，突起高度相应提高)，以上方参数为“波段”级别；"
+               "标记越大表示该极值点在越大的级别上仍然成立，悬停可查看级别。")
+
+    # --- 绘制K线图（现在包含极值点） ---
+    plot_kline_with_extremes(df_etf, etf_code_display, peak_distance_input, peak_prominence_input, timeframe_label,
+                             indicators)
+
+
+@st.fragment
+def render_atr_stop_section(df_etf, atr_period_input):
+    # --- ATR 和止损信息显示 ---
+    st.markdown("---")
+    st.subheader(f"ATR({atr_period_input}) 止损参考 (基于最新数据)")
+    atr_multiplier_input = st.selectbox("ATR倍数:", atr_multiplier_options, index=2, key="atr_m_k") # 默认2.0倍
+    latest_data_main = df_etf.iloc[-1]
+    latest_close_main = latest_data_main['Close']
+    latest_atr_main = latest_data_main.get('ATR', np.nan) # 使用 .get 以防ATR列不存在
+
+    cols_atr = st.columns(4)
+    with cols_atr[0]:
+        st.metric(label="最新收盘价", value=f"{latest_close_main:.3f}" if pd.notna(latest_close_main) else "N/A")
+    with cols_atr[1]:
+        st.metric(label=f"最新ATR({atr_period_input})", value=f"{latest_atr_main:.3f}" if pd.notna(latest_atr_main) else "N/A")
+
+    if pd.notna(latest_close_main) and pd.notna(latest_atr_main) and latest_atr_main > 0: # 确保ATR有效
+        stop_loss_price_main = latest_close_main - (atr_multiplier_input * latest_atr_main)
+        stop_loss_percentage_main = ((latest_close_main - stop_loss_price_main) / latest_close_main) * 100
+        with cols_atr[2]:
+            st.metric(label=f"止损价 ({atr_multiplier_input}x ATR)", value=f"{stop_loss_price_main:.3f}")
+        with cols_atr[3]:
+            st.metric(label="止损百分比", value=f"{stop_loss_percentage_main:.3f}%")
+        st.caption(f"计算公式: 止损价 = 收盘价 - (ATR倍数 * ATR({atr_period_input}))。")
+    else:
+        with cols_atr[2]:
+            st.metric(label=f"止损价 ({atr_multiplier_input}x ATR)", value="N/A")
+        with cols_atr[3]:
+            st.metric(label="止损百分比", value="N/A")
+        if not (pd.notna(latest_atr_main) and latest_atr_main > 0):
+            st.caption("ATR值无效或为0，无法计算止损。")
+    st.caption("ATR止损信息仅供参考，不构成投资建议。")
+    st.markdown("---")
+
 # --- 主逻辑：当按钮被点击或输入变化时执行 ---
 # Streamlit中，输入控件的任何变化都会导致脚本重新运行。
 # 我们可以直接使用 etf_code_input 和日期变量。
@@ -263,6 +429,8 @@ def plot_kline_with_extremes(df_etf, etf_code_display, peak_dist, peak_prom):
 
 if refresh_button: # 如果按钮被点击
     st.cache_data.clear() # 清除所有缓存的数据
+    clear_swr_caches()
+    figure_cache.clear()
     # 重新运行页面以确保使用最新的输入值并重新获取数据
     # st.rerun() # st.rerun()会立即执行，可能导致下面的逻辑不完整
 
@@ -273,68 +441,18 @@ if final_etf_code: # 只有当有ETF代码时才尝试获取和绘图
 
     st.markdown(f"#### ETF: {final_etf_code} | 时间: {start_date.strftime('%Y-%m-%d')} to {end_date.strftime('%Y-%m-%d')}")
 
-    df_etf_data, error_message = fetch_etf_kline_data(final_etf_code, start_date, end_date, atr_period_input)
+    df_etf_data, error_message, data_freshness = fetch_etf_kline_data(final_etf_code, start_date, end_date, atr_period_input,
+                                                                      selected_timeframe, custom_n_days, selected_adjust,
+                                                                      selected_indicators)
+    st.caption(data_freshness)
 
     if error_message:
         st.error(error_message)
     elif df_etf_data.empty:
         st.warning(f"未找到ETF {final_etf_code} 的数据或数据为空。")
     else:
-        # --- 极值点参数输入 ---
-        st.subheader("局部极值点参数设置")
-        cols_peaks = st.columns(2)
-        # 动态计算默认prominence
-        price_std_default = df_etf_data['Close'].std() if not df_etf_data.empty else 0.1
-        default_prominence = round(price_std_default * 0.5, 4) if price_std_default > 0 else 0.05
-
-
-        with cols_peaks[0]:
-            peak_distance_input = st.number_input(
-                "最小峰间距 (天/数据点数):",
-                min_value=1, max_value=len(df_etf_data)//2 if len(df_etf_data)>2 else 1, # 避免过大
-                value=10, step=1, key="peak_dist_k",
-                help="寻找的波峰/波谷之间至少相隔多少个数据点。"
-            )
-        with cols_peaks[1]:
-            peak_prominence_input = st.number_input(
-                "最小突起高度 (价格单位):",
-                min_value=0.0001, value=float(default_prominence), step=0.01, format="%.4f", key="peak_prom_k",
-                help="波峰需要比周围高出多少，或波谷需要比周围低多少才被识别。基于0.5*收盘价标准差计算默认值。"
-            )
-
-        # --- 绘制K线图（现在包含极值点） ---
-        plot_kline_with_extremes(df_etf_data, final_etf_code, peak_distance_input, peak_prominence_input)
-
-        # --- ATR 和止损信息显示 ---
-        st.markdown("---")
-        st.subheader(f"ATR({atr_period_input}) 止损参考 (基于最新数据)")
-        latest_data_main = df_etf_data.iloc[-1]
-        latest_close_main = latest_data_main['Close']
-        latest_atr_main = latest_data_main.get('ATR', np.nan) # 使用 .get 以防ATR列不存在
-
-        cols_atr = st.columns(4)
-        with cols_atr[0]:
-            st.metric(label="最新收盘价", value=f"{latest_close_main:.3f}" if pd.notna(latest_close_main) else "N/A")
-        with cols_atr[1]:
-            st.metric(label=f"最新ATR({atr_period_input})", value=f"{latest_atr_main:.3f}" if pd.notna(latest_atr_main) else "N/A")
-
-        if pd.notna(latest_close_main) and pd.notna(latest_atr_main) and latest_atr_main > 0: # 确保ATR有效
-            stop_loss_price_main = latest_close_main - (atr_multiplier_input * latest_atr_main)
-            stop_loss_percentage_main = ((latest_close_main - stop_loss_price_main) / latest_close_main) * 100
-            with cols_atr[2]:
-                st.metric(label=f"止损价 ({atr_multiplier_input}x ATR)", value=f"{stop_loss_price_main:.3f}")
-            with cols_atr[3]:
-                st.metric(label="止损百分比", value=f"{stop_loss_percentage_main:.3f}%")
-            st.caption(f"计算公式: 止损价 = 收盘价 - (ATR倍数 * ATR({atr_period_input}))。")
-        else:
-            with cols_atr[2]:
-                st.metric(label=f"止损价 ({atr_multiplier_input}x ATR)", value="N/A")
-            with cols_atr[3]:
-                st.metric(label="止损百分比", value="N/A")
-            if not (pd.notna(latest_atr_main) and latest_atr_main > 0):
-                st.caption("ATR值无效或为0，无法计算止损。")
-        st.caption("ATR止损信息仅供参考，不构成投资建议。")
-        st.markdown("---")
+        render_kline_section(df_etf_data, final_etf_code, selected_timeframe, selected_indicators)
+        render_atr_stop_section(df_etf_data, atr_period_input)
 else:
     if refresh_button: # 如果点击了按钮但没有输入ETF代码
         st.warning("请输入有效的ETF代码后再点击获取。")
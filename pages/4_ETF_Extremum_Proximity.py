@@ -1,11 +1,26 @@
 # pages/4_ETF_Extremum_Proximity.py
 import streamlit as st
-import akshare as ak
+from swr_cache import describe_entry # 过期后先返回旧数据再后台刷新
+from etf_analysis import fetch_etf_daily_history, fetch_etf_daily_history_cached, EXTREMUM_LEVELS # 与后台监控共用的计算逻辑
+from etf_scan import fetch_etf_universe, filter_liquid_etfs, iter_scan, SPARKLINE_DAYS # 并发扫描，逐个返回结果，支持全市场ETF
+from proximity_monitor import (feed_sink, start_background_monitor, stop_background_monitor, touch_background_monitor,
+                               get_background_monitor, get_background_owner, is_trading_time)
+from figure_cache import figure_cache # 图表缓存
+from scan_snapshots import save_snapshot, list_snapshots, load_snapshot, load_results, diff_results, data_versions # 扫描快照
 import pandas as pd
 import numpy as np
-from scipy.signal import find_peaks
-from datetime import datetime, timedelta
-import pandas_ta as ta # 导入库，通常简写为 ta
+import plotly.graph_objects as go
+from plotly.subplots import make_subplots
+from datetime import datetime
+from contextlib import closing
+import time
+import uuid
+
+SPARKLINE_COLUMNS = 4
+SPARKLINE_MAX_CHARTS = 60 # 缩略图最多显示的ETF数，超过时按命中记录数从多到少取前面的
+LIVE_REFRESH_SECONDS = 1.0 # 扫描过程中有新命中时，结果区域最多每隔多少秒重绘一次
+RESULT_COLUMNS = ["ETF代码", "名称", "分析类型", "极值级别", "当前价格", "极值点日期", "极值点价格",
+                  "区间下沿", "区间上沿", "触及次数", "当前ATR", "距离ATR倍数", "距离百分比"]
 
 # --- 初始化 session_state ---
 if 'debug_logs' not in st.session_state:
@@ -52,10 +67,21 @@ st.sidebar.header("分析参数配置")
 st.sidebar.subheader("数据源选择")
 etf_source = st.sidebar.radio(
     "选择ETF列表:",
-    ("行业ETF", "自选ETF"),
+    ("行业ETF", "自选ETF", "全市场ETF"),
     key="etf_source_choice",
-    help="选择要分析的ETF列表来源。"
+    help="选择要分析的ETF列表来源。“全市场ETF”从实时行情中获取全部上市ETF，并先按流动性过滤。"
 )
+if etf_source == "全市场ETF":
+    min_turnover_wan = st.sidebar.number_input(
+        "最低当日成交额 (万元):", min_value=0, max_value=100000, value=1000, step=500,
+        key="universe_min_turnover", help="成交额低于该值的ETF不参与扫描。"
+    )
+    min_history_days = st.sidebar.number_input(
+        "最少历史交易日数:", min_value=0, max_value=500, value=120, step=20,
+        key="universe_min_history", help="上市时间太短 (历史K线不足) 的ETF在计算指标前剔除。"
+    )
+else:
+    min_turnover_wan, min_history_days = 0, 0
 
 # 2. 历史数据获取年限
 st.sidebar.subheader("数据周期")
@@ -76,6 +102,12 @@ peak_prominence_std_factor = st.sidebar.slider(
     "突起高度因子 (乘以标准差):", min_value=0.1, max_value=2.0, value=0.5, step=0.1,
     key="peak_prom_factor_batch", help="波峰/波谷的突起程度，以收盘价标准差的倍数衡量。"
 )
+min_extremum_level = st.sidebar.selectbox(
+    "最低极值级别:", options=list(range(len(EXTREMUM_LEVELS))), format_func=lambda i: EXTREMUM_LEVELS[i], index=1,
+    key="min_level_batch",
+    help="极值点按 0.5/1/2/6 倍峰间距 (突起高度相应提高) 分为短线/波段/中期/长期四级，每个极值点标注其能保留的最大级别。"
+         "“波段”即上面设置的峰间距和突起高度。"
+)
 
 # 4. 靠近分析参数 (基于ATR)
 st.sidebar.subheader("靠近程度分析参数 (ATR)")
@@ -89,283 +121,390 @@ atr_multiplier_proximity = st.sidebar.selectbox(
     key="atr_multiplier_prox_batch", help="当前价格与极值点相差 n * ATR 以内被认为是“靠近”。"
 )
 
+use_zones = st.sidebar.checkbox(
+    "合并为支撑/阻力区间", value=True, key="use_zones_batch",
+    help="把价格相近的极值点聚类成区间，按区间判断靠近，避免同一价位的多个极值点重复出现。"
+)
+zone_width_multiplier = st.sidebar.slider(
+    "区间宽度 (ATR倍数):", min_value=0.25, max_value=3.0, value=1.0, step=0.25,
+    key="zone_width_batch", disabled=not use_zones, help="同一区间内极值点的最大价差。"
+)
+
 # 5. 选择分析的极值类型
 st.sidebar.subheader("分析类型")
 analyze_maxima = st.sidebar.checkbox("分析靠近局部高点", value=True, key="analyze_max_batch")
 analyze_minima = st.sidebar.checkbox("分析靠近局部低点", value=True, key="analyze_min_batch")
 
-# 6. NEW: 选择结果展示方式
-st.sidebar.subheader("结果展示方式")
-display_mode = st.sidebar.radio(
-    "选择结果展示方式:",
-    ("联合显示", "分开显示"),
-    index=0,  # 默认选择“联合显示”
-    key="display_mode_choice"
-)
-
-# 7. 分析按钮
+# 6. 分析按钮 (结果展示方式在结果区域内切换，只重绘结果部分)
 analyze_button = st.sidebar.button("🚀 开始批量分析", key="analyze_extremes_btn")
+# 点击后页面重跑，正在进行的扫描随之中止，已扫描部分的结果保留 (见主逻辑)
+st.sidebar.button("⏹️ 停止扫描", key="cancel_scan_btn", disabled=not analyze_button,
+                  help="停止正在进行的扫描，保留已扫描部分的结果。")
+
+# 7. 实时监控 (交易时段每分钟拉取实时行情，价格进入/离开极值点或区间 ± n*ATR 的范围时产生提醒)
+# 监控器全进程只有一个，由打开它的会话控制；其它会话只展示提醒，不会重启或停止它
+st.sidebar.subheader("实时监控")
+live_owner = st.session_state.setdefault("live_monitor_owner", uuid.uuid4().hex)
+if "live_monitor_toggle" not in st.session_state:
+    # 开关状态只跟随本会话是否控制着监控器 (切换页面回来后保持)，不随其它会话的操作变化
+    st.session_state.live_monitor_toggle = get_background_owner() == live_owner
+enable_live_monitor = st.sidebar.toggle(
+    "启用交易时段实时靠近提醒", key="live_monitor_toggle",
+    help="在后台常驻监控当前ETF列表，极值点、级别、区间与ATR参数以及分析类型与批量分析相同，提醒与扫描结果一致。"
+         "监控器由开启它的会话控制，其它会话只展示提醒。"
+         "也可以用 `python proximity_monitor.py` 独立运行并写入文件/webhook。"
+)
 
-
-# --- 数据获取与处理函数 ---
-@st.cache_data(ttl=86400)
-def fetch_raw_etf_data_with_atr(etf_code, years_of_history, atr_period_for_calc):
-    """获取ETF原始OHLC数据并计算ATR。"""
-    add_debug_log(f"Fetching raw data & ATR for {etf_code}, {years_of_history} years, ATR({atr_period_for_calc})")
-    end_date = datetime.now()
-    start_date = end_date - timedelta(days=int(years_of_history * 365.25))
-    start_str = start_date.strftime('%Y%m%d')
-    end_str = end_date.strftime('%Y%m%d')
+# 8. 扫描快照 (保存过的扫描结果可直接打开，不需要重新计算；也可以由 `python scan_snapshots.py` 定时生成)
+st.sidebar.subheader("扫描快照")
+snapshots = list_snapshots()
+selected_snapshot = st.sidebar.selectbox(
+    "已保存的快照:", [item["name"] for item in snapshots], index=None, key="snapshot_choice",
+    placeholder="暂无快照" if not snapshots else "选择快照",
+    format_func=lambda name: next(f"{name} ({item['hits']}/{item['total']})" for item in snapshots if item["name"] == name),
+)
+open_snapshot_button = st.sidebar.button("📂 打开快照", key="open_snapshot_btn", disabled=selected_snapshot is None)
+if open_snapshot_button:
     try:
-        df = ak.fund_etf_hist_em(symbol=etf_code, period="daily", start_date=start_str, end_date=end_str, adjust="qfq")
-        if df.empty or not all(col in df.columns for col in ['收盘', '最高', '最低']):
-            return pd.DataFrame(), f"数据不足或缺少必要列(收盘/最高/最低) for {etf_code}"
-
-        df['日期'] = pd.to_datetime(df['日期']).dt.normalize()
-        df.set_index('日期', inplace=True)
-        rename_map = {'开盘': 'Open', '最高': 'High', '最低': 'Low', '收盘': 'Close', '成交量': 'Volume'}
-        df.rename(columns=rename_map, inplace=True)
-        
-        cols_to_numeric = ['Open', 'High', 'Low', 'Close', 'Volume']
-        for col in cols_to_numeric:
-            if col in df.columns:
-                df[col] = pd.to_numeric(df[col], errors='coerce')
-
-        df.dropna(subset=['High', 'Low', 'Close'], inplace=True)
-
-        if len(df) <= atr_period_for_calc:
-            df['ATR'] = np.nan
-            add_debug_log(f"Data points ({len(df)}) insufficient for ATR({atr_period_for_calc}) for {etf_code}. ATR set to NaN.")
-            return df, f"数据点不足以计算ATR for {etf_code}" if df.empty else None
-        
-        # df['ATR'] = talib.ATR(df['High'].astype(float), df['Low'].astype(float), df['Close'].astype(float), timeperiod=atr_period_for_calc)
-        # 如果您想自定义新列的名称，可以这样做：
-        df['ATR'] = df.ta.atr(high='High', low='Low', close='Close', length=atr_period_for_calc)
-        
-        return df, None
+        st.session_state.proximity_scan = load_snapshot(selected_snapshot)
     except Exception as e:
-        return pd.DataFrame(), f"获取或计算ATR for {etf_code} 出错: {e}"
-
-@st.cache_data(ttl=7200)
-def find_extremes_from_series(etf_code, close_series, p_dist, p_prom_factor):
-    """从已获取的收盘价序列中计算极值点。"""
-    add_debug_log(f"Finding extremes for {etf_code} with p_dist={p_dist}, p_prom_factor={p_prom_factor}")
-    if close_series.empty:
-        return None, None, f"无收盘价序列 for {etf_code}"
-
-    if len(close_series) < p_dist * 2:
-        return None, None, f"数据点不足 ({len(close_series)}) for {etf_code} to find peaks with distance {p_dist}"
-
-    price_std = close_series.std()
-    actual_prominence = price_std * p_prom_factor if price_std > 0.00001 else 0.01
+        st.sidebar.error(f"读取快照失败: {e}")
+
+
+# --- 实时监控提醒 ---
+# 实时提醒区域每分钟自动重跑一次，只刷新这一块，不影响页面其它部分
+@st.fragment(run_every=60)
+def render_live_alerts(owner):
+    live_monitor = get_background_monitor()
+    owned = touch_background_monitor(owner) # 控制者的心跳，会话关闭后其它会话才能接管
+    with st.expander("📡 实时靠近提醒", expanded=True):
+        if live_monitor is None:
+            st.info("实时监控已停止。")
+            return
+        if not owned:
+            st.caption("监控器由另一个会话开启并控制，这里只展示提醒，参数以该会话为准。")
+        if live_monitor.loaded_date is None:
+            st.info("监控器正在载入极值点与ATR...")
+        else:
+            st.caption(f"监控 {len(live_monitor.states)} 个ETF | {'交易时段，每分钟更新' if is_trading_time() else '非交易时段，暂停拉取行情'} | "
+                       f"已评估 {live_monitor.stats['symbols_evaluated']} 次，产生 {live_monitor.stats['events']} 条事件")
+        recent_events = feed_sink.recent(50)
+        if recent_events:
+            df_events = pd.DataFrame(recent_events)
+            df_events["event"] = df_events["event"].map({"enter": "进入区间", "exit": "离开区间"})
+            st.dataframe(df_events.rename(columns={"time": "时间", "event": "事件"}), use_container_width=True, hide_index=True)
+        else:
+            st.info("暂无提醒事件。")
 
-    try:
-        max_locs, _ = find_peaks(close_series, distance=p_dist, prominence=actual_prominence)
-        max_points_data = [(close_series.index[loc], close_series.iloc[loc]) for loc in max_locs]
+if enable_live_monitor and etf_source == "全市场ETF" and 'universe_watchlist' not in st.session_state:
+    st.info("全市场模式下实时监控使用最近一次扫描过滤后的ETF列表，请先点击“开始批量分析”。")
+elif enable_live_monitor:
+    if etf_source == "全市场ETF":
+        monitor_watchlist = st.session_state.universe_watchlist
+    else:
+        monitor_watchlist = {code: name for name, code in
+                             (ETF_INDUSTRY_MAPPINGS if etf_source == "行业ETF" else ETF_SELECT_MAPPINGS).items()}
+    start_background_monitor(
+        monitor_watchlist, live_owner,
+        atr_multiplier=atr_multiplier_proximity, atr_period=atr_period_proximity,
+        peak_distance=peak_distance_input_batch, prominence_factor=peak_prominence_std_factor,
+        history_years=selected_history_years, min_level=min_extremum_level,
+        zone_width_multiplier=zone_width_multiplier if use_zones else None,
+        analyze_maxima=analyze_maxima, analyze_minima=analyze_minima,
+    )
+    render_live_alerts(live_owner)
+else:
+    stop_background_monitor(live_owner) # 只在本会话控制监控器时生效
+    if get_background_monitor() is not None:
+        render_live_alerts(live_owner)
+
+
+# --- 命中ETF缩略图 ---
+def build_sparkline_grid(sparklines, names, n_cols=SPARKLINE_COLUMNS):
+    """
+    命中ETF的缩略图网格 (一张图): 每格为最近一段收盘价、期间的高低点，
+    以及靠近范围 (极值点或区间 ± n*ATR，红色为高点/阻力，绿色为低点/支撑)。
+    """
+    codes = list(sparklines.keys())
+    n_rows = (len(codes) + n_cols - 1) // n_cols
+    fig = make_subplots(rows=n_rows, cols=n_cols, subplot_titles=[f"{names.get(code, '')} ({code})" for code in codes],
+                        horizontal_spacing=0.03, vertical_spacing=min(0.08, 0.5 / n_rows))
+    # 子图按行编号 (x, x2, x3 ...)。trace 和区域一次性加入，逐个按 row/col 添加在几十个子图时会非常慢
+    traces, shapes = [], []
+    for i, code in enumerate(codes):
+        data = sparklines[code]
+        suffix = "" if i == 0 else str(i + 1)
+        axes = dict(xaxis="x" + suffix, yaxis="y" + suffix)
+        traces.append(go.Scatter(
+            y=data["close"], customdata=data["dates"], mode='lines', line=dict(color='#444', width=1.2),
+            hovertemplate="%{customdata}<br>收盘 %{y:.3f}<extra></extra>", **axes,
+        ))
+        extreme_type = np.asarray(data["extreme_type"])
+        for kind, color in (("高点", 'orangered'), ("低点", 'darkturquoise')):
+            mask = extreme_type == kind
+            if mask.any():
+                traces.append(go.Scatter(
+                    x=data["extreme_pos"][mask], y=data["extreme_price"][mask], mode='markers',
+                    marker=dict(color=color, size=6), hovertemplate=kind + " %{y:.3f}<extra></extra>", **axes,
+                ))
+        for low, high, kind in data["bands"]:
+            shapes.append(dict(type='rect', xref=f"x{suffix} domain", x0=0, x1=1, yref="y" + suffix, y0=low, y1=high,
+                               fillcolor='red' if kind == "靠近高点" else 'green', opacity=0.12, line_width=0,
+                               layer='below'))
+    fig.add_traces(traces)
+    fig.update_layout(shapes=shapes)
+    fig.update_xaxes(showticklabels=False, showgrid=False)
+    fig.update_yaxes(tickfont=dict(size=9))
+    fig.update_annotations(font_size=11)
+    fig.update_layout(height=170 * n_rows + 40, showlegend=False, margin=dict(l=10, r=10, t=40, b=10))
+    return fig
+
+
+# --- 结果表格与摘要 ---
+def format_result_table(items):
+    """结果记录转为显示用的表格: 价格保留3位、ATR 4位、距离倍数和百分比2位小数。"""
+    df = pd.DataFrame(items)
+    formats = {'当前价格': '{:.3f}', '极值点价格': '{:.3f}', '区间下沿': '{:.3f}', '区间上沿': '{:.3f}',
+               '当前ATR': '{:.4f}', '距离ATR倍数': '{:.2f}', '距离百分比': '{:.2f}'}
+    for col, fmt in formats.items():
+        if col in df.columns:
+            df[col] = df[col].map(fmt.format)
+    return df
+
+
+def render_hit_summary(items):
+    """触及极值点的ETF名称一览 (每个ETF一个标签，多列排列)。"""
+    st.subheader("📣 触及极值点ETF一览")
+    # 排序后显示，更清晰
+    sorted_names = sorted({f"{item['名称']} ({item['ETF代码']})" for item in items})
+    if sorted_names:
+        # 使用多列布局以获得更好的视觉效果
+        num_columns = 5
+        cols = st.columns(num_columns)
+        for i, name in enumerate(sorted_names):
+            with cols[i % num_columns]:
+                st.success(name)
+    else:
+        st.info("本次分析未发现任何触及极值点的ETF。")
+
+
+def render_live_scan(scan):
+    """扫描进行中已找到的结果 (命中ETF一览和综合结果表)。不含控件，同一次运行中可以反复重绘。"""
+    render_hit_summary(scan["results"])
+    df = format_result_table(scan["results"])
+    st.dataframe(df[[col for col in RESULT_COLUMNS if col in df.columns]], use_container_width=True, hide_index=True)
+
+
+def finish_scan(scan, status):
+    """
+    结束扫描: 结果按ETF列表顺序排列，记录数据版本和行情新鲜度。
+    status 为 "done" 或 "cancelled" (中途停止，total 改为实际扫描的ETF数，planned 为原计划数)。
+    """
+    order = {code: i for i, code in enumerate(scan["watchlist"])}
+    scan["results"].sort(key=lambda item: order[item["ETF代码"]])
+    scanned = [code for code in scan["watchlist"] if code in scan["scanned"]]
+    if status == "cancelled":
+        scan["planned"], scan["total"] = scan["total"], len(scanned)
+    scan["data_versions"] = data_versions(scanned)
+    if scan["use_cache"]:
+        history_years = scan["params"]["history_years"]
+        cache_infos = [fetch_etf_daily_history_cached.entry_info(code, history_years) for code in scanned]
+        cache_infos = [info for info in cache_infos if info]
+        oldest_data_age = max(cache_infos, key=lambda info: info["age"]) if cache_infos else None
+        scan["freshness"] = f"最旧的一份行情{describe_entry(oldest_data_age)}"
+    scan["finished_at"] = datetime.now().strftime("%H:%M:%S")
+    scan["status"] = status
+
+
+# --- 结果展示 (片段) ---
+# 扫描结果保存在 session_state 中；切换展示方式只重跑这个片段，不会重新扫描，也不会丢失结果。
+@st.fragment
+def render_scan_results():
+    scan = st.session_state.proximity_scan
+    atr_multiplier_proximity = scan["atr_multiplier"]
+    analyze_maxima, analyze_minima = scan["analyze_maxima"], scan["analyze_minima"]
+
+    partial = f"，扫描中途停止，原计划 {scan['planned']} 个" if scan.get("planned") else ""
+    if scan.get("snapshot"):
+        st.success(f"已打开快照 “{scan['snapshot']}” (保存于 {scan['saved_at']})：共分析 {scan['total']} 个ETF ({scan['source']}{partial})。")
+    elif scan.get("status") == "cancelled":
+        st.warning(f"扫描已停止：已分析 {scan['total']}/{scan['planned']} 个ETF ({scan['source']}，{scan['finished_at']})，"
+                   "以下为已完成部分的结果。")
+    else:
+        st.success(f"批量分析完成！共分析 {scan['total']} 个ETF ({scan['source']}，{scan['finished_at']})。")
+    if scan["freshness"]:
+        st.caption(scan["freshness"])
+    if scan["skipped"]:
+        with st.expander(f"跳过 {len(scan['skipped'])} 个ETF"):
+            st.dataframe(pd.DataFrame({"ETF代码": list(scan["skipped"].keys()), "原因": list(scan["skipped"].values())}),
+                         use_container_width=True, hide_index=True)
+
+    with st.expander("💾 保存 / 对比快照", expanded=False):
+        col_name, col_save = st.columns([3, 1])
+        snapshot_name = col_name.text_input("快照名 (留空按时间命名):", key="snapshot_name_input")
+        if col_save.button("保存", key="save_snapshot_btn", disabled=bool(scan.get("snapshot"))):
+            saved_name = save_snapshot(scan, snapshot_name or None)
+            st.success(f"已保存快照 “{saved_name}”。")
+        other_snapshots = [item["name"] for item in list_snapshots() if item["name"] != scan.get("snapshot")]
+        compare_with = st.selectbox("与快照对比:", other_snapshots, index=None, key="compare_snapshot_choice",
+                                    placeholder="选择要对比的快照")
+        if compare_with:
+            df_diff = diff_results(load_results(compare_with), scan["results"])
+            counts = df_diff["变化"].value_counts()
+            st.caption(f"相对 “{compare_with}”: 新增 {counts.get('新增', 0)}，消失 {counts.get('消失', 0)}，"
+                       f"保持 {counts.get('保持', 0)} (按 ETF + 分析类型)。")
+            st.dataframe(df_diff.round(2), hide_index=True, use_container_width=True)
+
+    display_mode = st.radio("选择结果展示方式:", ("联合显示", "分开显示"), index=0, horizontal=True, key="display_mode_choice")
+    all_results = scan["results"] if display_mode == "联合显示" else []
+    results_near_maxima = [{k: v for k, v in item.items() if k != "分析类型"}
+                           for item in scan["results"] if item["分析类型"] == "靠近高点"]
+    results_near_minima = [{k: v for k, v in item.items() if k != "分析类型"}
+                           for item in scan["results"] if item["分析类型"] == "靠近低点"]
+
+    # --- 显示结果 ---
+    st.markdown("---")
+
+    # 1. 触及极值点的ETF名称摘要 (两种展示方式下都包含全部命中的ETF)
+    render_hit_summary(scan["results"])
+
+    # 2. 命中ETF的走势缩略图: 使用扫描时保留的数据一次绘制，不再逐个请求K线
+    if scan["sparklines"]:
+        hit_counts = pd.Series([item["ETF代码"] for item in scan["results"]]).value_counts()
+        codes = [code for code in hit_counts.index if code in scan["sparklines"]][:SPARKLINE_MAX_CHARTS]
+        with st.expander(f"🖼️ 命中ETF走势缩略图 (最近 {SPARKLINE_DAYS} 个交易日)", expanded=True):
+            names = {item["ETF代码"]: item["名称"] for item in scan["results"]}
+            fig = figure_cache.get_or_build(
+                ("proximity_sparklines", scan["id"], SPARKLINE_MAX_CHARTS),
+                lambda: build_sparkline_grid({code: scan["sparklines"][code] for code in codes}, names))
+            st.plotly_chart(fig, use_container_width=True)
+            if len(scan["sparklines"]) > len(codes):
+                st.caption(f"共 {len(scan['sparklines'])} 个ETF命中，按命中记录数只显示前 {len(codes)} 个。")
+
+    st.markdown("---") # 添加分隔线，将摘要与详情分开
+
+    if display_mode == "联合显示":
+        st.subheader(f"📊 综合分析结果 (范围: 极值点 ± {atr_multiplier_proximity} * ATR)")
+        if all_results:
+            df_all = format_result_table(all_results)
+            # 调整列顺序
+            cols_order = [col for col in RESULT_COLUMNS if col in df_all.columns]
+            st.dataframe(df_all[cols_order].reset_index(drop=True), use_container_width=True)
+        else:
+            st.info("没有找到符合条件（靠近局部高点或低点）的ETF。")
+
+    else: # 分开显示
+        if analyze_maxima:
+            st.subheader(f"📈 靠近历史局部高点 (范围: ± {atr_multiplier_proximity} * ATR) 的ETF")
+            if results_near_maxima:
+                df_max = format_result_table(results_near_maxima)
+                st.dataframe(df_max.reset_index(drop=True), use_container_width=True)
+            else:
+                st.info("没有找到符合条件（靠近局部高点）的ETF。")
+            st.markdown("---")
+
+        if analyze_minima:
+            st.subheader(f"📉 靠近历史局部低点 (范围: ± {atr_multiplier_proximity} * ATR) 的ETF")
+            if results_near_minima:
+                df_min = format_result_table(results_near_minima)
+                st.dataframe(df_min.reset_index(drop=True), use_container_width=True)
+            else:
+                st.info("没有找到符合条件（靠近局部低点）的ETF。")
+
+    # --- 显示可折叠的调试日志 ---
+    with st.expander("显示/隐藏 详细调试日志", expanded=False):
+        if st.session_state.debug_logs:
+            for log_entry in reversed(st.session_state.debug_logs):
+                st.code(log_entry, language=None)
+            if st.button("清除调试日志", key="clear_debug_logs_btn"):
+                st.session_state.debug_logs = []
+                st.rerun(scope="fragment")
+        else:
+            st.info("暂无调试日志。")
 
-        min_locs, _ = find_peaks(-close_series, distance=p_dist, prominence=actual_prominence)
-        min_points_data = [(close_series.index[loc], close_series.iloc[loc]) for loc in min_locs]
-        
-        return max_points_data, min_points_data, None
-    except Exception as e:
-        return None, None, f"find_peaks for {etf_code} 出错: {e}"
 
 # --- 主逻辑 ---
+# 上一次运行中的扫描被“停止扫描”或其它控件操作打断 (重跑会中止正在运行的脚本)，保留已完成的部分
+interrupted_scan = st.session_state.get('proximity_scan')
+if interrupted_scan is not None and interrupted_scan.get("status") == "running" and not analyze_button:
+    finish_scan(interrupted_scan, "cancelled")
+
 if analyze_button:
-    # 1. 根据选择确定要分析的ETF列表
-    if etf_source == "行业ETF":
-        selected_etf_map = ETF_INDUSTRY_MAPPINGS
-    else: # 自选ETF
-        selected_etf_map = ETF_SELECT_MAPPINGS
-    
-    if not selected_etf_map:
-        st.error(f"选择的 “{etf_source}” 列表为空，无法进行分析。请检查 `etf_industry_map.py`。")
+    # 1. 根据选择确定要分析的ETF列表 ({代码: 名称})
+    watchlist = {}
+    if etf_source == "全市场ETF":
+        with st.spinner("正在获取全市场ETF列表..."):
+            df_universe, universe_error = fetch_etf_universe()
+        if universe_error:
+            st.error(universe_error)
+        else:
+            watchlist = filter_liquid_etfs(df_universe, min_turnover_wan * 10000)
+            st.session_state.universe_watchlist = watchlist
+            st.caption(f"全市场共 {len(df_universe)} 个ETF，成交额不低于 {min_turnover_wan} 万元的有 {len(watchlist)} 个。")
+    else:
+        selected_etf_map = ETF_INDUSTRY_MAPPINGS if etf_source == "行业ETF" else ETF_SELECT_MAPPINGS
+        watchlist = {code: name for name, code in selected_etf_map.items()}
+
+    if not watchlist:
+        st.error(f"选择的 “{etf_source}” 列表为空，无法进行分析。请检查 `etf_industry_map.py` 或放宽流动性过滤条件。")
     elif not analyze_maxima and not analyze_minima:
         st.warning("请至少选择一种分析类型（靠近局部高点或靠近局部低点）。")
     else:
-        etf_codes_to_analyze = list(selected_etf_map.values())
-        total_etfs = len(etf_codes_to_analyze)
-        
-        # 初始化结果存储列表
-        results_near_maxima = []
-        results_near_minima = []
-        all_results = []
-        
+        total_etfs = len(watchlist)
+        # 固定列表走 swr 缓存；全市场扫描的ETF数量远超缓存容量，直接请求上游，避免挤掉常用ETF的缓存
+        fetcher = fetch_etf_daily_history if etf_source == "全市场ETF" else fetch_etf_daily_history_cached
+        add_debug_log(f"Scanning {total_etfs} ETFs from {etf_source}")
+
+        scan_params = dict(
+            history_years=selected_history_years, atr_period=atr_period_proximity,
+            peak_distance=peak_distance_input_batch, prominence_factor=peak_prominence_std_factor,
+            atr_multiplier=atr_multiplier_proximity, analyze_maxima=analyze_maxima, analyze_minima=analyze_minima,
+            min_history_days=min_history_days, min_level=min_extremum_level,
+            zone_width_multiplier=zone_width_multiplier if use_zones else None,
+        )
+        # 扫描开始时就放入 session_state 并原地追加结果，中途停止时已完成的部分不会丢失
+        scan = {
+            "id": uuid.uuid4().hex, "status": "running", "watchlist": watchlist, "scanned": set(),
+            "use_cache": fetcher is fetch_etf_daily_history_cached, "params": scan_params,
+            "results": [], "skipped": {}, "sparklines": {}, "extremes": {}, "total": total_etfs, "source": etf_source,
+            "finished_at": None, "freshness": None, "atr_multiplier": atr_multiplier_proximity,
+            "analyze_maxima": analyze_maxima, "analyze_minima": analyze_minima,
+        }
+        st.session_state.proximity_scan = scan
         progress_bar = st.progress(0)
         status_text = st.empty()
-
-        for i, etf_code_iter in enumerate(etf_codes_to_analyze):
-            etf_name = [k for k, v in selected_etf_map.items() if v == etf_code_iter][0] or "N/A"
-            status_text.info(f"正在分析: {etf_name} ({etf_code_iter}) - [{i+1}/{total_etfs}]")
-
-            df_etf_full, fetch_error = fetch_raw_etf_data_with_atr(
-                etf_code_iter, selected_history_years, atr_period_proximity
-            )
-            if fetch_error or df_etf_full.empty:
-                st.caption(f"跳过 {etf_code_iter}: {fetch_error or '无有效数据'}")
-                progress_bar.progress((i + 1) / total_etfs)
-                continue
-            
-            close_prices_series = df_etf_full['Close']
-            
-            maxima, minima, extremes_error = find_extremes_from_series(
-                etf_code_iter, close_prices_series, peak_distance_input_batch, peak_prominence_std_factor
-            )
-            if extremes_error:
-                st.caption(f"跳过 {etf_code_iter} (极值点识别): {extremes_error}")
-                progress_bar.progress((i + 1) / total_etfs)
-                continue
-
-            if df_etf_full.empty or 'Close' not in df_etf_full.columns or 'ATR' not in df_etf_full.columns:
-                st.caption(f"跳过 {etf_code_iter}: 数据不完整无法进行靠近分析。")
-                progress_bar.progress((i + 1) / total_etfs)
-                continue
-
-            current_price = df_etf_full['Close'].iloc[-1]
-            current_atr = df_etf_full['ATR'].iloc[-1]
-
-            if pd.isna(current_price) or pd.isna(current_atr) or current_atr <= 0:
-                st.caption(f"跳过 {etf_code_iter}: 当前价格或ATR无效 (Price: {current_price}, ATR: {current_atr})。")
-                progress_bar.progress((i + 1) / total_etfs)
-                continue
-
-            # 分析靠近局部高点
-            if analyze_maxima and maxima:
-                for peak_date, peak_price in maxima:
-                    upper_bound = peak_price + (atr_multiplier_proximity * current_atr)
-                    lower_bound = peak_price - (atr_multiplier_proximity * current_atr)
-                    if lower_bound <= current_price <= upper_bound:
-                        proximity_in_atr = (current_price - peak_price) / current_atr if current_atr else np.nan
-                        # 计算距离极大值的百分比
-                        current_percent = (peak_price - current_price) / current_price * 100
-                        result_item = {
-                            "ETF代码": etf_code_iter,
-                            "名称": etf_name,
-                            "当前价格": current_price,
-                            "极值点日期": peak_date.strftime('%Y-%m-%d'),
-                            "极值点价格": peak_price,
-                            "当前ATR": current_atr,
-                            "距离ATR倍数": proximity_in_atr,
-                            "距离百分比": current_percent
-                        }
-                        if display_mode == "联合显示":
-                            result_item["分析类型"] = "靠近高点"
-                            all_results.append(result_item)
-                        else: # 分开显示
-                            results_near_maxima.append(result_item)
-            
-            # 分析靠近局部低点
-            if analyze_minima and minima:
-                for valley_date, valley_price in minima:
-                    upper_bound = valley_price + (atr_multiplier_proximity * current_atr)
-                    lower_bound = valley_price - (atr_multiplier_proximity * current_atr)
-                    if lower_bound <= current_price <= upper_bound:
-                        proximity_in_atr = (current_price - valley_price) / current_atr if current_atr else np.nan
-                        # 计算距离极小值的百分比
-                        current_percent = (valley_price - current_price) / current_price * 100
-                        result_item = {
-                            "ETF代码": etf_code_iter,
-                            "名称": etf_name,
-                            "当前价格": current_price,
-                            "极值点日期": valley_date.strftime('%Y-%m-%d'),
-                            "极值点价格": valley_price,
-                            "当前ATR": current_atr,
-                            "距离ATR倍数": proximity_in_atr,
-                            "距离百分比": current_percent
-                        }
-                        if display_mode == "联合显示":
-                            result_item["分析类型"] = "靠近低点"
-                            all_results.append(result_item)
-                        else: # 分开显示
-                            results_near_minima.append(result_item)
-
-            progress_bar.progress((i + 1) / total_etfs)
-        
-        status_text.success(f"批量分析完成！共分析 {total_etfs} 个ETF。")
-
-        # --- 显示结果 ---
-        st.markdown("---")
-
-        # 1. NEW: 创建并显示触及极值点的ETF名称摘要
-        found_etf_names = set()
-        # 从所有结果中收集ETF名称
-        if display_mode == "联合显示":
-            for item in all_results:
-                found_etf_names.add(f"{item['名称']} ({item['ETF代码']})")
-        else: # 分开显示模式
-            for item in results_near_maxima:
-                found_etf_names.add(f"{item['名称']} ({item['ETF代码']})")
-            for item in results_near_minima:
-                found_etf_names.add(f"{item['名称']} ({item['ETF代码']})")
-
-        st.subheader("📣 触及极值点ETF一览")
-        if found_etf_names:
-            # 排序后显示，更清晰
-            sorted_names = sorted(list(found_etf_names))
-            # 使用多列布局以获得更好的视觉效果
-            num_columns = 5
-            cols = st.columns(num_columns)
-            for i, name in enumerate(sorted_names):
-                with cols[i % num_columns]:
-                    st.success(name)
-        else:
-            st.info("本次分析未发现任何触及极值点的ETF。")
-        
-        st.markdown("---") # 添加分隔线，将摘要与详情分开
-
-        if display_mode == "联合显示":
-            st.subheader(f"📊 综合分析结果 (范围: 极值点 ± {atr_multiplier_proximity} * ATR)")
-            if all_results:
-                df_all = pd.DataFrame(all_results)
-                # 格式化输出
-                df_all['当前价格'] = df_all['当前价格'].map('{:.3f}'.format)
-                df_all['极值点价格'] = df_all['极值点价格'].map('{:.3f}'.format)
-                df_all['当前ATR'] = df_all['当前ATR'].map('{:.4f}'.format)
-                df_all['距离ATR倍数'] = df_all['距离ATR倍数'].map('{:.2f}'.format)
-                df_all['距离百分比'] = df_all['距离百分比'].map('{:.2f}'.format)
-                # 调整列顺序
-                cols_order = ["ETF代码", "名称", "分析类型", "当前价格", "极值点日期", "极值点价格", "当前ATR", "距离ATR倍数", "距离百分比"]
-                st.dataframe(df_all[cols_order].reset_index(drop=True), use_container_width=True)
-            else:
-                st.info("没有找到符合条件（靠近局部高点或低点）的ETF。")
-
-        else: # 分开显示
-            if analyze_maxima:
-                st.subheader(f"📈 靠近历史局部高点 (范围: ± {atr_multiplier_proximity} * ATR) 的ETF")
-                if results_near_maxima:
-                    df_max = pd.DataFrame(results_near_maxima)
-                    df_max['当前价格'] = df_max['当前价格'].map('{:.3f}'.format)
-                    df_max['极值点价格'] = df_max['极值点价格'].map('{:.3f}'.format)
-                    df_max['当前ATR'] = df_max['当前ATR'].map('{:.4f}'.format)
-                    df_max['距离ATR倍数'] = df_max['距离ATR倍数'].map('{:.2f}'.format)
-                    df_max['距离百分比'] = df_max['距离百分比'].map('{:.2f}'.format)
-                    st.dataframe(df_max.reset_index(drop=True), use_container_width=True)
-                else:
-                    st.info("没有找到符合条件（靠近局部高点）的ETF。")
-                st.markdown("---")
-
-            if analyze_minima:
-                st.subheader(f"📉 靠近历史局部低点 (范围: ± {atr_multiplier_proximity} * ATR) 的ETF")
-                if results_near_minima:
-                    df_min = pd.DataFrame(results_near_minima)
-                    df_min['当前价格'] = df_min['当前价格'].map('{:.3f}'.format)
-                    df_min['极值点价格'] = df_min['极值点价格'].map('{:.3f}'.format)
-                    df_min['当前ATR'] = df_min['当前ATR'].map('{:.4f}'.format)
-                    df_min['距离ATR倍数'] = df_min['距离ATR倍数'].map('{:.2f}'.format)
-                    df_min['距离百分比'] = df_min['距离百分比'].map('{:.2f}'.format)
-                    st.dataframe(df_min.reset_index(drop=True), use_container_width=True)
-                else:
-                    st.info("没有找到符合条件（靠近局部低点）的ETF。")
-        
-        # --- 显示可折叠的调试日志 ---
-        with st.expander("显示/隐藏 详细调试日志", expanded=False):
-            if st.session_state.debug_logs:
-                for log_entry in reversed(st.session_state.debug_logs):
-                    st.code(log_entry, language=None)
-                if st.button("清除调试日志", key="clear_debug_logs_btn"):
-                    st.session_state.debug_logs = []
-                    st.rerun()
-            else:
-                st.info("暂无调试日志。")
-else:
-    st.info("请在左侧配置参数，然后点击“开始批量分析”按钮。")
\ No newline at end of file
+        live_view = st.empty() # 扫描过程中刷新的命中一览和结果表
+
+        started = last_drawn = time.time()
+        drawn_hits = 0
+        # 每个ETF完成后立即返回；脚本被中止时 closing 关闭生成器，取消尚未开始的ETF
+        with closing(iter_scan(watchlist, fetcher=fetcher, **scan_params)) as scan_results:
+            for code, found, error, sparkline, extremes in scan_results:
+                scan["scanned"].add(code)
+                if error:
+                    scan["skipped"][code] = error
+                if sparkline is not None:
+                    scan["sparklines"][code] = sparkline
+                if extremes is not None:
+                    scan["extremes"][code] = extremes
+                scan["results"].extend(found)
+                done = len(scan["scanned"])
+                progress_bar.progress(done / total_etfs)
+                status_text.info(f"已扫描 {done}/{total_etfs} 个ETF，发现 {len(scan['results'])} 条靠近记录，"
+                                 f"跳过 {len(scan['skipped'])} 个。可随时点击侧边栏“停止扫描”，保留已扫描部分的结果。")
+                # 第一条命中立即显示，之后有新命中时最多每 LIVE_REFRESH_SECONDS 秒重绘一次
+                if len(scan["results"]) > drawn_hits and (not drawn_hits or time.time() - last_drawn >= LIVE_REFRESH_SECONDS):
+                    with live_view.container():
+                        render_live_scan(scan)
+                    drawn_hits, last_drawn = len(scan["results"]), time.time()
+        live_view.empty()
+        status_text.empty()
+        progress_bar.empty()
+        add_debug_log(f"Scan done: {total_etfs} ETFs, {len(scan['results'])} hits, {len(scan['skipped'])} skipped, "
+                      f"{time.time() - started:.1f}s")
+        finish_scan(scan, "done")
+
+if 'proximity_scan' in st.session_state:
+    render_scan_results()
+elif not analyze_button:
+    st.info("请在左侧配置参数，然后点击“开始批量分析”按钮。")
@@ -0,0 +1,126 @@
+# pages/5_ATR_Stop_Backtest.py
+import streamlit as st
+from etf_analysis import fetch_etf_daily_history_cached # 与极值点页面共用的日K缓存
+from atr_backtest import build_price_panel, backtest_atr_stop_grid, summarize_grid # 向量化ATR止损回测
+import plotly.graph_objects as go
+import time
+
+# --- 导入ETF映射 ---
+try:
+    from etf_industry_map import ETF_INDUSTRY_MAPPINGS, ETF_SELECT_MAPPINGS
+except ImportError:
+    st.sidebar.warning("`etf_industry_map.py` 中未找到ETF映射。将使用预设的ETF列表。")
+    ETF_INDUSTRY_MAPPINGS = {
+        "半导体": "512480", "医疗器械": "159883", "酿酒行业": "512690",
+        "银行": "512800", "证券": "512880", "光伏设备": "159863",
+    }
+    ETF_SELECT_MAPPINGS = {
+        "纳指ETF": "513100", "沪深300": "510300", "黄金ETF": "518880",
+    }
+
+st.set_page_config(page_title="ATR止损参数回测", layout="wide")
+st.title("🧪 ATR 移动止损参数回测")
+st.markdown(
+    "把K线页面的止损规则 (`收盘价 - ATR倍数 * ATR`，只升不降) 放到历史上回放: "
+    "每个交易日都视为一次以收盘价买入的样本，统计在不同 ATR周期 x ATR倍数 组合下的止损触发率、平均回撤和持有天数。"
+)
+
+# --- 侧边栏参数配置 ---
+st.sidebar.header("回测参数配置")
+etf_source = st.sidebar.radio("选择ETF列表:", ("行业ETF", "自选ETF"), key="bt_etf_source")
+selected_etf_map = ETF_INDUSTRY_MAPPINGS if etf_source == "行业ETF" else ETF_SELECT_MAPPINGS
+history_years = st.sidebar.slider("历史数据年限:", min_value=1, max_value=5, value=2, step=1, key="bt_years")
+
+st.sidebar.subheader("参数网格")
+period_range = st.sidebar.slider("ATR周期范围 (天):", min_value=5, max_value=50, value=(5, 50), step=1, key="bt_periods")
+period_step = st.sidebar.number_input("ATR周期步长:", min_value=1, max_value=10, value=1, step=1, key="bt_period_step")
+multipliers = st.sidebar.multiselect("ATR倍数:", [1.0, 1.5, 2.0, 2.5, 3.0], default=[1.0, 1.5, 2.0, 2.5, 3.0], key="bt_multipliers")
+horizon = st.sidebar.number_input("最长持有天数:", min_value=5, max_value=250, value=60, step=5, key="bt_horizon",
+                                  help="买入后持有满该天数仍未触发止损，则按收盘价离场。")
+run_button = st.sidebar.button("🚀 开始回测", key="bt_run")
+
+METRIC_OPTIONS = ["止损触发率", "平均回撤(%)", "平均持有天数", "平均收益(%)"]
+
+
+def build_grid_heatmap(df_summary, metric):
+    """ATR周期 x ATR倍数 的汇总指标热力图。"""
+    grid = df_summary.pivot(index="ATR倍数", columns="ATR周期", values=metric)
+    fig = go.Figure(go.Heatmap(
+        z=grid.values, x=grid.columns, y=[f"{m:.1f}x" for m in grid.index],
+        colorscale="RdYlGn" if metric == "平均收益(%)" else "Viridis",
+        colorbar=dict(title=metric),
+        hovertemplate="ATR周期 %{x}<br>ATR倍数 %{y}<br>" + metric + " %{z:.3f}<extra></extra>",
+    ))
+    fig.update_layout(title=f"全部ETF汇总: {metric}", xaxis_title="ATR周期 (天)", yaxis_title="ATR倍数", height=420)
+    return fig
+
+
+if run_button:
+    if not multipliers:
+        st.warning("请至少选择一个ATR倍数。")
+    else:
+        periods = list(range(period_range[0], period_range[1] + 1, int(period_step)))
+        frames, skipped = {}, []
+        progress_bar = st.progress(0)
+        status_text = st.empty()
+        for i, (etf_name, etf_code) in enumerate(selected_etf_map.items()):
+            status_text.info(f"正在获取: {etf_name} ({etf_code}) - [{i+1}/{len(selected_etf_map)}]")
+            df, error = fetch_etf_daily_history_cached(etf_code, history_years)
+            if error or df.empty:
+                skipped.append(f"{etf_code}: {error or '无有效数据'}")
+            else:
+                frames[etf_code] = df
+            progress_bar.progress((i + 1) / len(selected_etf_map))
+        status_text.empty()
+        progress_bar.empty()
+
+        panel = build_price_panel(frames)
+        if panel is None:
+            st.error("没有获取到任何ETF数据，无法回测。")
+        else:
+            with st.spinner(f"回测 {len(periods)} 个周期 x {len(multipliers)} 个倍数 x {len(frames)} 个ETF..."):
+                started = time.perf_counter()
+                df_results = backtest_atr_stop_grid(panel, periods, sorted(multipliers), horizon=int(horizon))
+                elapsed = time.perf_counter() - started
+            if df_results.empty:
+                st.warning("历史数据长度不足以覆盖持有期，请增加数据年限或缩短最长持有天数。")
+            else:
+                code_to_name = {v: k for k, v in selected_etf_map.items()}
+                df_results.insert(3, "名称", df_results["ETF代码"].map(code_to_name))
+                st.session_state.bt_results = df_results
+                st.session_state.bt_caption = f"回测耗时 {elapsed:.2f} 秒，共 {len(frames)} 个ETF、{len(panel['dates'])} 个交易日。"
+        if skipped:
+            with st.expander(f"跳过 {len(skipped)} 个ETF"):
+                for msg in skipped:
+                    st.caption(msg)
+
+# 回测结果保存在 session_state 中，切换展示指标时无需重新回测
+if "bt_results" in st.session_state:
+    df_results = st.session_state.bt_results
+    df_summary = summarize_grid(df_results)
+    st.caption(st.session_state.bt_caption)
+
+    selected_metric = st.selectbox("热力图指标:", METRIC_OPTIONS, index=3, key="bt_metric")
+    st.plotly_chart(build_grid_heatmap(df_summary, selected_metric), use_container_width=True)
+
+    st.subheader("参数组合汇总 (按样本数加权)")
+    st.dataframe(df_summary.sort_values("平均收益(%)", ascending=False), hide_index=True, use_container_width=True,
+                 column_config={
+                     "止损触发率": st.column_config.NumberColumn(format="%.2f"),
+                     "平均回撤(%)": st.column_config.NumberColumn(format="%.2f"),
+                     "平均持有天数": st.column_config.NumberColumn(format="%.1f"),
+                     "平均收益(%)": st.column_config.NumberColumn(format="%.2f"),
+                 })
+
+    st.subheader("单个参数组合的ETF明细")
+    col1, col2 = st.columns(2)
+    detail_period = col1.selectbox("ATR周期:", sorted(df_results["ATR周期"].unique()), key="bt_detail_period")
+    detail_multiplier = col2.selectbox("ATR倍数:", sorted(df_results["ATR倍数"].unique()), key="bt_detail_multiplier")
+    df_detail = df_results[(df_results["ATR周期"] == detail_period) & (df_results["ATR倍数"] == detail_multiplier)]
+    st.dataframe(df_detail.drop(columns=["ATR周期", "ATR倍数"]).round(3), hide_index=True, use_container_width=True)
+else:
+    st.info("请在左侧设置参数网格后点击“开始回测”。")
+
+st.markdown("---")
+st.caption("说明: 止损价在买入当日按收盘价和ATR确定，之后每日收盘后上移 (只升不降)；次日起最低价触及止损价即离场，"
+           "跳空低开时按开盘价成交。回测只统计止损规则本身的表现，不构成投资建议。")
@@ -0,0 +1,98 @@
+# pages/6_Sector_Flow_Heatmap.py
+import streamlit as st
+from sector_flow_panel import (SECTOR_TYPES, load_panel, load_meta, panel_age_seconds, panel_is_current,
+                               start_background_update, get_update_status) # 预先构建并持久化的全板块资金流面板
+from swr_cache import format_age
+from figure_cache import figure_cache, data_fingerprint # 图表缓存
+import pandas as pd
+import plotly.graph_objects as go
+
+PANEL_REFRESH_SECONDS = 6 * 3600 # 面板超过6小时未更新且可能有新交易日数据时，打开页面自动在后台增量更新
+
+st.set_page_config(page_title="全板块资金流热力图", layout="wide")
+st.title("🌡️ 全板块主力资金流热力图")
+st.markdown("基于本地保存的全板块主力净流入面板 (亿元)，按 板块 x 日期 展示滚动累计资金流。")
+
+# --- 侧边栏参数配置 ---
+st.sidebar.header("参数配置")
+sector_type = st.sidebar.radio("板块类型:", list(SECTOR_TYPES.keys()), key="heatmap_sector_type")
+rolling_window = st.sidebar.selectbox("滚动累计窗口 (交易日):", [1, 3, 5, 10, 20], index=2, key="heatmap_window",
+                                      help="每个格子显示截至当日的 N 日主力净流入之和，1 表示当日净流入。")
+display_days = st.sidebar.slider("显示最近交易日数:", min_value=10, max_value=250, value=60, step=5, key="heatmap_days")
+sort_order = st.sidebar.radio("按区间累计净流入排序:", ("从高到低", "从低到高"), key="heatmap_sort")
+top_n = st.sidebar.slider("显示板块数:", min_value=10, max_value=200, value=40, step=5, key="heatmap_top_n")
+update_button = st.sidebar.button("🔄 立即更新面板", key="heatmap_update_btn")
+
+
+def build_flow_heatmap(df_window, title):
+    """板块 x 日期 的资金流热力图，红色为净流入、绿色为净流出。"""
+    fig = go.Figure(go.Heatmap(
+        z=df_window.values,
+        x=[d.strftime('%Y-%m-%d') for d in df_window.columns],
+        y=df_window.index,
+        colorscale=[[0, 'green'], [0.5, 'white'], [1, 'red']],
+        zmid=0,
+        colorbar=dict(title="亿元"),
+        hovertemplate="%{y}<br>%{x}<br>%{z:.2f} 亿元<extra></extra>",
+    ))
+    fig.update_layout(
+        title=title,
+        height=max(400, 18 * len(df_window.index) + 120),
+        xaxis=dict(type='category', tickangle=-45, nticks=20),
+        yaxis=dict(autorange='reversed'), # 第一行为排序第一的板块
+        margin=dict(l=10, r=10, t=60, b=10),
+    )
+    return fig
+
+
+# --- 面板状态与后台更新 ---
+panel_age = panel_age_seconds(sector_type)
+if update_button or panel_age is None or (panel_age > PANEL_REFRESH_SECONDS and not panel_is_current(sector_type)):
+    start_background_update(sector_type)
+
+update_status = get_update_status(sector_type)
+meta = load_meta(sector_type)
+status_parts = []
+if panel_age is not None:
+    status_parts.append(f"面板更新于 {format_age(panel_age)} ({meta.get('updated_at')})")
+if update_status["running"]:
+    status_parts.append(f"后台更新中 {update_status['done']}/{update_status['total'] or '?'}")
+elif update_status["error"]:
+    status_parts.append(f"最近一次更新: {update_status['error']}")
+if status_parts:
+    st.caption(" | ".join(status_parts))
+
+df_panel = load_panel(sector_type)
+if df_panel.empty:
+    st.info("资金流面板尚未构建，正在后台获取全部板块的历史资金流 (首次约需数分钟)。"
+            "也可以在命令行运行 `python sector_flow_panel.py` 预先构建。")
+    if st.button("刷新查看进度", key="heatmap_progress_btn"):
+        st.rerun()
+else:
+    # 滚动累计在完整面板上计算，保证显示区间第一天也是完整的 N 日累计
+    df_rolling = df_panel.rolling(rolling_window, min_periods=1).sum() if rolling_window > 1 else df_panel
+    df_recent = df_rolling.iloc[-display_days:]
+    cumulative = df_panel.iloc[-len(df_recent):].sum(skipna=True)
+    ordered = cumulative.sort_values(ascending=(sort_order == "从低到高")).index[:top_n]
+    df_window = df_recent[ordered].T
+
+    start_label = df_recent.index[0].strftime('%Y-%m-%d')
+    end_label = df_recent.index[-1].strftime('%Y-%m-%d')
+    title = f"{sector_type} {rolling_window}日滚动主力净流入 ({start_label} ~ {end_label}，按区间累计{sort_order})"
+    figure_key = ("sector_flow_heatmap", data_fingerprint(df_panel), rolling_window, display_days, sort_order, top_n)
+    fig = figure_cache.get_or_build(figure_key, lambda: build_flow_heatmap(df_window, title))
+    st.plotly_chart(fig, use_container_width=True)
+
+    st.subheader("区间累计主力净流入排名")
+    df_rank = pd.DataFrame({
+        "板块": ordered,
+        "区间累计净流入(亿元)": cumulative[ordered].round(2).values,
+        f"最新{rolling_window}日净流入(亿元)": df_recent[ordered].iloc[-1].round(2).values,
+    })
+    st.dataframe(df_rank, hide_index=True, use_container_width=True)
+    st.caption(f"面板共 {df_panel.shape[0]} 个交易日 x {df_panel.shape[1]} 个板块 "
+               f"({df_panel.index.min().strftime('%Y-%m-%d')} ~ {df_panel.index.max().strftime('%Y-%m-%d')})。")
+    if meta.get("errors"):
+        with st.expander(f"最近一次更新失败的板块 ({len(meta['errors'])})"):
+            st.dataframe(pd.DataFrame({"板块": list(meta["errors"].keys()), "原因": list(meta["errors"].values())}),
+                         hide_index=True, use_container_width=True)
@@ -0,0 +1,85 @@
+# pages/7_Relative_Strength.py
+import streamlit as st
+from etf_analysis import fetch_etf_daily_history_cached # 与其它页面共用的日K缓存
+from relative_strength import LOOKBACKS, VOL_WINDOW, HIGH_WINDOW, build_close_panel, get_board # 横截面相对强弱排名
+import pandas as pd
+
+# --- 导入ETF映射 ---
+try:
+    from etf_industry_map import ETF_INDUSTRY_MAPPINGS, ETF_SELECT_MAPPINGS
+except ImportError:
+    st.sidebar.warning("`etf_industry_map.py` 中未找到ETF映射。将使用预设的ETF列表。")
+    ETF_INDUSTRY_MAPPINGS = {
+        "半导体": "512480", "医疗器械": "159883", "酿酒行业": "512690",
+        "银行": "512800", "证券": "512880", "光伏设备": "159863",
+    }
+    ETF_SELECT_MAPPINGS = {
+        "纳指ETF": "513100", "沪深300": "510300", "黄金ETF": "518880",
+    }
+
+st.set_page_config(page_title="ETF相对强弱排名", layout="wide")
+st.title("🏁 ETF 相对强弱排名")
+st.markdown(
+    f"对列表中的全部ETF同时计算 {'/'.join(map(str, LOOKBACKS))} 日收益、波动调整动量 "
+    f"(N日收益 / ({VOL_WINDOW}日收益率标准差 * √N)) 和距近 {HIGH_WINDOW} 日高点的回撤，"
+    "按各指标当日在列表中的百分位取平均得到综合得分。点击表头可按任意列排序。"
+)
+
+# --- 侧边栏参数配置 ---
+st.sidebar.header("参数配置")
+etf_source = st.sidebar.radio("选择ETF列表:", ("全部", "行业ETF", "自选ETF"), key="rs_etf_source")
+if etf_source == "行业ETF":
+    selected_etf_map = ETF_INDUSTRY_MAPPINGS
+elif etf_source == "自选ETF":
+    selected_etf_map = ETF_SELECT_MAPPINGS
+else:
+    selected_etf_map = {**ETF_INDUSTRY_MAPPINGS, **ETF_SELECT_MAPPINGS}
+compare_days = st.sidebar.selectbox("排名变化对比 (交易日前):", [1, 5, 10, 20], index=1, key="rs_compare_days")
+
+# --- 数据获取 (日K走 swr 缓存，重跑时不重复请求) ---
+names = {code: name for name, code in selected_etf_map.items()}
+frames, skipped = {}, {}
+progress_bar = st.progress(0)
+for i, code in enumerate(names):
+    df, error = fetch_etf_daily_history_cached(code, 1)
+    if error or df.empty:
+        skipped[code] = error or "无有效数据"
+    else:
+        frames[code] = df
+    progress_bar.progress((i + 1) / len(names))
+progress_bar.empty()
+
+close_panel = build_close_panel(frames)
+if close_panel.empty:
+    st.error("没有获取到任何ETF数据，无法排名。")
+    st.stop()
+
+# 排名面板常驻进程内: 只有新增交易日时只计算新增的行
+board = get_board(etf_source)
+computed_days = board.update(close_panel)
+dates = board.close.index
+st.caption(f"{len(frames)} 个ETF x {len(dates)} 个交易日 ({dates[0].strftime('%Y-%m-%d')} ~ {dates[-1].strftime('%Y-%m-%d')})，"
+           f"本次计算 {computed_days} 个交易日。")
+
+date_options = list(dates[-60:])
+ranking_date = st.select_slider("排名日期:", options=date_options, value=date_options[-1],
+                                format_func=lambda d: d.strftime('%Y-%m-%d'), key="rs_date")
+df_rank = board.ranking(ranking_date, names, compare_days)
+
+column_config = {
+    "综合得分": st.column_config.ProgressColumn(format="%.1f", min_value=0, max_value=100),
+    "距高点(%)": st.column_config.NumberColumn(format="%.2f"),
+}
+for n in LOOKBACKS:
+    column_config[f"{n}日收益(%)"] = st.column_config.NumberColumn(format="%.2f")
+    column_config[f"{n}日波动调整动量"] = st.column_config.NumberColumn(format="%.2f")
+st.dataframe(df_rank, hide_index=True, use_container_width=True, height=min(35 * len(df_rank) + 40, 900),
+             column_config=column_config)
+
+if skipped:
+    with st.expander(f"跳过 {len(skipped)} 个ETF"):
+        st.dataframe(pd.DataFrame({"ETF代码": list(skipped.keys()), "原因": list(skipped.values())}),
+                     hide_index=True, use_container_width=True)
+
+st.markdown("---")
+st.caption("说明: 排名只反映列表内ETF之间的相对强弱，不构成投资建议。")
@@ -0,0 +1,383 @@
+# proximity_monitor.py
+# 交易时段常驻的极值点靠近监控:
+# - 启动时 (以及每个新交易日) 为监控列表载入日K线，计算多级别极值点 (或合并后的支撑/阻力区间) 和ATR并常驻内存，
+#   极值点、级别过滤和区间的计算与页面4的批量扫描相同 (etf_analysis.find_scan_extremes / build_extremum_zones)
+# - 每分钟拉取一次全市场ETF实时行情，只重新评估价格有变化的ETF
+# - 当价格进入/离开某个极值点 (或区间) ± n*ATR 的范围时产生 enter / exit 事件，分发给可插拔的输出端
+#
+# 单独运行: python proximity_monitor.py --source 行业ETF --event-file alerts.jsonl
+# 也可以由页面在进程内启动 (见 start_background_monitor)，事件通过 FeedSink 在页面上展示。
+import argparse
+import json
+import threading
+import time
+import urllib.request
+from collections import deque
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+import akshare as ak
+import numpy as np
+import pandas as pd
+
+from etf_analysis import fetch_etf_daily_history, compute_atr, find_scan_extremes, build_extremum_zones
+from resilient_fetch import resilient_call
+from trade_calendar import is_trading_day
+
+
+def is_trading_time(now=None):
+    """是否处于A股连续竞价时段 (交易日 9:30-11:30, 13:00-15:00，节假日按交易日历休市)。"""
+    now = now or datetime.now()
+    if not is_trading_day(now):
+        return False
+    minutes = now.hour * 60 + now.minute
+    return (9 * 60 + 30 <= minutes <= 11 * 60 + 30) or (13 * 60 <= minutes <= 15 * 60)
+
+
+# --- 事件输出端 ---
+class FileSink:
+    """把事件以 JSON Lines 追加写入文件。"""
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def emit(self, event):
+        with self._lock, open(self.path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(event, ensure_ascii=False) + "\n")
+
+
+class WebhookSink:
+    """把事件以 JSON POST 到本地 webhook 地址 (见 serve_webhook_receiver)，失败只计数不抛出。"""
+
+    def __init__(self, url, timeout=2.0):
+        self.url = url
+        self.timeout = timeout
+        self.failures = 0
+
+    def emit(self, event):
+        body = json.dumps(event, ensure_ascii=False).encode("utf-8")
+        request = urllib.request.Request(self.url, data=body, headers={"Content-Type": "application/json"})
+        try:
+            urllib.request.urlopen(request, timeout=self.timeout).close()
+        except Exception:
+            self.failures += 1
+
+
+class FeedSink:
+    """保存最近的事件供页面展示 (进程内共享)。"""
+
+    def __init__(self, maxlen=200):
+        self._events = deque(maxlen=maxlen)
+        self._lock = threading.Lock()
+
+    def emit(self, event):
+        with self._lock:
+            self._events.append(event)
+
+    def recent(self, n=50):
+        """返回最近 n 条事件，最新的在前。"""
+        with self._lock:
+            return list(self._events)[-n:][::-1]
+
+
+class _SymbolState:
+    """
+    单个ETF常驻内存的监控状态: 各极值点 (或区间) 的价格范围、ATR 以及当前处于哪些范围的靠近区间内。
+    targets 为 DataFrame[类型, 极值级别, 日期, 下沿, 上沿, 中枢, 触及次数]，单个极值点的下沿 = 上沿 = 中枢。
+    """
+
+    __slots__ = ("name", "kinds", "levels", "dates", "lower", "upper", "center", "touches", "atr", "last_price", "inside")
+
+    def __init__(self, name, targets, atr):
+        self.name = name
+        self.kinds = targets['类型'].tolist()
+        self.levels = targets['极值级别'].tolist()
+        self.dates = [d.strftime('%Y-%m-%d') for d in targets['日期']]
+        self.lower = targets['下沿'].to_numpy(dtype=float)
+        self.upper = targets['上沿'].to_numpy(dtype=float)
+        self.center = targets['中枢'].to_numpy(dtype=float)
+        self.touches = targets['触及次数'].to_numpy(dtype=int)
+        self.atr = float(atr)
+        self.last_price = None
+        self.inside = np.zeros(len(targets), dtype=bool)
+
+    def keys(self):
+        """每个极值点 (或区间) 的标识 (类型, 日期, 级别)，用于重新载入时对应新旧状态。"""
+        return list(zip(self.kinds, self.dates, self.levels))
+
+
+class ProximityMonitor:
+    """
+    极值点靠近监控器。
+    watchlist: {ETF代码: 名称}; sinks: 带 emit(event) 方法的输出端列表。
+    其余参数与页面4的批量扫描 (etf_scan.scan_etf) 相同: min_level 为最低极值级别，
+    zone_width_multiplier 不为空时把极值点合并为该倍数ATR宽的区间，按区间判断靠近。
+    """
+
+    def __init__(self, watchlist, sinks, atr_multiplier=2.0, atr_period=14,
+                 peak_distance=10, prominence_factor=0.5, history_years=2, min_level=1,
+                 zone_width_multiplier=None, analyze_maxima=True, analyze_minima=True):
+        self.watchlist = dict(watchlist)
+        self.sinks = list(sinks)
+        self.atr_multiplier = atr_multiplier
+        self.atr_period = atr_period
+        self.peak_distance = peak_distance
+        self.prominence_factor = prominence_factor
+        self.history_years = history_years
+        self.min_level = min_level
+        self.zone_width_multiplier = zone_width_multiplier
+        self.analyze_maxima = analyze_maxima
+        self.analyze_minima = analyze_minima
+        self.states = {}
+        self.loaded_date = None
+        self.load_errors = {}
+        self.stats = {"price_updates": 0, "symbols_evaluated": 0, "events": 0}
+
+    def _targets(self, close, atr):
+        """与批量扫描相同的极值点或区间，返回 _SymbolState 使用的 targets。"""
+        extremes = find_scan_extremes(close, self.peak_distance, self.prominence_factor, self.min_level)
+        if self.zone_width_multiplier:
+            zones = build_extremum_zones(extremes, self.zone_width_multiplier * atr)
+            targets = pd.DataFrame({
+                '类型': np.where(zones['高点数'] >= zones['低点数'], "高点", "低点"), '极值级别': zones['极值级别'],
+                '日期': zones['最近触及'], '下沿': zones['下沿'], '上沿': zones['上沿'], '中枢': zones['中枢'],
+                '触及次数': zones['触及次数'],
+            })
+        else:
+            targets = pd.DataFrame({
+                '类型': extremes['类型'], '极值级别': extremes['极值级别'], '日期': extremes['日期'],
+                '下沿': extremes['价格'], '上沿': extremes['价格'], '中枢': extremes['价格'], '触及次数': 1,
+            })
+        kinds = [kind for kind, enabled in (("高点", self.analyze_maxima), ("低点", self.analyze_minima)) if enabled]
+        return targets[targets['类型'].isin(kinds)].reset_index(drop=True)
+
+    def load(self):
+        """
+        为监控列表计算极值点 (或区间) 和ATR (每个交易日一次)。
+        重新载入后仍存在的极值点 (类型、日期、级别相同) 沿用原来的“是否在靠近范围内”状态，不会重复产生 enter 事件。
+        """
+        states, errors = {}, {}
+        for code, name in self.watchlist.items():
+            df, error = fetch_etf_daily_history(code, self.history_years)
+            if error:
+                errors[code] = error
+                continue
+            if len(df) < self.peak_distance * 2:
+                errors[code] = f"极值点识别: 数据点不足 ({len(df)})"
+                continue
+            atr = compute_atr(df, self.atr_period).iloc[-1]
+            if pd.isna(atr) or atr <= 0:
+                errors[code] = "ATR无效"
+                continue
+            state = _SymbolState(name, self._targets(df['Close'], atr), atr)
+            previous = self.states.get(code)
+            if previous is not None:
+                was_inside = {key: inside for key, inside in zip(previous.keys(), previous.inside)}
+                state.inside = np.array([was_inside.get(key, False) for key in state.keys()], dtype=bool)
+            states[code] = state
+        self.states = states
+        self.load_errors = errors
+        self.loaded_date = datetime.now().date()
+
+    def update_prices(self, prices, timestamp=None):
+        """
+        输入 {ETF代码: 最新价}，只评估价格有变化的ETF，返回本次产生的事件列表。
+        每个ETF的判断是对其全部极值点 (或区间) 的一次向量化比较: 与范围的距离 (处于区间内部时为0) 不超过 n*ATR 即为靠近。
+        """
+        timestamp = timestamp or datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        self.stats["price_updates"] += 1
+        events = []
+        for code, price in prices.items():
+            state = self.states.get(code)
+            if state is None or price is None or pd.isna(price) or price == state.last_price:
+                continue
+            state.last_price = price
+            self.stats["symbols_evaluated"] += 1
+            if len(state.center) == 0:
+                continue
+            gap = np.maximum(state.lower - price, 0) + np.maximum(price - state.upper, 0)
+            inside_now = gap <= self.atr_multiplier * state.atr
+            changed = np.flatnonzero(inside_now != state.inside)
+            for i in changed:
+                event = {
+                    "time": timestamp,
+                    "event": "enter" if inside_now[i] else "exit",
+                    "ETF代码": code,
+                    "名称": state.name,
+                    "极值类型": state.kinds[i],
+                    "极值级别": state.levels[i],
+                    "极值点日期": state.dates[i],
+                    "极值点价格": round(float(state.center[i]), 4),
+                }
+                if self.zone_width_multiplier:
+                    event.update({"区间下沿": round(float(state.lower[i]), 4), "区间上沿": round(float(state.upper[i]), 4),
+                                  "触及次数": int(state.touches[i])})
+                event.update({
+                    "当前价格": round(float(price), 4),
+                    "当前ATR": round(state.atr, 4),
+                    "距离ATR倍数": round(float((price - state.center[i]) / state.atr), 2),
+                })
+                events.append(event)
+            state.inside = inside_now
+        for event in events:
+            for sink in self.sinks:
+                sink.emit(event)
+        self.stats["events"] += len(events)
+        return events
+
+    def run(self, stop_event, poll_interval=60):
+        """主循环: 非交易时段休眠，交易时段每 poll_interval 秒拉取一次实时行情。"""
+        while not stop_event.is_set():
+            now = datetime.now()
+            trading = is_trading_time(now)
+            if self.loaded_date is None or (trading and self.loaded_date != now.date()):
+                self.load()
+            if trading:
+                try:
+                    self.update_prices(fetch_spot_prices(self.states.keys()))
+                except Exception as e:
+                    self.load_errors["spot"] = f"获取实时行情失败: {e}"
+            stop_event.wait(poll_interval)
+
+
+def fetch_spot_prices(codes):
+    """一次请求获取全部ETF的实时行情，返回 {代码: 最新价}。"""
+    codes = set(codes)
+    df = resilient_call(ak.fund_etf_spot_em)
+    df = df[df['代码'].isin(codes)]
+    prices = pd.to_numeric(df['最新价'], errors='coerce')
+    return dict(zip(df['代码'], prices))
+
+
+# --- 进程内后台监控 (供页面使用) ---
+# 监控器全进程只有一个，由启动它的会话 (owner) 控制: 只有 owner 修改配置会重启监控器，也只有 owner 能停止它；
+# 其它会话只复用并展示同一个事件流。owner 超过 OWNER_TIMEOUT_SECONDS 没有心跳 (会话已关闭) 时可被其它会话接管。
+OWNER_TIMEOUT_SECONDS = 300
+_background = {"monitor": None, "thread": None, "stop": None, "config": None, "owner": None, "heartbeat": 0.0}
+_background_lock = threading.Lock()
+feed_sink = FeedSink()
+
+
+def _owner_active_locked(now):
+    return (_background["thread"] is not None and _background["thread"].is_alive()
+            and now - _background["heartbeat"] <= OWNER_TIMEOUT_SECONDS)
+
+
+def start_background_monitor(watchlist, owner, **config):
+    """
+    以 owner 身份启动 (或复用) 后台监控线程，返回 (监控器, 是否由 owner 控制)。
+    监控器由其它活跃会话控制时直接返回正在运行的监控器，不重启、不改配置；
+    由 owner 自己控制且配置变化时才重启。
+    """
+    key = (tuple(sorted(watchlist.items())), tuple(sorted(config.items())))
+    now = time.monotonic()
+    with _background_lock:
+        if _background["owner"] != owner and _owner_active_locked(now):
+            return _background["monitor"], False
+        if _background["config"] == key and _background["thread"] and _background["thread"].is_alive():
+            _background.update(owner=owner, heartbeat=now)
+            return _background["monitor"], True
+        _stop_locked()
+        monitor = ProximityMonitor(watchlist, [feed_sink], **config)
+        stop = threading.Event()
+        thread = threading.Thread(target=monitor.run, args=(stop,), name="proximity-monitor", daemon=True)
+        thread.start()
+        _background.update(monitor=monitor, thread=thread, stop=stop, config=key, owner=owner, heartbeat=now)
+        return monitor, True
+
+
+def touch_background_monitor(owner):
+    """owner 的心跳 (页面的提醒区域定时调用)，返回 owner 是否仍控制着监控器。"""
+    with _background_lock:
+        if _background["owner"] != owner or _background["monitor"] is None:
+            return False
+        _background["heartbeat"] = time.monotonic()
+        return True
+
+
+def _stop_locked():
+    if _background["stop"] is not None:
+        _background["stop"].set()
+    _background.update(monitor=None, thread=None, stop=None, config=None, owner=None, heartbeat=0.0)
+
+
+def stop_background_monitor(owner):
+    """只有 owner 能停止监控器，返回是否已停止。"""
+    with _background_lock:
+        if _background["owner"] != owner:
+            return False
+        _stop_locked()
+        return True
+
+
+def get_background_monitor():
+    return _background["monitor"]
+
+
+def get_background_owner():
+    return _background["owner"]
+
+
+# --- 本地 webhook 接收端 (webhook 的本地替身，便于调试) ---
+def serve_webhook_receiver(port=8765, path="alerts.received.jsonl"):
+    """启动一个只接收 POST 的本地 HTTP 服务，把收到的事件打印并写入文件。"""
+    file_sink = FileSink(path)
+
+    class _Handler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            length = int(self.headers.get("Content-Length", 0))
+            event = json.loads(self.rfile.read(length) or b"{}")
+            file_sink.emit(event)
+            print(f"[webhook] {event.get('time')} {event.get('event')} {event.get('ETF代码')} {event.get('极值类型')}")
+            self.send_response(204)
+            self.end_headers()
+
+        def log_message(self, *args):
+            pass
+
+    HTTPServer(("127.0.0.1", port), _Handler).serve_forever()
+
+
+def main():
+    from etf_industry_map import ETF_INDUSTRY_MAPPINGS, ETF_SELECT_MAPPINGS
+
+    parser = argparse.ArgumentParser(description="交易时段ETF极值点靠近监控")
+    parser.add_argument("--source", choices=["行业ETF", "自选ETF"], default="行业ETF")
+    parser.add_argument("--atr-multiplier", type=float, default=2.0)
+    parser.add_argument("--atr-period", type=int, default=14)
+    parser.add_argument("--peak-distance", type=int, default=10)
+    parser.add_argument("--prominence-factor", type=float, default=0.5)
+    parser.add_argument("--history-years", type=int, default=2)
+    parser.add_argument("--min-level", type=int, default=1, help="最低极值级别序号 (0 短线, 1 波段, 2 中期, 3 长期)")
+    parser.add_argument("--zone-width", type=float, default=1.0, help="区间宽度 (ATR倍数)，0 表示不合并为区间")
+    parser.add_argument("--poll-interval", type=int, default=60)
+    parser.add_argument("--event-file", default="alerts.jsonl", help="事件输出文件 (JSON Lines)")
+    parser.add_argument("--webhook", default=None, help="事件推送地址，如 http://127.0.0.1:8765/")
+    parser.add_argument("--serve-webhook", type=int, default=None, metavar="PORT", help="只启动本地 webhook 接收端")
+    args = parser.parse_args()
+
+    if args.serve_webhook:
+        serve_webhook_receiver(args.serve_webhook)
+        return
+
+    mapping = ETF_INDUSTRY_MAPPINGS if args.source == "行业ETF" else ETF_SELECT_MAPPINGS
+    watchlist = {code: name for name, code in mapping.items()}
+    sinks = [FileSink(args.event_file)]
+    if args.webhook:
+        sinks.append(WebhookSink(args.webhook))
+
+    monitor = ProximityMonitor(watchlist, sinks, atr_multiplier=args.atr_multiplier, atr_period=args.atr_period,
+                               peak_distance=args.peak_distance, prominence_factor=args.prominence_factor,
+                               history_years=args.history_years, min_level=args.min_level,
+                               zone_width_multiplier=args.zone_width or None)
+    stop = threading.Event()
+    print(f"监控 {len(watchlist)} 个ETF，事件写入 {args.event_file}。按 Ctrl+C 退出。")
+    try:
+        monitor.run(stop, poll_interval=args.poll_interval)
+    except KeyboardInterrupt:
+        stop.set()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,145 @@
+# relative_strength.py
+# ETF 横截面相对强弱排名。在 日期 x ETF 的收盘价面板上一次计算所有日期、所有ETF的:
+# - N日收益率
+# - 波动调整动量: N日收益率 / (日收益率标准差 * sqrt(N))
+# - 距近期高点: 收盘价 / 近 HIGH_WINDOW 日最高收盘价 - 1
+# 以及每个交易日各指标的横截面百分位和综合排名。
+# 所有指标只依赖有限长度的窗口，新K线到达时只用最后一段数据计算新增的日期 (RelativeStrengthBoard.update)，
+# 面板为滚动窗口 (开头的日期随新K线移出) 时同样只计算新增日期。
+import threading
+
+import numpy as np
+import pandas as pd
+
+LOOKBACKS = (5, 20, 60, 120)
+VOL_WINDOW = 20
+HIGH_WINDOW = 60
+
+
+def build_close_panel(frames):
+    """{ETF代码: 日K DataFrame} -> 日期 x ETF 的收盘价 DataFrame (缺失处为 NaN)。"""
+    frames = {code: df for code, df in frames.items() if df is not None and not df.empty}
+    if not frames:
+        return pd.DataFrame()
+    return pd.concat({code: df['Close'] for code, df in frames.items()}, axis=1).sort_index().astype(float)
+
+
+def compute_metrics(close, lookbacks=LOOKBACKS, vol_window=VOL_WINDOW, high_window=HIGH_WINDOW):
+    """close 为 日期 x ETF 收盘价，返回 {指标名: 日期 x ETF DataFrame}。"""
+    daily_vol = (close / close.shift(1) - 1).rolling(vol_window).std()
+    metrics = {}
+    for n in lookbacks:
+        change = close / close.shift(n) - 1
+        metrics[f"{n}日收益"] = change
+        metrics[f"{n}日波动调整动量"] = change / (daily_vol * np.sqrt(n))
+    metrics["距高点"] = close / close.rolling(high_window, min_periods=1).max() - 1
+    return metrics
+
+
+def composite_score(metrics, lookbacks=LOOKBACKS):
+    """
+    综合得分 (0-100): 各周期波动调整动量与距高点在当日横截面百分位的平均值。
+    只按行 (日期) 计算，可以只对新增日期调用。
+    """
+    parts = [metrics[f"{n}日波动调整动量"] for n in lookbacks] + [metrics["距高点"]]
+    return pd.concat([part.rank(axis=1, pct=True) for part in parts]).groupby(level=0, sort=False).mean() * 100
+
+
+class RelativeStrengthBoard:
+    """
+    保存收盘价面板和全部指标。update() 传入新的面板，按日期与已有面板对齐:
+    只是在末尾新增了日期 (开头可以移出若干日期，即滚动窗口) 时只计算新增的行，移出的行同时从指标中删除；
+    历史数据被改写 (如前复权因子变化) 或ETF列表变化时全量重算。
+    面板在会话间共享: 收盘价、指标和得分作为一个元组整体替换，读取方一次取出，不会读到新旧混合的数据。
+    """
+
+    def __init__(self, lookbacks=LOOKBACKS, vol_window=VOL_WINDOW, high_window=HIGH_WINDOW):
+        self.lookbacks = tuple(lookbacks)
+        self.vol_window = vol_window
+        self.high_window = high_window
+        self._state = (pd.DataFrame(), {}, pd.DataFrame()) # (收盘价, 指标, 综合得分)
+        self._lock = threading.Lock()
+
+    @property
+    def close(self):
+        return self._state[0]
+
+    @property
+    def metrics(self):
+        return self._state[1]
+
+    @property
+    def score(self):
+        return self._state[2]
+
+    @property
+    def warmup(self):
+        """计算最新一行所需的历史行数。"""
+        return max(max(self.lookbacks), self.vol_window, self.high_window) + 1
+
+    def _compute(self, close):
+        metrics = compute_metrics(close, self.lookbacks, self.vol_window, self.high_window)
+        return metrics, composite_score(metrics, self.lookbacks)
+
+    def update(self, close):
+        """更新到新的收盘价面板，返回本次计算的交易日数 (0 表示无变化)。"""
+        with self._lock:
+            old, old_metrics, old_score = self._state
+            appended = False
+            if not old.empty and not close.empty and list(close.columns) == list(old.columns):
+                # 已有面板中早于新面板起始日期的行视为移出窗口，其余行必须与新面板开头逐日相同
+                dropped = int(old.index.searchsorted(close.index[0]))
+                kept = old.iloc[dropped:]
+                appended = (not kept.empty and len(close) >= len(kept)
+                            and close.index[:len(kept)].equals(kept.index) and close.iloc[:len(kept)].equals(kept))
+            if appended:
+                new_rows = len(close) - len(kept)
+                if new_rows == 0 and dropped == 0:
+                    return 0
+                metrics = {name: frame.iloc[dropped:] for name, frame in old_metrics.items()}
+                score = old_score.iloc[dropped:]
+                if new_rows:
+                    tail_metrics, tail_score = self._compute(close.iloc[-(new_rows + self.warmup):])
+                    metrics = {name: pd.concat([metrics[name], frame.iloc[-new_rows:]])
+                               for name, frame in tail_metrics.items()}
+                    score = pd.concat([score, tail_score.iloc[-new_rows:]])
+            else:
+                new_rows = len(close)
+                metrics, score = self._compute(close)
+            self._state = (close, metrics, score)
+            return new_rows
+
+    def ranking(self, date, names=None, compare_days=5):
+        """
+        date 当日的排名表 (按综合得分从高到低): 排名、代码、名称、综合得分、各周期收益/波动调整动量、距高点，
+        以及与 compare_days 个交易日之前相比的排名变化 (正数为上升)。
+        """
+        names = names or {}
+        close, metrics, scores = self._state
+        pos = close.index.get_loc(date)
+        score = scores.iloc[pos]
+        rank = score.rank(ascending=False, method="min")
+        table = pd.DataFrame({"代码": close.columns, "名称": [names.get(code, "") for code in close.columns]},
+                             index=close.columns)
+        table["综合得分"] = score
+        for n in self.lookbacks:
+            table[f"{n}日收益(%)"] = metrics[f"{n}日收益"].iloc[pos] * 100
+        for n in self.lookbacks:
+            table[f"{n}日波动调整动量"] = metrics[f"{n}日波动调整动量"].iloc[pos]
+        table["距高点(%)"] = metrics["距高点"].iloc[pos] * 100
+        if pos >= compare_days:
+            table[f"较{compare_days}日前排名变化"] = (scores.iloc[pos - compare_days].rank(ascending=False, method="min")
+                                                  - rank)
+        table.insert(0, "排名", rank)
+        table = table.dropna(subset=["综合得分"]).sort_values("排名")
+        return table.astype({"排名": "Int32"}).reset_index(drop=True)
+
+
+# 每个ETF列表一个排名面板，进程内所有会话共享
+_boards = {}
+_boards_lock = threading.Lock()
+
+
+def get_board(key):
+    with _boards_lock:
+        return _boards.setdefault(key, RelativeStrengthBoard())
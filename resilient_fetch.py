@@ -0,0 +1,256 @@
+# resilient_fetch.py
+# 上游 (AkShare) 请求的容错层:
+# - 相同请求的并发合并 (single-flight)，多个会话同时查询同一ETF时只发出一次请求
+# - 带随机抖动的指数退避重试
+# - 按接口划分的熔断器，上游持续失败时直接返回最近一次成功的旧数据
+# - 以上行为的统计指标，供页面展示
+# 返回旧数据时在调用线程上做标记 (见 track_stale)，上层缓存据此区分新数据与故障兜底的旧数据。
+import random
+import threading
+import time
+from collections import OrderedDict, defaultdict
+from contextlib import contextmanager
+
+# 重试参数
+DEFAULT_RETRIES = 2           # 首次请求失败后最多再重试的次数
+DEFAULT_BASE_DELAY = 0.5      # 退避基础时长 (秒)
+DEFAULT_MAX_DELAY = 8.0       # 单次退避的最长时长 (秒)
+
+# 熔断参数
+BREAKER_FAILURE_THRESHOLD = 5  # 连续失败多少次后熔断
+BREAKER_RESET_TIMEOUT = 60.0   # 熔断多少秒后放行一次试探请求
+
+# 最多保留多少个请求的最近一次成功结果 (用于上游故障时兜底)
+MAX_STALE_ENTRIES = 512
+
+
+class UpstreamUnavailableError(Exception):
+    """上游接口处于熔断状态且没有可用的旧数据。"""
+
+
+class CircuitBreaker:
+    """单个接口的熔断器: closed(正常) -> open(熔断) -> half_open(试探) -> closed。"""
+
+    def __init__(self, failure_threshold=BREAKER_FAILURE_THRESHOLD, reset_timeout=BREAKER_RESET_TIMEOUT):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = "closed"
+        self.consecutive_failures = 0
+        self.opened_at = 0.0
+        self._lock = threading.Lock()
+
+    def allow_request(self):
+        """当前是否允许向上游发请求。熔断超时后只放行一个试探请求。"""
+        with self._lock:
+            if self.state == "closed":
+                return True
+            if self.state == "open" and time.monotonic() - self.opened_at >= self.reset_timeout:
+                self.state = "half_open"
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.state = "closed"
+            self.consecutive_failures = 0
+
+    def record_failure(self):
+        """记录一次失败，返回本次是否触发了熔断。"""
+        with self._lock:
+            self.consecutive_failures += 1
+            if self.state == "half_open" or self.consecutive_failures >= self.failure_threshold:
+                tripped = self.state != "open"
+                self.state = "open"
+                self.opened_at = time.monotonic()
+                return tripped
+            return False
+
+
+class _InflightCall:
+    """一次正在进行中的上游请求，供合并进来的请求等待其结果。"""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.stale = None # 结果为旧数据时的 (原因, 数据获取时间)
+
+
+_lock = threading.Lock()
+_inflight = {}
+_stale = OrderedDict()   # key -> (value, 成功时间戳)
+_breakers = {}
+# 统计指标名称，未发生过的计数也以 0 输出
+METRIC_NAMES = ("requests", "upstream_calls", "coalesced", "retries", "successes", "failures",
+                "stale_served", "short_circuited", "breaker_trips")
+_metrics = defaultdict(lambda: defaultdict(int))
+_metrics_lock = threading.Lock()
+
+
+def _make_key(endpoint, args, kwargs):
+    return (endpoint, args, tuple(sorted(kwargs.items())))
+
+
+def _copy(value):
+    """返回结果的副本。页面会原地修改 DataFrame (set_index/rename)，共享对象必须复制后再交出去。"""
+    return value.copy() if hasattr(value, "copy") else value
+
+
+def _incr(endpoint, name):
+    with _metrics_lock:
+        _metrics[endpoint][name] += 1
+
+
+# --- 旧数据标记 ---
+_stale_scope = threading.local()
+
+
+@contextmanager
+def track_stale():
+    """
+    记录 with 块内 (当前线程) 是否有请求因上游故障返回了旧数据。
+    yield 一个列表，每返回一次旧数据追加一条 (原因, 数据获取时间戳)。可以嵌套，内层的记录同时计入外层。
+    """
+    outer = getattr(_stale_scope, "records", None)
+    records = []
+    _stale_scope.records = records
+    try:
+        yield records
+    finally:
+        _stale_scope.records = outer
+        if outer is not None:
+            outer.extend(records)
+
+
+def mark_stale(reason, fetched_at=None):
+    """标记当前线程正在返回旧数据 (fetched_at 为该数据的获取时间戳，未知时为 None)。不在 track_stale 内时忽略。"""
+    records = getattr(_stale_scope, "records", None)
+    if records is not None:
+        records.append((reason, fetched_at))
+
+
+def _get_breaker(endpoint):
+    with _lock:
+        if endpoint not in _breakers:
+            _breakers[endpoint] = CircuitBreaker()
+        return _breakers[endpoint]
+
+
+def _remember(key, value):
+    with _lock:
+        _stale[key] = (value, time.time())
+        _stale.move_to_end(key)
+        while len(_stale) > MAX_STALE_ENTRIES:
+            _stale.popitem(last=False)
+
+
+def _lookup_stale(key):
+    with _lock:
+        return _stale.get(key)
+
+
+def _backoff_delay(attempt, base_delay, max_delay):
+    """指数退避 + 完全随机抖动 (full jitter)，避免大量会话在同一时刻集中重试。"""
+    return random.uniform(0, min(max_delay, base_delay * (2 ** attempt)))
+
+
+def _call_with_retries(endpoint, func, args, kwargs, retries, base_delay, max_delay):
+    for attempt in range(retries + 1):
+        _incr(endpoint, "upstream_calls")
+        try:
+            return func(*args, **kwargs)
+        except Exception:
+            if attempt >= retries:
+                raise
+            _incr(endpoint, "retries")
+            time.sleep(_backoff_delay(attempt, base_delay, max_delay))
+
+
+def _serve_stale_or_raise(endpoint, key, error, call=None):
+    cached = _lookup_stale(key)
+    if cached is None:
+        raise error
+    _incr(endpoint, "stale_served")
+    stale = (f"{endpoint}: {error}", cached[1])
+    mark_stale(*stale)
+    if call is not None:
+        call.stale = stale
+    return cached[0]
+
+
+def resilient_call(func, *args, endpoint=None, retries=DEFAULT_RETRIES,
+                   base_delay=DEFAULT_BASE_DELAY, max_delay=DEFAULT_MAX_DELAY, **kwargs):
+    """
+    以容错方式调用上游接口，如 resilient_call(ak.fund_etf_hist_em, symbol="510300", ...)。
+    - endpoint: 熔断与统计使用的接口名，默认取函数名
+    - 上游失败 (重试耗尽或处于熔断) 时，若该请求曾经成功过则返回旧数据 (并以 mark_stale 标记)，否则抛出异常
+    返回值总是副本，调用方可以放心原地修改。
+    """
+    endpoint = endpoint or getattr(func, "__name__", "unknown")
+    key = _make_key(endpoint, args, kwargs)
+    _incr(endpoint, "requests")
+
+    breaker = _get_breaker(endpoint)
+    if not breaker.allow_request():
+        _incr(endpoint, "short_circuited")
+        return _copy(_serve_stale_or_raise(
+            endpoint, key, UpstreamUnavailableError(f"接口 {endpoint} 暂时不可用 (熔断中)，且无历史数据可用。")))
+
+    with _lock:
+        call = _inflight.get(key)
+        is_leader = call is None
+        if is_leader:
+            call = _InflightCall()
+            _inflight[key] = call
+
+    if not is_leader:
+        # 已有相同请求在进行中，直接等待其结果
+        _incr(endpoint, "coalesced")
+        call.done.wait()
+        if call.error is not None:
+            raise call.error
+        if call.stale is not None:
+            mark_stale(*call.stale)
+        return _copy(call.result)
+
+    try:
+        try:
+            result = _call_with_retries(endpoint, func, args, kwargs, retries, base_delay, max_delay)
+            breaker.record_success()
+            _incr(endpoint, "successes")
+            _remember(key, result)
+        except Exception as e:
+            _incr(endpoint, "failures")
+            if breaker.record_failure():
+                _incr(endpoint, "breaker_trips")
+            result = _serve_stale_or_raise(endpoint, key, e, call)
+        call.result = result
+    except Exception as e:
+        call.error = e
+        raise
+    finally:
+        with _lock:
+            _inflight.pop(key, None)
+        call.done.set()
+    return _copy(result)
+
+
+def get_fetch_metrics():
+    """返回 {接口名: 指标字典}，包含熔断器当前状态。"""
+    with _lock:
+        breakers = dict(_breakers)
+    metrics = {}
+    with _metrics_lock:
+        snapshot = {endpoint: {name: stats[name] for name in METRIC_NAMES} for endpoint, stats in _metrics.items()}
+    for endpoint, row in snapshot.items():
+        breaker = breakers.get(endpoint)
+        row["breaker_state"] = breaker.state if breaker else "closed"
+        row["consecutive_failures"] = breaker.consecutive_failures if breaker else 0
+        metrics[endpoint] = row
+    return metrics
+
+
+def reset_fetch_metrics():
+    """清空统计指标 (不影响熔断器状态与旧数据)。"""
+    with _metrics_lock:
+        _metrics.clear()
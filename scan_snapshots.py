@@ -0,0 +1,276 @@
+# scan_snapshots.py
+# 极值点靠近扫描的快照: 一次扫描保存到 data/scans/，之后可以直接打开、与其它快照对比或复制给别人，不需要重新计算。
+# - <快照名>.parquet: 结果表 (保留数值和日期类型)，文件元数据中保存扫描参数、ETF来源、跳过原因和各ETF的数据版本
+# - <快照名>.sparklines.parquet: 命中ETF的缩略图数据 (最近一段收盘价，极值点所在行标注类型)
+# - <快照名>.extrema.parquet: 每个扫描过的ETF的完整极值点表 (代码/日期/价格/类型/级别，级别过滤后的全部极值点)
+# 也可以在命令行完成一次扫描并保存 (如收盘后定时运行)，页面打开快照即可看到结果:
+#   python scan_snapshots.py --source 全市场ETF --min-turnover 1000
+import argparse
+import json
+import os
+import re
+import time
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from etf_analysis import EXTREMUM_LEVELS
+from etf_bars import bar_store
+from etf_scan import fetch_etf_universe, filter_liquid_etfs, iter_scan_batches
+
+SCANS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "scans")
+META_KEY = b"scan_snapshot"
+
+# 结果表中的数值列与分类列，其余列按原样保存
+NUMERIC_COLS = ["当前价格", "极值点价格", "区间下沿", "区间上沿", "当前ATR", "距离ATR倍数", "距离百分比"]
+CATEGORY_COLS = ["ETF代码", "名称", "分析类型", "极值级别"]
+
+
+def _paths(name):
+    base = os.path.join(SCANS_DIR, name)
+    return base + ".parquet", base + ".sparklines.parquet", base + ".extrema.parquet"
+
+
+def _safe_name(name):
+    return re.sub(r'[\\/:*?"<>|\s]+', "_", name).strip("_")
+
+
+def data_versions(codes):
+    """{代码: 数据版本}，只包含本进程中已加载过K线的ETF (版本格式见 DailyBarStore.data_version)。"""
+    versions = {code: bar_store.data_version(code) for code in codes}
+    return {code: version for code, version in versions.items() if version}
+
+
+def _results_frame(results):
+    df = pd.DataFrame(results)
+    if df.empty:
+        return df
+    for col in [col for col in NUMERIC_COLS if col in df.columns]:
+        df[col] = pd.to_numeric(df[col], errors='coerce')
+    if "触及次数" in df.columns:
+        df["触及次数"] = df["触及次数"].astype("Int32")
+    df["极值点日期"] = pd.to_datetime(df["极值点日期"])
+    for col in [col for col in CATEGORY_COLS if col in df.columns]:
+        df[col] = df[col].astype("category")
+    return df
+
+
+def _sparklines_frame(sparklines):
+    """缩略图数据转为长表: ETF代码, 日期, 收盘价, 极值类型 (极值点取自收盘价，价格即当日收盘价)。"""
+    frames = []
+    for code, data in sparklines.items():
+        extreme_type = np.full(len(data["close"]), None, dtype=object)
+        extreme_type[data["extreme_pos"]] = data["extreme_type"]
+        frames.append(pd.DataFrame({"ETF代码": code, "日期": pd.to_datetime(data["dates"]),
+                                    "收盘价": data["close"], "极值类型": extreme_type}))
+    if not frames:
+        return pd.DataFrame({"ETF代码": pd.Series(dtype=str), "日期": pd.Series(dtype="datetime64[ns]"),
+                             "收盘价": pd.Series(dtype=np.float32), "极值类型": pd.Series(dtype=str)})
+    df = pd.concat(frames, ignore_index=True)
+    df["ETF代码"] = df["ETF代码"].astype("category")
+    df["极值类型"] = df["极值类型"].astype("category")
+    return df
+
+
+def _extrema_frame(extremes):
+    """各ETF的极值点表转为长表: ETF代码, 日期, 价格, 类型, 级别, 极值级别。"""
+    frames = [table.assign(ETF代码=code) for code, table in extremes.items() if not table.empty]
+    if not frames:
+        df = pd.DataFrame({"ETF代码": pd.Series(dtype=str), "日期": pd.Series(dtype="datetime64[ns]"),
+                           "价格": pd.Series(dtype=np.float64), "类型": pd.Series(dtype=str),
+                           "级别": pd.Series(dtype=np.int8)})
+    else:
+        df = pd.concat(frames, ignore_index=True)[["ETF代码", "日期", "价格", "类型", "级别"]]
+        df = df.astype({"日期": "datetime64[ns]", "价格": np.float64, "级别": np.int8})
+    df["极值级别"] = [EXTREMUM_LEVELS[i] if i < len(EXTREMUM_LEVELS) else f"L{i}" for i in df["级别"]]
+    for col in ("ETF代码", "类型", "极值级别"):
+        df[col] = df[col].astype("category")
+    return df
+
+
+def save_snapshot(scan, name=None):
+    """
+    保存扫描快照，scan 为页面中 proximity_scan 的结构 (results/skipped/total/source/params/sparklines/extremes/data_versions 等)。
+    返回快照名。同名快照会被覆盖。
+    """
+    saved_at = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    name = _safe_name(name or f"{datetime.now():%Y%m%d_%H%M%S}_{scan['source']}")
+    meta = {
+        "saved_at": saved_at,
+        "finished_at": scan.get("finished_at"),
+        "source": scan["source"],
+        "total": scan["total"],
+        "planned": scan.get("planned"), # 中途停止的扫描: 原计划扫描的ETF数
+        "hits": len({item["ETF代码"] for item in scan["results"]}),
+        "params": scan.get("params", {}),
+        "skipped": scan.get("skipped", {}),
+        "data_versions": scan.get("data_versions", {}),
+        "bands": {code: data["bands"] for code, data in scan.get("sparklines", {}).items()},
+    }
+    table = pa.Table.from_pandas(_results_frame(scan["results"]), preserve_index=False)
+    table = table.replace_schema_metadata({**(table.schema.metadata or {}),
+                                           META_KEY: json.dumps(meta, ensure_ascii=False).encode("utf-8")})
+    os.makedirs(SCANS_DIR, exist_ok=True)
+    results_path, sparklines_path, extrema_path = _paths(name)
+    # 先写缩略图和极值点表再写结果表，列表和读取都以结果表为准，不会读到不完整的快照
+    _sparklines_frame(scan.get("sparklines", {})).to_parquet(sparklines_path + ".tmp", index=False)
+    os.replace(sparklines_path + ".tmp", sparklines_path)
+    _extrema_frame(scan.get("extremes", {})).to_parquet(extrema_path + ".tmp", index=False)
+    os.replace(extrema_path + ".tmp", extrema_path)
+    pq.write_table(table, results_path + ".tmp")
+    os.replace(results_path + ".tmp", results_path)
+    return name
+
+
+def _read_meta(results_path):
+    metadata = pq.read_schema(results_path).metadata or {}
+    return json.loads(metadata.get(META_KEY, b"{}").decode("utf-8"))
+
+
+def list_snapshots():
+    """已保存的快照 (只读文件元数据)，按保存时间从新到旧返回 [{name, saved_at, source, total, hits}]。"""
+    if not os.path.isdir(SCANS_DIR):
+        return []
+    snapshots = []
+    for filename in os.listdir(SCANS_DIR):
+        if not filename.endswith(".parquet") or filename.endswith((".sparklines.parquet", ".extrema.parquet")):
+            continue
+        try:
+            meta = _read_meta(os.path.join(SCANS_DIR, filename))
+        except Exception:
+            continue
+        snapshots.append({"name": filename[:-len(".parquet")], "saved_at": meta.get("saved_at", ""),
+                          "source": meta.get("source"), "total": meta.get("total"), "hits": meta.get("hits")})
+    return sorted(snapshots, key=lambda item: item["saved_at"], reverse=True)
+
+
+def load_results(name):
+    """快照的结果表 (类型化的 DataFrame)，用于对比。"""
+    return pd.read_parquet(_paths(name)[0])
+
+
+def load_extrema(name):
+    """快照中全部ETF的极值点长表 (类型化的 DataFrame)，旧快照没有极值点表时返回空表。"""
+    extrema_path = _paths(name)[2]
+    if not os.path.exists(extrema_path):
+        return _extrema_frame({})
+    return pd.read_parquet(extrema_path)
+
+
+def load_snapshot(name):
+    """读取快照，返回与页面 proximity_scan 相同结构的 dict (另含 snapshot 名称和 saved_at)。"""
+    results_path, sparklines_path, _ = _paths(name)
+    meta = _read_meta(results_path)
+    df = pd.read_parquet(results_path)
+    if not df.empty:
+        df["极值点日期"] = df["极值点日期"].dt.strftime('%Y-%m-%d')
+        for col in [col for col in CATEGORY_COLS if col in df.columns]:
+            df[col] = df[col].astype(object)
+    results = [{k: v for k, v in row.items() if not (isinstance(v, float) and np.isnan(v)) and v is not pd.NA}
+               for row in df.to_dict("records")]
+
+    sparklines = {}
+    if os.path.exists(sparklines_path):
+        df_spark = pd.read_parquet(sparklines_path)
+        for code, group in df_spark.groupby("ETF代码", observed=True, sort=False):
+            extreme_type = group["极值类型"].astype(object).to_numpy()
+            pos = np.flatnonzero(pd.notna(extreme_type))
+            close = group["收盘价"].to_numpy(dtype=np.float32)
+            sparklines[code] = {
+                "dates": group["日期"].dt.strftime('%Y-%m-%d').tolist(),
+                "close": close,
+                "extreme_pos": pos,
+                "extreme_price": close[pos],
+                "extreme_type": extreme_type[pos].tolist(),
+                "bands": [tuple(band) for band in meta.get("bands", {}).get(code, [])],
+            }
+    extremes = {code: group[["日期", "价格", "类型", "级别"]].astype({"类型": object}).reset_index(drop=True)
+                for code, group in load_extrema(name).groupby("ETF代码", observed=True, sort=False)}
+    params = meta.get("params", {})
+    return {
+        "id": f"snapshot:{name}:{meta.get('saved_at')}",
+        "snapshot": name, "saved_at": meta.get("saved_at"),
+        "results": results, "skipped": meta.get("skipped", {}), "total": meta.get("total", 0),
+        "planned": meta.get("planned"),
+        "source": meta.get("source"), "finished_at": meta.get("finished_at"), "freshness": None,
+        "params": params, "data_versions": meta.get("data_versions", {}), "sparklines": sparklines,
+        "extremes": extremes, "atr_multiplier": params.get("atr_multiplier"),
+        "analyze_maxima": params.get("analyze_maxima", True), "analyze_minima": params.get("analyze_minima", True),
+    }
+
+
+def diff_results(old_results, new_results):
+    """
+    按 (ETF代码, 分析类型) 对比两次扫描，返回 DataFrame: ETF代码, 名称, 分析类型, 变化 (新增/消失/保持),
+    以及两次的最小距离ATR倍数 (取绝对值最小的一条)。
+    """
+    def nearest(results):
+        df = pd.DataFrame(results, columns=["ETF代码", "名称", "分析类型", "距离ATR倍数"])
+        df = df.astype({"ETF代码": object, "名称": object, "分析类型": object, "距离ATR倍数": float})
+        df = df.loc[df["距离ATR倍数"].abs().groupby([df["ETF代码"], df["分析类型"]]).idxmin()]
+        return df.set_index(["ETF代码", "分析类型"])
+
+    old, new = nearest(old_results), nearest(new_results)
+    merged = old.join(new, how="outer", lsuffix="_旧", rsuffix="_新")
+    merged["名称"] = merged["名称_新"].fillna(merged["名称_旧"])
+    merged["变化"] = np.where(merged["距离ATR倍数_旧"].isna(), "新增",
+                            np.where(merged["距离ATR倍数_新"].isna(), "消失", "保持"))
+    merged = merged.rename(columns={"距离ATR倍数_旧": "原距离ATR倍数", "距离ATR倍数_新": "现距离ATR倍数"})
+    merged = merged.reset_index()[["ETF代码", "名称", "分析类型", "变化", "原距离ATR倍数", "现距离ATR倍数"]]
+    order = {"新增": 0, "消失": 1, "保持": 2}
+    return merged.sort_values(["变化", "ETF代码"], key=lambda col: col.map(order) if col.name == "变化" else col,
+                              ignore_index=True)
+
+
+def main():
+    from etf_industry_map import ETF_INDUSTRY_MAPPINGS, ETF_SELECT_MAPPINGS
+
+    parser = argparse.ArgumentParser(description="运行一次ETF极值点靠近扫描并保存快照")
+    parser.add_argument("--source", choices=["行业ETF", "自选ETF", "全市场ETF"], default="行业ETF")
+    parser.add_argument("--min-turnover", type=float, default=1000, help="全市场ETF的最低成交额 (万元)")
+    parser.add_argument("--name", default=None, help="快照名，默认为 时间_来源")
+    parser.add_argument("--history-years", type=int, default=2)
+    parser.add_argument("--atr-period", type=int, default=14)
+    parser.add_argument("--atr-multiplier", type=float, default=2.0)
+    parser.add_argument("--peak-distance", type=int, default=10)
+    parser.add_argument("--prominence-factor", type=float, default=0.5)
+    parser.add_argument("--min-history-days", type=int, default=120)
+    parser.add_argument("--min-level", type=int, default=1)
+    parser.add_argument("--zone-width", type=float, default=1.0, help="区间宽度 (ATR倍数)，0 表示不合并为区间")
+    args = parser.parse_args()
+
+    if args.source == "全市场ETF":
+        df_universe, error = fetch_etf_universe()
+        if error:
+            parser.exit(1, error + "\n")
+        watchlist = filter_liquid_etfs(df_universe, args.min_turnover * 10000)
+    else:
+        mapping = ETF_INDUSTRY_MAPPINGS if args.source == "行业ETF" else ETF_SELECT_MAPPINGS
+        watchlist = {code: name for name, code in mapping.items()}
+
+    params = dict(history_years=args.history_years, atr_period=args.atr_period, peak_distance=args.peak_distance,
+                  prominence_factor=args.prominence_factor, atr_multiplier=args.atr_multiplier,
+                  analyze_maxima=True, analyze_minima=True, min_history_days=args.min_history_days,
+                  min_level=args.min_level, zone_width_multiplier=args.zone_width or None)
+    started = time.time()
+    results, skipped, sparklines, extremes = [], {}, {}, {}
+    for done, batch_results, batch_errors, batch_sparklines, batch_extremes in iter_scan_batches(watchlist, **params):
+        results.extend(batch_results)
+        skipped.update(batch_errors)
+        sparklines.update(batch_sparklines)
+        extremes.update(batch_extremes)
+        print(f"\r{done}/{len(watchlist)}", end="", flush=True)
+    name = save_snapshot({
+        "results": results, "skipped": skipped, "total": len(watchlist), "source": args.source,
+        "finished_at": datetime.now().strftime("%H:%M:%S"), "params": params,
+        "data_versions": data_versions(watchlist), "sparklines": sparklines, "extremes": extremes,
+    }, args.name)
+    print(f"\n{len(results)} 条靠近记录 ({len(sparklines)} 个ETF)，跳过 {len(skipped)} 个，"
+          f"耗时 {time.time() - started:.1f} 秒。快照: {name}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,220 @@
+# sector_flow_panel.py
+# 全板块主力资金流历史面板: 日期 x 板块 的主力净流入 (亿元)，持久化为 data/ 下的 Parquet 文件。
+# - 上游每个板块一次请求，只返回最近一段时间的日线；面板与已保存的数据合并，历史会随更新不断累积
+# - 增量更新: 已包含最新交易日数据的板块跳过，只请求缺数据的板块
+# - 可在页面进程内后台构建 (start_background_update)，也可以单独运行: python sector_flow_panel.py --type 概念资金流
+# 页面直接读取面板文件，不再按需逐个请求上游。
+import argparse
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+import akshare as ak
+import pandas as pd
+
+from resilient_fetch import resilient_call
+from trade_calendar import bars_up_to_date
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data")
+
+# 板块类型 -> (历史资金流接口, 面板文件名)
+SECTOR_TYPES = {
+    "行业资金流": (ak.stock_sector_fund_flow_hist, "sector_flow_industry"),
+    "概念资金流": (ak.stock_concept_fund_flow_hist, "sector_flow_concept"),
+}
+
+
+def _panel_path(sector_type):
+    return os.path.join(DATA_DIR, SECTOR_TYPES[sector_type][1] + ".parquet")
+
+
+def _meta_path(sector_type):
+    return os.path.join(DATA_DIR, SECTOR_TYPES[sector_type][1] + ".meta.json")
+
+
+def list_sectors(sector_type="行业资金流"):
+    """获取当前全部板块名称，返回 (名称列表, 错误信息)。"""
+    try:
+        df = resilient_call(ak.stock_sector_fund_flow_rank, indicator="今日", sector_type=sector_type)
+        if df.empty or '名称' not in df.columns:
+            return [], f"{sector_type}板块列表为空或缺少“名称”列"
+        return df['名称'].dropna().astype(str).unique().tolist(), None
+    except Exception as e:
+        return [], f"获取{sector_type}板块列表失败: {e}"
+
+
+def fetch_sector_main_flow(sector_name, sector_type="行业资金流"):
+    """获取单个板块的每日主力净流入 (亿元)，返回 (Series[日期], 错误信息)。"""
+    hist_func = SECTOR_TYPES[sector_type][0]
+    try:
+        df = resilient_call(hist_func, symbol=sector_name)
+        if df.empty or '主力净流入-净额' not in df.columns:
+            return pd.Series(dtype=float), f"板块“{sector_name}”无历史资金流数据"
+        flow = pd.to_numeric(df['主力净流入-净额'], errors='coerce') / 1e8
+        flow.index = pd.to_datetime(df['日期']).dt.normalize()
+        return flow.dropna().round(3), None
+    except Exception as e:
+        return pd.Series(dtype=float), f"获取板块“{sector_name}”历史资金流失败: {e}"
+
+
+# --- 面板读写 ---
+_panel_cache = {} # {sector_type: (文件修改时间, 面板)}，文件未变化时不重复读盘
+_panel_lock = threading.Lock()
+
+
+def load_panel(sector_type="行业资金流"):
+    """读取面板 (index 为日期，列为板块)，文件不存在时返回空 DataFrame。"""
+    path = _panel_path(sector_type)
+    if not os.path.exists(path):
+        return pd.DataFrame()
+    mtime = os.path.getmtime(path)
+    with _panel_lock:
+        cached = _panel_cache.get(sector_type)
+        if cached is None or cached[0] != mtime:
+            cached = (mtime, pd.read_parquet(path))
+            _panel_cache[sector_type] = cached
+    return cached[1].copy()
+
+
+def load_meta(sector_type="行业资金流"):
+    """面板元数据: updated_at (最近一次更新时间)、sectors (板块数)、errors (最近一次更新失败的板块)。"""
+    path = _meta_path(sector_type)
+    if not os.path.exists(path):
+        return {}
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def _save_panel(sector_type, panel, meta):
+    os.makedirs(DATA_DIR, exist_ok=True)
+    path = _panel_path(sector_type)
+    # 先写临时文件再替换，页面读取时不会读到写了一半的文件
+    panel.to_parquet(path + ".tmp")
+    os.replace(path + ".tmp", path)
+    with open(_meta_path(sector_type) + ".tmp", "w", encoding="utf-8") as f:
+        json.dump(meta, f, ensure_ascii=False, indent=2)
+    os.replace(_meta_path(sector_type) + ".tmp", _meta_path(sector_type))
+
+
+def update_panel(sector_type="行业资金流", max_workers=4, progress=None):
+    """
+    增量更新面板: 已有最新交易日数据的板块跳过，其余板块并发请求后与旧数据合并 (同一日期以新数据为准)。
+    progress(已完成, 总数) 为可选的进度回调。返回 (面板, 错误信息)。
+    """
+    sectors, error = list_sectors(sector_type)
+    if error:
+        return load_panel(sector_type), error
+    panel = load_panel(sector_type)
+
+    if not sectors:
+        return panel, f"{sector_type}板块列表为空"
+
+    # 先请求第一个板块，以它的最新日期作为当前最新交易日，已有该日数据的板块无需再请求
+    updates, errors = {}, {}
+    probe, error = fetch_sector_main_flow(sectors[0], sector_type)
+    if error:
+        errors[sectors[0]] = error
+    else:
+        updates[sectors[0]] = probe
+    latest_date = probe.index.max() if not probe.empty else None
+    todo = sectors[1:]
+    if latest_date is not None and not panel.empty and latest_date in panel.index:
+        todo = [s for s in todo if s not in panel.columns or pd.isna(panel.at[latest_date, s])]
+
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="sector-flow") as executor:
+        futures = {name: executor.submit(fetch_sector_main_flow, name, sector_type) for name in todo}
+        for i, (name, future) in enumerate(futures.items()):
+            flow, error = future.result()
+            if error:
+                errors[name] = error
+            else:
+                updates[name] = flow
+            if progress:
+                progress(i + 1, len(todo))
+
+    if updates:
+        new_part = pd.DataFrame(updates)
+        panel = new_part.combine_first(panel) if not panel.empty else new_part
+        panel = panel.sort_index()
+        panel.index.name = "日期"
+    meta = {
+        "updated_at": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        "sectors": int(panel.shape[1]),
+        "requested": len(todo) + 1,
+        "errors": errors,
+    }
+    if not panel.empty:
+        _save_panel(sector_type, panel, meta)
+    return panel, (f"{len(errors)} 个板块更新失败" if errors else None)
+
+
+def panel_age_seconds(sector_type="行业资金流"):
+    """面板距上次更新的秒数，从未构建过返回 None。"""
+    updated_at = load_meta(sector_type).get("updated_at")
+    if not updated_at:
+        return None
+    return time.time() - datetime.strptime(updated_at, "%Y-%m-%d %H:%M:%S").timestamp()
+
+
+def panel_is_current(sector_type="行业资金流"):
+    """面板是否已包含收盘后获取的最新交易日数据 (此时上游没有新数据，周末、节假日不需要更新)。"""
+    updated_at = load_meta(sector_type).get("updated_at")
+    panel = load_panel(sector_type)
+    if not updated_at or panel.empty:
+        return False
+    return bars_up_to_date(panel.index.max(), datetime.strptime(updated_at, "%Y-%m-%d %H:%M:%S").timestamp())
+
+
+# --- 进程内后台构建 (供页面使用) ---
+_update_status = {} # {sector_type: {"running": bool, "done": int, "total": int, "error": str}}
+_update_lock = threading.Lock()
+
+
+def start_background_update(sector_type="行业资金流"):
+    """在后台线程更新面板，同一板块类型同时只有一个更新任务。返回是否新启动了任务。"""
+    with _update_lock:
+        status = _update_status.get(sector_type)
+        if status and status["running"]:
+            return False
+        status = {"running": True, "done": 0, "total": 0, "error": None}
+        _update_status[sector_type] = status
+
+    def _progress(done, total):
+        status.update(done=done, total=total)
+
+    def _run():
+        try:
+            _, error = update_panel(sector_type, progress=_progress)
+            status["error"] = error
+        except Exception as e:
+            status["error"] = str(e)
+        finally:
+            status["running"] = False
+
+    threading.Thread(target=_run, name=f"sector-flow-update-{sector_type}", daemon=True).start()
+    return True
+
+
+def get_update_status(sector_type="行业资金流"):
+    return dict(_update_status.get(sector_type) or {"running": False, "done": 0, "total": 0, "error": None})
+
+
+def main():
+    parser = argparse.ArgumentParser(description="更新全板块主力资金流历史面板")
+    parser.add_argument("--type", choices=list(SECTOR_TYPES), default="行业资金流")
+    parser.add_argument("--workers", type=int, default=4)
+    args = parser.parse_args()
+
+    started = time.time()
+    panel, error = update_panel(args.type, max_workers=args.workers,
+                                progress=lambda done, total: print(f"\r{done}/{total}", end="", flush=True))
+    print(f"\n面板: {panel.shape[0]} 个交易日 x {panel.shape[1]} 个板块，耗时 {time.time() - started:.1f} 秒。")
+    if error:
+        print(error)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,175 @@
+# swr_cache.py
+# stale-while-revalidate 缓存: 数据集加载过一次之后，用户不再需要等待上游接口。
+# - 未超过软过期 (soft_ttl): 直接返回缓存
+# - 超过软过期但未超过硬过期 (hard_ttl): 立即返回旧值，同时在后台线程刷新
+# - 超过硬过期或从未加载: 同步请求 (与 st.cache_data 行为一致)
+# 缓存为进程级，所有会话共享；被装饰的函数不能调用 st.* (后台线程没有页面上下文)。
+# 被装饰的函数因上游故障返回了旧数据时 (resilient_fetch.track_stale 记录到标记)，不当作一次成功的刷新:
+# 后台刷新保留原缓存的加载时间并记录错误；同步加载按旧数据的获取时间入缓存。
+import copy
+import functools
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from resilient_fetch import track_stale
+
+# 后台刷新线程池，限制同时向上游发起的刷新请求数
+_refresh_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="swr-refresh")
+
+# Streamlit 每次重跑页面脚本都会重新定义被装饰的函数，因此缓存数据按“文件 + 函数名”存放在模块级，
+# 保证跨重跑、跨会话共享 (与 st.cache_data 的做法一致)
+_stores = {}
+_stores_lock = threading.Lock()
+
+
+def _get_store(func):
+    store_key = (func.__code__.co_filename, func.__qualname__)
+    with _stores_lock:
+        if store_key not in _stores:
+            _stores[store_key] = (OrderedDict(), threading.Lock())
+        return _stores[store_key]
+
+
+def _default_is_valid(value):
+    """判断结果是否值得缓存: (数据, 错误信息) 约定的元组看错误信息，DataFrame 看是否为空。"""
+    if isinstance(value, tuple) and len(value) >= 2:
+        return value[-1] is None
+    return not getattr(value, "empty", False)
+
+
+class _Entry:
+    __slots__ = ("value", "loaded_at", "refreshing", "last_error")
+
+    def __init__(self, value, loaded_at=None, last_error=None):
+        self.value = value
+        self.loaded_at = loaded_at or time.time()
+        self.refreshing = False
+        self.last_error = last_error
+
+
+class SWRCache:
+    """单个函数的 stale-while-revalidate 缓存。"""
+
+    def __init__(self, func, soft_ttl, hard_ttl, max_entries=256, is_valid=None):
+        self.func = func
+        self.soft_ttl = soft_ttl
+        self.hard_ttl = max(hard_ttl, soft_ttl)
+        self.max_entries = max_entries
+        self.is_valid = is_valid or _default_is_valid
+        self._entries, self._lock = _get_store(func)
+        functools.update_wrapper(self, func)
+
+    def _key(self, args, kwargs):
+        return (args, tuple(sorted(kwargs.items())))
+
+    def _store(self, key, value, loaded_at=None, last_error=None):
+        with self._lock:
+            self._entries[key] = _Entry(value, loaded_at, last_error)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def _call(self, args, kwargs):
+        """调用被装饰的函数，返回 (结果, 旧数据标记列表)。"""
+        with track_stale() as stale:
+            value = self.func(*args, **kwargs)
+        return value, stale
+
+    def _load(self, key, args, kwargs):
+        value, stale = self._call(args, kwargs)
+        if self.is_valid(value):
+            if stale:
+                # 上游故障时的旧数据: 按其中最早的获取时间入缓存，过了软过期会照常在后台重试
+                fetched = [fetched_at for _, fetched_at in stale if fetched_at]
+                self._store(key, value, min(fetched) if fetched else None, stale[0][0])
+            else:
+                self._store(key, value)
+        return value
+
+    def _refresh(self, key, args, kwargs):
+        try:
+            value, stale = self._call(args, kwargs)
+            if stale:
+                self._mark_failed(key, f"上游不可用，继续使用旧数据 ({stale[0][0]})")
+            elif self.is_valid(value):
+                self._store(key, value)
+            else:
+                self._mark_failed(key, "刷新结果无效，继续使用旧数据")
+        except Exception as e:
+            self._mark_failed(key, str(e))
+
+    def _mark_failed(self, key, message):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                entry.refreshing = False
+                entry.last_error = message
+
+    def __call__(self, *args, **kwargs):
+        key = self._key(args, kwargs)
+        with self._lock:
+            entry = self._entries.get(key)
+            age = time.time() - entry.loaded_at if entry else None
+            if entry is not None and age < self.hard_ttl:
+                self._entries.move_to_end(key)
+                if age >= self.soft_ttl and not entry.refreshing:
+                    entry.refreshing = True
+                    _refresh_executor.submit(self._refresh, key, args, kwargs)
+                # 返回副本，避免调用方原地修改缓存中的 DataFrame
+                return copy.deepcopy(entry.value)
+        return copy.deepcopy(self._load(key, args, kwargs))
+
+    def entry_info(self, *args, **kwargs):
+        """返回缓存条目的状态 {age: 秒, refreshing: 是否后台刷新中, last_error: 最近一次刷新错误}，未缓存返回 None。"""
+        with self._lock:
+            entry = self._entries.get(self._key(args, kwargs))
+            if entry is None:
+                return None
+            return {"age": time.time() - entry.loaded_at,
+                    "refreshing": entry.refreshing,
+                    "last_error": entry.last_error}
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+def swr_cache(soft_ttl, hard_ttl, max_entries=256, is_valid=None):
+    """装饰器，用法与 @st.cache_data(ttl=...) 类似: @swr_cache(soft_ttl=300, hard_ttl=3600)。"""
+    def decorator(func):
+        return SWRCache(func, soft_ttl, hard_ttl, max_entries, is_valid)
+    return decorator
+
+
+def clear_swr_caches():
+    """清空所有 swr 缓存 (页面上的“刷新”按钮使用)。"""
+    with _stores_lock:
+        stores = list(_stores.values())
+    for entries, lock in stores:
+        with lock:
+            entries.clear()
+
+
+def format_age(seconds):
+    """把秒数格式化为“x分钟前”之类的中文描述。"""
+    if seconds < 60:
+        return "刚刚"
+    if seconds < 3600:
+        return f"{int(seconds // 60)} 分钟前"
+    if seconds < 86400:
+        return f"{seconds / 3600:.1f} 小时前"
+    return f"{seconds / 86400:.1f} 天前"
+
+
+def describe_entry(info):
+    """生成页面上展示的数据新鲜度说明。"""
+    if info is None:
+        return "数据刚刚更新。"
+    text = f"数据更新于 {format_age(info['age'])}"
+    if info["refreshing"]:
+        text += "，正在后台刷新"
+    elif info["last_error"]:
+        text += f"，后台刷新失败 ({info['last_error']})"
+    return text + "。"
@@ -0,0 +1,124 @@
+# trade_calendar.py
+# A股交易日历: 新浪交易日历 (ak.tool_trade_date_hist_sina，包含当年余下的交易日) 缓存在 data/trade_calendar.parquet。
+# - 判断上游此刻是否可能有新的日K线: 周末、节假日、当日K线收盘后已保存时都不需要再请求
+# - 生成精确的交易日坐标轴，按“N个交易日”计算回看起点
+# 日历每 REFRESH_DAYS 天或覆盖不到今天时重新获取；获取失败且本地没有日历时按周一至周五处理。
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+
+import akshare as ak
+import pandas as pd
+
+from resilient_fetch import resilient_call
+
+CALENDAR_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "trade_calendar.parquet")
+REFRESH_DAYS = 30
+RETRY_SECONDS = 3600 # 获取失败后至少间隔1小时再重试
+SESSION_OPEN = (9, 30)
+# 收盘后上游日K线定稿的时间，在此之后获取的当日K线视为完整
+BAR_FINAL_TIME = (15, 30)
+
+_calendar = None
+_last_attempt = 0.0
+_lock = threading.Lock()
+
+
+def fetch_trade_calendar():
+    """获取全部交易日，返回 (DatetimeIndex, 错误信息)。"""
+    try:
+        df = resilient_call(ak.tool_trade_date_hist_sina)
+        if df.empty or 'trade_date' not in df.columns:
+            return pd.DatetimeIndex([]), "交易日历为空或缺少 trade_date 列"
+        return pd.DatetimeIndex(pd.to_datetime(df['trade_date'])).normalize().unique().sort_values(), None
+    except Exception as e:
+        return pd.DatetimeIndex([]), f"获取交易日历失败: {e}"
+
+
+def _needs_refresh(calendar, saved_at):
+    today = pd.Timestamp(datetime.now().date())
+    return calendar is None or calendar[-1] < today or time.time() - saved_at > REFRESH_DAYS * 86400
+
+
+def _load():
+    """
+    返回交易日 DatetimeIndex，必要时从本地文件或上游加载。没有可用日历时返回 None。
+    上游请求在锁外进行 (只由抢到本次尝试的线程发出)，其它线程在此期间直接使用现有日历。
+    """
+    global _calendar, _last_attempt
+    with _lock:
+        if _calendar is not None and not _needs_refresh(*_calendar):
+            return _calendar[0]
+        if _calendar is None and os.path.exists(CALENDAR_PATH):
+            days = pd.DatetimeIndex(pd.read_parquet(CALENDAR_PATH)['trade_date'])
+            _calendar = (days, os.path.getmtime(CALENDAR_PATH))
+            if not _needs_refresh(*_calendar):
+                return days
+        current = _calendar[0] if _calendar else None
+        if time.time() - _last_attempt < RETRY_SECONDS:
+            return current
+        _last_attempt = time.time()
+
+    days, error = fetch_trade_calendar()
+    if error:
+        return current
+    os.makedirs(os.path.dirname(CALENDAR_PATH), exist_ok=True)
+    pd.DataFrame({'trade_date': days}).to_parquet(CALENDAR_PATH + ".tmp", index=False)
+    os.replace(CALENDAR_PATH + ".tmp", CALENDAR_PATH)
+    with _lock:
+        _calendar = (days, time.time())
+    return days
+
+
+def trading_days(start, end):
+    """[start, end] 之间的交易日 (DatetimeIndex)。"""
+    start, end = pd.Timestamp(start).normalize(), pd.Timestamp(end).normalize()
+    days = _load()
+    if days is None:
+        return pd.bdate_range(start, end)
+    selected = days[(days >= start) & (days <= end)]
+    if end > days[-1]:
+        # 超出日历覆盖范围 (如新年初日历尚未更新) 的部分按周一至周五处理
+        selected = selected.append(pd.bdate_range(max(start, days[-1] + timedelta(days=1)), end))
+    return selected
+
+
+def is_trading_day(day=None):
+    day = pd.Timestamp(day or datetime.now()).normalize()
+    return len(trading_days(day, day)) > 0
+
+
+def previous_trading_day(day=None):
+    """day 之前 (不含当天) 的最近一个交易日。"""
+    day = pd.Timestamp(day or datetime.now()).normalize()
+    return trading_days(day - timedelta(days=30), day - timedelta(days=1))[-1]
+
+
+def trading_days_ago(n, day=None):
+    """截至 day (含) 往前数第 n 个交易日，n=1 为 day 当天或之前最近的交易日。"""
+    day = pd.Timestamp(day or datetime.now()).normalize()
+    # 每年约 240 个交易日，n * 2 + 30 个自然日足以覆盖 n 个交易日 (含长假)
+    return trading_days(day - timedelta(days=n * 2 + 30), day)[-n]
+
+
+def latest_bar_date(now=None):
+    """此刻上游应有的最新日K线日期: 交易日开盘后为当天 (收盘前为未完成的K线)，否则为上一个交易日。"""
+    now = now or datetime.now()
+    if is_trading_day(now) and (now.hour, now.minute) >= SESSION_OPEN:
+        return pd.Timestamp(now.date())
+    return previous_trading_day(now)
+
+
+def bars_up_to_date(last_bar_date, fetched_at, now=None):
+    """
+    已保存的日K线是否已是最新且完整: 最新一根K线不早于 latest_bar_date()，并且是在该日收盘定稿之后获取的。
+    fetched_at 为获取时间 (时间戳)。
+    """
+    if last_bar_date is None or fetched_at is None:
+        return False
+    last_bar_date = pd.Timestamp(last_bar_date).normalize()
+    if last_bar_date < latest_bar_date(now):
+        return False
+    final_at = last_bar_date + timedelta(hours=BAR_FINAL_TIME[0], minutes=BAR_FINAL_TIME[1])
+    return datetime.fromtimestamp(fetched_at) >= final_at